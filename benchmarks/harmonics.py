@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the batched evaluation of the geomagnetic field over grids
+
+The point by point evaluation, `gull.Snapshot.field`, computes the Legendre
+functions and the trigonometric terms of the expansion for every point. The
+batched one, `gull.Snapshot.grid`, shares them between the nodes of a grid.
+
+Usage:
+    python3 benchmarks/harmonics.py [-n SIZE [SIZE ...]] [-a ALTITUDES]
+"""
+
+import argparse
+import time
+
+import numpy
+
+from grand_libs import gull
+
+
+def grid(size, altitudes):
+    """Get the nodes of a latitude x longitude x altitude grid"""
+    n = max(int(round(numpy.sqrt(size / altitudes))), 2)
+    latitude = numpy.linspace(-60, 60, n)
+    longitude = numpy.linspace(-180, 180, n)
+    altitude = numpy.linspace(0, 1E+04, altitudes)
+    return latitude, longitude, altitude
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-n", "--size", type=float, nargs="+",
+                        default=(1E+06, 1E+07),
+                        help="number of grid nodes, e.g. 1E+06 1E+08")
+    parser.add_argument("-a", "--altitudes", type=int, default=10,
+                        help="number of altitude nodes")
+    parser.add_argument("-m", "--model", default="IGRF12",
+                        help="geo-magnetic model")
+    args = parser.parse_args()
+
+    snapshot = gull.Snapshot(args.model)
+    print(f"gull.Snapshot ({args.model}, order {snapshot.order})")
+    print("      points    field (s)    grid (s)    speedup    max |dB| (T)")
+    for size in args.size:
+        latitude, longitude, altitude = grid(size, args.altitudes)
+        shape = (latitude.size, longitude.size, altitude.size, 3)
+        size = latitude.size * longitude.size * altitude.size
+
+        # Point by point evaluation, over the same nodes
+        lat, lon, alt = (a.ravel() for a in numpy.meshgrid(
+            latitude, longitude, altitude, indexing="ij"))
+        t0 = time.perf_counter()
+        ref = snapshot.field(lat, lon, alt).reshape(shape)
+        t1 = time.perf_counter()
+        del lat, lon, alt
+
+        # Batched evaluation
+        field = snapshot.grid(latitude, longitude, altitude)
+        t2 = time.perf_counter()
+
+        deviation = numpy.abs(field - ref).max()
+        print(f"  {size:10.2e}    {t1 - t0:9.3f}    {t2 - t1:8.3f}    "
+              f"{(t1 - t0) / (t2 - t1):7.1f}    {deviation:12.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the multithreaded scaling of vectorized library calls
+
+The vectorized TURTLE and GULL functions are called through ctypes with the
+GIL released. Splitting a large batch over a `ThreadPoolExecutor` should thus
+scale almost linearly with the number of cores.
+
+Usage:
+    python3 benchmarks/threads.py [-n SIZE] [-w WORKERS [WORKERS ...]]
+"""
+
+import argparse
+import concurrent.futures
+import os
+import time
+
+import numpy
+
+from grand_libs import gull, turtle
+
+
+def run(function, size, workers):
+    """Time a function applied over a batch split between threads
+
+    The function is called as `function(index, start, stop)` where `index` is
+    the worker index and `start:stop` the slice of the batch to process.
+    """
+    bounds = numpy.linspace(0, size, workers + 1).astype(int)
+    t0 = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        futures = [executor.submit(function, i, start, stop) for i, (start,
+                   stop) in enumerate(zip(bounds[:-1], bounds[1:]))]
+        for future in futures:
+            future.result()
+    return time.perf_counter() - t0
+
+
+def report(name, function, size, workers):
+    """Print the scaling of a function with the number of threads"""
+    print(f"{name} ({size:.0e} points)")
+    print("  workers    time (s)    speedup    efficiency")
+    reference = run(function, size, 1)
+    for n in workers:
+        dt = reference if n == 1 else run(function, size, n)
+        speedup = reference / dt
+        print(f"  {n:7d}    {dt:8.3f}    {speedup:7.2f}    "
+              f"{speedup / n:10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-n", "--size", type=float, default=1E+07,
+                        help="number of points per batch")
+    parser.add_argument("-w", "--workers", type=int, nargs="+",
+                        help="number of threads to test")
+    args = parser.parse_args()
+
+    size = int(args.size)
+    workers = args.workers
+    if workers is None:
+        cpus = os.cpu_count() or 1
+        workers = sorted({1, 2, 4, cpus} & set(range(1, cpus + 1)))
+
+    latitude = numpy.random.uniform(-60, 60, size)
+    longitude = numpy.random.uniform(-180, 180, size)
+    altitude = numpy.random.uniform(0, 1E+04, size)
+
+    def ecef(index, start, stop):
+        turtle.ecef_from_geodetic(latitude[start:stop], longitude[start:stop],
+                                  altitude[start:stop])
+
+    report("turtle.ecef_from_geodetic", ecef, size, workers)
+
+    snapshot = gull.Snapshot()
+
+    def field(index, start, stop):
+        snapshot(latitude[start:stop], longitude[start:stop],
+                 altitude[start:stop])
+
+    report("gull.Snapshot.__call__", field, size, workers)
+
+
+if __name__ == "__main__":
+    main()
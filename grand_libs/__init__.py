@@ -28,7 +28,7 @@ except ImportError:
 
 import os
 
-__all__ = ["LIBDIR", "DATADIR"]
+__all__ = ["LIBDIR", "DATADIR", "install"]
 
 
 # Initialise the package globals
@@ -42,3 +42,16 @@ LIBDIR = os.path.join(os.path.dirname(__file__), "lib")
 
 SRCDIR = os.path.join(os.path.dirname(__file__), "src")
 """Path to the source for C-extensions"""
+
+
+def install():
+    """Install the shared libraries and the ufunc extension
+
+    Libraries are otherwise installed on first use. This step is idempotent:
+    up to date libraries are left untouched.
+    """
+    from . import gull, turtle, ufunc
+
+    turtle.install()
+    gull.install()
+    ufunc.install()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Command line interface for managing the GRAND shared libraries
+
+Copyright (C) 2018 The GRAND collaboration
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+import argparse
+
+from . import install
+
+
+def main(args=None):
+    """Command line interface for the shared libraries"""
+    parser = argparse.ArgumentParser(prog="python -m grand_libs",
+        description="Manage the GRAND shared libraries")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("install",
+        help="install the shared libraries, if not up to date")
+    args = parser.parse_args(args)
+
+    if args.command == "install":
+        install()
+
+
+if __name__ == "__main__":
+    main()
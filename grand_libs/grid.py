@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+"""
+Raw topography grids, memory mapped from files
+
+Copyright (C) 2018 The GRAND collaboration
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+import json
+import os
+import re
+import struct
+
+import numpy
+
+__all__ = ["ALIGNMENT", "Grid", "MAGIC", "STORE_MAGIC", "Store", "load",
+           "pack", "save_store", "tile_index", "tile_name"]
+
+
+MAGIC = b"GRANDGRD"
+"""Magic bytes starting a raw grid file"""
+
+
+STORE_MAGIC = b"GRANDSTO"
+"""Magic bytes starting a tile store file"""
+
+
+ALIGNMENT = 64
+"""Alignment of the data in raw grid and store files, in bytes"""
+
+
+_DTYPES = ("<i2", ">i2", "<f4", ">f4")
+"""Data types supported by raw grids"""
+
+
+_TILE = re.compile(r"^([NS])(\d{2})([EW])(\d{3})")
+"""Pattern for the names of 1 deg x 1 deg tiles, e.g. N38E083"""
+
+
+class Grid:
+    """Regular grid of elevation data
+
+    Nodes are stored row by row, i.e. the last axis of the data runs along
+    x. The first and last nodes along each axis are located at the bounds of
+    the `x` and `y` ranges, which might be decreasing. Elevation values are
+    `offset + scale * data`. For integer data, the minimum value flags void
+    nodes. Coordinates are geodetic, x being the longitude, unless a map
+    projection is specified.
+    """
+
+    def __init__(self, data, x, y, scale=1, offset=0, projection=None):
+        """Wrap elevation data as a grid
+
+        Parameters
+        ----------
+        data : numpy.ndarray
+            The ny x nx elevation data, as int16 or float32 values
+        x : (float, float)
+            The x-coordinates of the first and last columns
+        y : (float, float)
+            The y-coordinates of the first and last rows
+        scale : float, optional
+            The scale factor applied to the data
+        offset : float, optional
+            The offset applied to the data
+        projection : str, optional
+            The name of the map projection, e.g. UTM 31N
+        """
+        if data.dtype.str not in _DTYPES:
+            raise ValueError(f"bad data type ({data.dtype})")
+        if (data.ndim != 2) or (min(data.shape) < 2):
+            raise ValueError("data must be a ny x nx array, with nx, ny > 1")
+        if not data.flags.c_contiguous:
+            data = numpy.ascontiguousarray(data)
+
+        self._data = data
+        self._x, self._y = tuple(map(float, x)), tuple(map(float, y))
+        self._scale, self._offset = float(scale), float(offset)
+        self._projection = projection
+
+
+    def save(self, path):
+        """Save the grid to a raw grid file
+
+        The file starts with the `MAGIC` bytes and a JSON header. The data
+        follow, aligned on `ALIGNMENT` bytes, such that they can be memory
+        mapped.
+
+        Parameters
+        ----------
+        path : str
+            The path of the file to write
+        """
+        ny, nx = self._data.shape
+        header = json.dumps({"dtype": self._data.dtype.str,
+            "shape": [ny, nx], "x": self._x, "y": self._y,
+            "scale": self._scale, "offset": self._offset,
+            "projection": self._projection}).encode()
+        size = len(MAGIC) + 4 + len(header)
+        header += b" " * (-size % ALIGNMENT)
+
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+            self._data.tofile(f)
+
+
+    @property
+    def data(self):
+        """The raw elevation data"""
+        return self._data
+
+
+    @property
+    def offset(self):
+        """The offset applied to the data"""
+        return self._offset
+
+
+    @property
+    def projection(self):
+        """The name of the map projection, or None for geodetic coordinates"""
+        return self._projection
+
+
+    @property
+    def scale(self):
+        """The scale factor applied to the data"""
+        return self._scale
+
+
+    @property
+    def x(self):
+        """The x-coordinates of the first and last columns"""
+        return self._x
+
+
+    @property
+    def y(self):
+        """The y-coordinates of the first and last rows"""
+        return self._y
+
+
+class Store:
+    """Indexed collection of grids, memory mapped from a single file"""
+
+    def __init__(self, path):
+        """Open a store file
+
+        Only the index is read. Grids are views of a single memory map of
+        the file.
+
+        Parameters
+        ----------
+        path : str
+            The path to the store file
+        """
+        with open(path, "rb") as f:
+            if f.read(len(STORE_MAGIC)) != STORE_MAGIC:
+                raise ValueError(f"bad store file ({path})")
+            size, = struct.unpack("<I", f.read(4))
+            self._entries = json.loads(f.read(size))["entries"]
+        self._start = len(STORE_MAGIC) + 4 + size
+        self._path = path
+
+        if self._entries:
+            self._data = numpy.memmap(path, numpy.uint8, "r")
+        else:
+            self._data = None
+
+
+    def __contains__(self, name):
+        return name in self._entries
+
+
+    def __iter__(self):
+        return iter(self._entries)
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def get(self, name):
+        """Get a grid from the store
+
+        Parameters
+        ----------
+        name : str
+            The name of the grid, e.g. N38E083 for a tile
+
+        Returns
+        -------
+        Grid
+            The memory mapped grid
+        """
+        entry = self._entries[name]
+        data = numpy.ndarray(entry["shape"], entry["dtype"], self._data,
+                             self._start + entry["position"])
+        return Grid(data, entry["x"], entry["y"], entry["scale"],
+                    entry["offset"], entry.get("projection"))
+
+
+    @property
+    def path(self):
+        """The path to the store file"""
+        return self._path
+
+
+def load(path):
+    """Memory map a grid from a data file
+
+    Raw grid files (.grid) and SRTM tiles (.hgt) are supported. The file is
+    not read. Its pages are loaded on demand and shared between processes.
+
+    Parameters
+    ----------
+    path : str
+        The path to the data file
+
+    Returns
+    -------
+    Grid
+        The memory mapped grid
+    """
+    extension = os.path.splitext(path)[1]
+    if extension == ".grid":
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"bad grid file ({path})")
+            size, = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(size))
+        data = numpy.memmap(path, header["dtype"], "r",
+                            offset=len(MAGIC) + 4 + size,
+                            shape=tuple(header["shape"]))
+        return Grid(data, header["x"], header["y"], header["scale"],
+                    header["offset"], header.get("projection"))
+    elif extension == ".hgt":
+        # SRTM tiles are squares of big endian int16, north row first
+        index = tile_index(os.path.basename(path))
+        if index is None:
+            raise ValueError(f"bad tile name ({path})")
+        latitude, longitude = index
+        size = os.path.getsize(path)
+        n = int(round(numpy.sqrt(size / 2)))
+        if 2 * n * n != size:
+            raise ValueError(f"bad tile size ({path})")
+        data = numpy.memmap(path, ">i2", "r", shape=(n, n))
+        return Grid(data, (longitude, longitude + 1),
+                    (latitude + 1, latitude))
+    else:
+        raise ValueError(f"bad extension ({extension})")
+
+
+def tile_index(name):
+    """Get the origin of a 1 deg x 1 deg tile from its name
+
+    Parameters
+    ----------
+    name : str
+        The tile name, e.g. N38E083.SRTMGL1.hgt
+
+    Returns
+    -------
+    (int, int) or None
+        The latitude and longitude of the south-west corner, in deg, or None
+        if the name does not match a tile
+    """
+    m = _TILE.match(name)
+    if m is None:
+        return None
+    latitude, longitude = int(m.group(2)), int(m.group(4))
+    if m.group(1) == "S":
+        latitude = -latitude
+    if m.group(3) == "W":
+        longitude = -longitude
+    return latitude, longitude
+
+
+def tile_name(latitude, longitude):
+    """Get the name of the 1 deg x 1 deg tile with the given origin
+
+    Parameters
+    ----------
+    latitude : int
+        The latitude of the south-west corner, in deg
+    longitude : int
+        The longitude of the south-west corner, in deg
+
+    Returns
+    -------
+    str
+        The tile name, e.g. N38E083
+    """
+    ns = "N" if latitude >= 0 else "S"
+    ew = "E" if longitude >= 0 else "W"
+    return f"{ns}{abs(latitude):02d}{ew}{abs(longitude):03d}"
+
+
+def pack(grid):
+    """Pack a grid as int16 data, with a scale and an offset
+
+    Integer data are kept as is. Floating point data are quantized over
+    their range, which is mapped to [-32766, 32766]. Non finite values are
+    flagged as void, with -32768.
+
+    Parameters
+    ----------
+    grid : Grid
+        The grid to pack
+
+    Returns
+    -------
+    Grid
+        The packed grid, with little endian int16 data
+    """
+    if grid.data.dtype.kind == "i":
+        return Grid(grid.data.astype("<i2"), grid.x, grid.y, grid.scale,
+                    grid.offset, grid.projection)
+
+    z = grid.offset + grid.scale * numpy.asarray(grid.data, float)
+    valid = numpy.isfinite(z)
+    if valid.any():
+        zmin, zmax = z[valid].min(), z[valid].max()
+    else:
+        zmin, zmax = 0, 0
+    offset = 0.5 * (zmin + zmax)
+    scale = (zmax - zmin) / 65532 if zmax > zmin else 1
+
+    data = numpy.full(z.shape, numpy.iinfo(numpy.int16).min, "<i2")
+    data[valid] = numpy.round((z[valid] - offset) / scale)
+    return Grid(data, grid.x, grid.y, scale, offset, grid.projection)
+
+
+def save_store(path, grids):
+    """Save a collection of grids to a store file
+
+    The file starts with the `STORE_MAGIC` bytes and a JSON index. The data
+    of each grid follow, aligned on `ALIGNMENT` bytes.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file to write
+    grids : dict
+        The grids to store, indexed by name
+    """
+    entries, position = {}, 0
+    for name, grid in grids.items():
+        entries[name] = {"dtype": grid.data.dtype.str,
+            "shape": list(grid.data.shape), "x": grid.x, "y": grid.y,
+            "scale": grid.scale, "offset": grid.offset,
+            "projection": grid.projection, "position": position}
+        position += grid.data.nbytes
+        position += -position % ALIGNMENT
+
+    header = json.dumps({"entries": entries}).encode()
+    size = len(STORE_MAGIC) + 4 + len(header)
+    header += b" " * (-size % ALIGNMENT)
+
+    with open(path, "wb") as f:
+        f.write(STORE_MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        for grid in grids.values():
+            grid.data.tofile(f)
+            f.write(b"\0" * (-grid.data.nbytes % ALIGNMENT))
@@ -18,19 +18,24 @@ You should have received a copy of the GNU Lesser General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>
 """
 
+import collections
 import ctypes
 import datetime
+import json
 import os
 import shutil
+import struct
 import subprocess
+import threading
 
 import numpy
 
-from . import DATADIR, LIBDIR, SRCDIR
-from .tools import Meta, Temporary, define
+from . import DATADIR, LIBDIR, SRCDIR, grid, ufunc
+from .tools import Cache, Library, Meta, Pool, Temporary, checksum, define, \
+                   output, shard
 
-__all__ = ["LIBNAME", "LIBPATH", "LIBHASH", "LibraryError", "Snapshot",
-           "strerror"]
+__all__ = ["FIELD_MAGIC", "FieldGrid", "LIBNAME", "LIBPATH", "LIBHASH",
+           "LibraryError", "Model", "Snapshot", "install", "strerror"]
 
 
 LIBNAME = "libgull.so"
@@ -45,12 +50,25 @@ LIBHASH = "91ed20fc52c35a8ae9d32416dd7d0249100aad6f"
 """The git hash of the library"""
 
 
-def _install():
-    """Install the GULL library to the top package location"""
+FIELD_MAGIC = b"GRANDFLD"
+"""Magic bytes starting a field grid file"""
+
+TABLES_SIZE = 8
+"""The maximum number of field tables cached by a snapshot"""
+
+
+def install():
+    """Install the GULL library to the top package location
+
+    The library is only rebuilt if its version, or the source of its
+    extensions, changed. It is otherwise installed on first use.
+    """
 
     # Check for an existing install
     meta = Meta("gull")
-    if meta["LIBHASH"] == LIBHASH:
+    source = os.path.join(SRCDIR, "gull.c")
+    srchash = checksum((source,))
+    if (meta["LIBHASH"] == LIBHASH) and (meta["SRCHASH"] == srchash):
         return
 
     def system(command):
@@ -60,7 +78,7 @@ def _install():
     with Temporary("https://github.com/niess/gull", LIBHASH) as _:
         # Extend the source with vectorization
         target = f"src/gull.c"
-        system(f"cat {target} {SRCDIR}/gull.c > tmp.c")
+        system(f"cat {target} {source} > tmp.c")
         system(f"mv tmp.c {target}")
 
         # Build the library
@@ -83,13 +101,10 @@ def _install():
 
     # Dump the meta data
     meta["LIBHASH"] = LIBHASH
+    meta["SRCHASH"] = srchash
     meta.update()
 
 
-# Install the library on import, if needed
-_install()
-
-
 def strerror(code):
     """Convert a GULL library return code to a string
 
@@ -126,8 +141,8 @@ class LibraryError(RuntimeError):
         super().__init__(message)
 
 
-_lib = ctypes.cdll.LoadLibrary(LIBPATH)
-"""Proxy for the GULL library"""
+_lib = Library(LIBPATH, install)
+"""Proxy for the GULL library, installed and loaded on first use"""
 
 
 @define (_lib.gull_snapshot_create,
@@ -163,6 +178,18 @@ def _snapshot_field(snapshot, latitude, longitude, altitude, field, size,
     pass
 
 
+@define (_lib.gull_snapshot_field,
+         arguments = (ctypes.c_void_p, ctypes.c_double, ctypes.c_double,
+                      ctypes.c_double, ctypes.POINTER(ctypes.c_double),
+                      ctypes.POINTER(ctypes.c_void_p)),
+         result = ctypes.c_int,
+         exception = LibraryError)
+def _snapshot_field_s(snapshot, latitude, longitude, altitude, field,
+                      workspace):
+    """Get the magnetic field at a single point from a snapshot"""
+    pass
+
+
 @define (_lib.gull_snapshot_info,
          arguments=(ctypes.c_void_p, ctypes.POINTER(ctypes.c_int),
                     ctypes.POINTER(ctypes.c_double),
@@ -172,6 +199,128 @@ def _snapshot_info(snapshot):
     pass
 
 
+class _Harmonics(ctypes.Structure):
+    """C descriptor of the Gauss coefficients of a snapshot"""
+    _fields_ = (("order", ctypes.c_int), ("g", ctypes.c_void_p),
+                ("h", ctypes.c_void_p), ("altitude_min", ctypes.c_double),
+                ("altitude_max", ctypes.c_double))
+
+@define (_lib.gull_harmonics_grid,
+         arguments = (ctypes.POINTER(_Harmonics), numpy.ctypeslib.c_intp,
+                      _CST_DBL_P, numpy.ctypeslib.c_intp, _CST_DBL_P,
+                      numpy.ctypeslib.c_intp, _CST_DBL_P, _DBL_P),
+         result = ctypes.c_int,
+         exception = LibraryError)
+def _harmonics_grid(harmonics, n_latitude, latitude, n_longitude, longitude,
+                    n_altitude, altitude, field):
+    """Get the magnetic field over a grid from the Gauss coefficients"""
+    pass
+
+
+@define (_lib.gull_harmonics_field_v,
+         arguments = (ctypes.POINTER(_Harmonics), _CST_DBL_P, _CST_DBL_P,
+                      _CST_DBL_P, _DBL_P, numpy.ctypeslib.c_intp),
+         result = ctypes.c_int,
+         exception = LibraryError)
+def _harmonics_field(harmonics, latitude, longitude, altitude, field, size):
+    """Get the magnetic field at a sequence of points from the Gauss
+    coefficients"""
+    pass
+
+
+class _Table(ctypes.Structure):
+    """C descriptor of a field grid"""
+    _fields_ = (("data", ctypes.c_void_p), ("n", ctypes.c_int * 3),
+                ("x0", ctypes.c_double * 3), ("dx", ctypes.c_double * 3))
+
+@define (_lib.gull_table_field_v,
+         arguments = (ctypes.POINTER(_Table), _CST_DBL_P, _CST_DBL_P,
+                      _CST_DBL_P, _DBL_P, numpy.ctypeslib.c_intp))
+def _table_field(table, latitude, longitude, altitude, field, size):
+    """Interpolate the magnetic field from a field grid"""
+    pass
+
+
+@define (_lib.gull_table_field,
+         arguments = (ctypes.POINTER(_Table), ctypes.c_double,
+                      ctypes.c_double, ctypes.c_double,
+                      ctypes.POINTER(ctypes.c_double)))
+def _table_field_s(table, latitude, longitude, altitude, field):
+    """Interpolate the magnetic field at a single point from a field grid"""
+    pass
+
+
+_ufunc = ufunc.Binding(_lib, ("gull_snapshot_field", "gull_snapshot_destroy"))
+"""Compiled ufuncs for the GULL library, false if not available"""
+
+
+def _read_coefficients(path):
+    """Read the Gauss coefficients of a model from a COF file
+
+    The WMM format, with a single epoch, and the geomag70 format, with a
+    sequence of epochs, are supported. The order of the model is returned
+    with its epochs, and with the coefficients per epoch: g, h and their
+    secular variations, indexed by n * (n + 1) / 2 + m.
+    """
+    epochs, blocks, order = [], [], 0
+    with open(path) as f:
+        for line in f:
+            tokens = line.split()
+            if (not tokens) or tokens[0].startswith("9999"):
+                continue
+            elif tokens[0][0].isalpha():
+                # geomag70 header, e.g. IGRF2015 2015.00 13 8 0 ...
+                epochs.append(float(tokens[1]))
+                blocks.append([])
+            elif "." in tokens[0]:
+                # WMM header, e.g. 2015.0 WMM-2015 12/15/2014
+                epochs.append(float(tokens[0]))
+                blocks.append([])
+            elif blocks:
+                n, m = int(tokens[0]), int(tokens[1])
+                blocks[-1].append((n, m, tuple(map(float, tokens[2:6]))))
+                order = max(order, n)
+    if order == 0:
+        raise ValueError(f"bad coefficient file ({path})")
+
+    coefficients = numpy.zeros((len(epochs), 4, _harmonics_size(order)))
+    for block, c in zip(blocks, coefficients):
+        for n, m, values in block:
+            c[:, n * (n + 1) // 2 + m] = values
+    return order, numpy.array(epochs), coefficients
+
+
+def _harmonics_size(order):
+    """Get the number of Gauss coefficients up to a given order"""
+    return (order + 1) * (order + 2) // 2
+
+
+def _interpolate_coefficients(epochs, coefficients, date):
+    """Get the g and h coefficients at a given date
+
+    Coefficients are linearly interpolated between epochs. After the last
+    epoch, they are extrapolated with their secular variation. Before the
+    first epoch, they are extrapolated linearly from the first two epochs, as
+    done by GULL.
+    """
+    start = datetime.date(date.year, 1, 1)
+    days = (datetime.date(date.year + 1, 1, 1) - start).days
+    year = date.year + (date - start).days / days
+
+    i = max(numpy.searchsorted(epochs, year, side="right") - 1, 0)
+    if i == epochs.size - 1:
+        c = coefficients[i]
+        return c[:2] + (year - epochs[i]) * c[2:]
+    else:
+        w = (year - epochs[i]) / (epochs[i + 1] - epochs[i])
+        return (1 - w) * coefficients[i, :2] + w * coefficients[i + 1, :2]
+
+
+def _delete_workspace(workspace):
+    """Release the memory of a snapshot workspace"""
+    _snapshot_destroy(ctypes.byref(workspace))
+
+
 class Snapshot:
     """Proxy for a GULL snapshot object"""
 
@@ -192,8 +341,10 @@ class Snapshot:
             valid
         """
         self._snapshot, self._model, self._date = None, None, None
-        self._workspace = ctypes.c_void_p(0)
+        self._workspaces = Pool(lambda: ctypes.c_void_p(0), _delete_workspace)
         self._order, self._altitude = None, None
+        self._tables = collections.OrderedDict()
+        self._coefficients = None
 
         # Create the snapshot object
         snapshot = ctypes.c_void_p(None)
@@ -203,13 +354,13 @@ class Snapshot:
             d = date
         day, month, year = map(ctypes.c_int, (d.day, d.month, d.year))
 
-        path = f"{DATADIR}/gull/{model}.COF".encode("ascii")
+        path = f"{DATADIR}/gull/{model}.COF"
         line = ctypes.c_int()
 
-        if (_snapshot_create(ctypes.byref(snapshot), path, day, month, year,
-                             ctypes.byref(line)) != 0):
+        if (_snapshot_create(ctypes.byref(snapshot), path.encode("ascii"),
+                             day, month, year, ctypes.byref(line)) != 0):
             return
-        self._snapshot = snapshot
+        self._snapshot, self._path = snapshot, path
         self._model, self._date = model, d
 
         # Get the meta-data
@@ -230,12 +381,86 @@ class Snapshot:
             return
 
         _snapshot_destroy(ctypes.byref(self._snapshot))
-        _snapshot_destroy(ctypes.byref(self._workspace))
+        self._workspaces.clear()
         self._snapshot = None
 
 
-    def __call__(self, latitude, longitude, altitude=None):
+    def __call__(self, latitude, longitude, altitude=None, out=None):
         """Get the magnetic field at a given Earth location"""
+        return self.field(latitude, longitude, altitude, out=out)
+
+
+    @staticmethod
+    def get(model="IGRF12", date="2019-01-01"):
+        """Get a shared snapshot from the process wide cache
+
+        Snapshots are cached by model and date, such that the model data
+        are parsed only once. A cached snapshot is shared as long as it is
+        referenced, and the most recent ones are kept alive by the cache.
+
+        Parameters
+        ----------
+        model : str
+            The geo-magnetic model to use (IGRF12, or WMM2015)
+        date : str or datetime.date
+            The day at which the snapshot is taken
+
+        Returns
+        -------
+        Snapshot
+            The shared snapshot
+        """
+        if isinstance(date, str):
+            date = datetime.date.fromisoformat(date)
+        return _snapshots.get(model, date)
+
+
+    @staticmethod
+    def clear():
+        """Release the snapshots held by the process wide cache"""
+        _snapshots.clear()
+
+
+    def field(self, latitude, longitude, altitude=None, workers=None,
+              out=None):
+        """Get the magnetic field at a given Earth location
+
+        Parameters
+        ----------
+        latitude : float or array_like
+            The geodetic latitude(s), in deg
+        longitude : float or array_like
+            The geodetic longitude(s), in deg
+        altitude : float or array_like, optional
+            The altitude(s) above the ellipsoid, in m. Defaults to zero
+        workers : int, optional
+            The number of threads over which the computation is split
+        out : numpy.ndarray, optional
+            A buffer of floats where to store the result
+
+        Returns
+        -------
+        numpy.ndarray
+            The magnetic field components (East, North, Upward), in T
+        """
+        scalar = (float, int)
+        if (out is None) and isinstance(latitude, scalar) and \
+           isinstance(longitude, scalar) and \
+           ((altitude is None) or isinstance(altitude, scalar)):
+            field = (ctypes.c_double * 3)()
+            workspace = self._workspaces.acquire()
+            try:
+                _snapshot_field_s(self._snapshot, latitude, longitude,
+                                  0 if altitude is None else altitude, field,
+                                  ctypes.byref(workspace))
+            finally:
+                self._workspaces.release(workspace)
+            return numpy.frombuffer(field)
+
+        if _ufunc:
+            return self._field_ufunc(latitude, longitude, altitude, workers,
+                                     out)
+
         def regularize(a):
             a = numpy.asanyarray(a)
             return numpy.require(a, float, ["CONTIGUOUS", "ALIGNED"])
@@ -252,16 +477,195 @@ class Snapshot:
                 raise ValueError(
                     "latitude and altitude must have the same size")
 
-        if latitude.size == 1:
-            field = numpy.zeros(3)
+        n = latitude.size
+        if n == 1:
+            field = output(out, 3, _DBL_P)
         else:
-            field = numpy.zeros((latitude.size, 3))
+            field = output(out, (n, 3), _DBL_P)
 
-        if _snapshot_field(self._snapshot, latitude, longitude, altitude,
-                           field, latitude.size, ctypes.byref(self._workspace)):
-            return
+        # Each concurrent evaluation leases its own workspace
+        latitude, longitude, altitude = map(numpy.ravel,
+                                            (latitude, longitude, altitude))
+        values = field.reshape(-1, 3)
+
+        def evaluate(s):
+            with self._workspaces.lease() as workspace:
+                _snapshot_field(self._snapshot, latitude[s], longitude[s],
+                                altitude[s], values[s], s.stop - s.start,
+                                ctypes.byref(workspace))
+
+        shard(evaluate, n, workers)
+        return field
+
+
+    def _field_ufunc(self, latitude, longitude, altitude, workers, out):
+        """Get the magnetic field using the compiled ufuncs"""
+        if altitude is None:
+            altitude = 0
+        latitude, longitude, altitude = numpy.broadcast_arrays(
+            latitude, longitude, altitude)
+        field = numpy.empty(latitude.shape + (3,)) if out is None else out
+
+        # Each ufunc loop allocates its own workspace. Concurrent evaluations
+        # are split along the first axis
+        handle = numpy.uintp(self._snapshot.value)
+
+        def evaluate(s):
+            _ufunc.snapshot_field(handle, latitude[s], longitude[s],
+                                  altitude[s], out=field[s])
+
+        if latitude.ndim == 0:
+            evaluate(Ellipsis)
         else:
-            return field
+            shard(evaluate, latitude.shape[0], workers)
+
+        # Failed evaluations are flagged with NaN. Reproduce the first one
+        # in order to raise the library error
+        failed = numpy.isnan(field).any(axis=-1)
+        if failed.any():
+            index = numpy.unravel_index(numpy.argmax(failed), failed.shape)
+            workspace = ctypes.c_void_p(0)
+            try:
+                _snapshot_field_s(self._snapshot, latitude[index],
+                                  longitude[index], altitude[index],
+                                  (ctypes.c_double * 3)(),
+                                  ctypes.byref(workspace))
+            finally:
+                _delete_workspace(workspace)
+
+        if (out is None) and (field.size == 3):
+            return field.reshape(3)
+        return field
+
+
+    def grid(self, latitude, longitude, altitude=None, workers=None,
+             out=None):
+        """Get the magnetic field over a grid of Earth locations
+
+        The spherical harmonics expansion is evaluated in batch from the
+        Gauss coefficients of the model. Legendre functions are shared by
+        the nodes of a same latitude and altitude, and trigonometric terms
+        by the nodes of a same longitude. This is much faster than `field`
+        for dense grids.
+
+        Parameters
+        ----------
+        latitude : float or array_like
+            The geodetic latitude(s) of the nodes, in deg
+        longitude : float or array_like
+            The geodetic longitude(s) of the nodes, in deg
+        altitude : float or array_like, optional
+            The altitude(s) of the nodes above the ellipsoid, in m. Defaults
+            to zero
+        workers : int, optional
+            The number of threads over which the computation is split
+        out : numpy.ndarray, optional
+            A buffer of floats where to store the result
+
+        Returns
+        -------
+        numpy.ndarray
+            The magnetic field components (East, North, Upward), in T, as a
+            latitude x longitude x altitude x 3 array
+        """
+        def regularize(a):
+            a = numpy.atleast_1d(numpy.asanyarray(a)).ravel()
+            return numpy.require(a, float, ["CONTIGUOUS", "ALIGNED"])
+
+        if altitude is None:
+            altitude = 0.
+        latitude, longitude, altitude = map(regularize,
+                                            (latitude, longitude, altitude))
+        shape = (latitude.size, longitude.size, altitude.size, 3)
+        field = output(out, shape, _DBL_P)
+        values = field.reshape(shape)
+
+        harmonics = self._harmonics()
+
+        def evaluate(s):
+            _harmonics_grid(ctypes.byref(harmonics), s.stop - s.start,
+                            latitude[s], longitude.size, longitude,
+                            altitude.size, altitude, values[s])
+
+        shard(evaluate, latitude.size, workers)
+        return field
+
+
+    def _harmonics(self):
+        """Get the C descriptor of the Gauss coefficients of the snapshot"""
+        if self._coefficients is None:
+            order, epochs, coefficients = _read_coefficients(self._path)
+            gh = _interpolate_coefficients(epochs, coefficients, self._date)
+            self._coefficients = (gh, _Harmonics(order, gh[0].ctypes.data,
+                gh[1].ctypes.data, *self._altitude))
+        return self._coefficients[1]
+
+
+    def tabulate(self, bbox, resolution, path=None, workers=None):
+        """Tabulate the magnetic field over a geodetic region
+
+        The field is computed once at the nodes of a regular grid. Lookups
+        are then trilinear interpolations over this grid. Tables are cached
+        by the snapshot, such that a same region is only computed once. Up to
+        `TABLES_SIZE` tables are kept, the least recently used being dropped
+        first.
+
+        Parameters
+        ----------
+        bbox : ((float, float), (float, float), (float, float))
+            The latitude and longitude ranges, in deg, and the altitude
+            range, in m, of the region
+        resolution : (float, float, float)
+            The spacing of the nodes along latitude and longitude, in deg,
+            and along altitude, in m
+        path : str, optional
+            The path of a field grid file. If the file exists and matches the
+            snapshot and the region, it is memory mapped. Otherwise, the table
+            is computed and saved to it
+        workers : int, optional
+            The number of threads over which the computation is split
+
+        Returns
+        -------
+        FieldGrid
+            The tabulated field
+        """
+        bbox = tuple(tuple(map(float, bounds)) for bounds in bbox)
+        resolution = tuple(map(float, resolution))
+        key = (bbox, resolution)
+        cached = self._tables.get(key, None)
+        if (cached is not None) and ((path is None) or
+           ((cached.path is not None) and
+            (os.path.abspath(cached.path) == os.path.abspath(path)))):
+            self._tables.move_to_end(key)
+            return cached
+
+        table = None
+        if (path is not None) and os.path.exists(path):
+            table = FieldGrid(path)
+            nodes = tuple(_nodes(bounds, step).size
+                          for bounds, step in zip(bbox, resolution))
+            if (table.model != self._model) or (table.date != self._date) \
+               or ((table.latitude, table.longitude, table.altitude) !=
+                   bbox) or (table.data.shape[:3] != nodes):
+                table = None
+
+        if table is None:
+            if cached is None:
+                table = FieldGrid(self, bbox, resolution, workers)
+            else:
+                table = cached
+            if path is not None:
+                # Replace the file, such that existing maps remain valid
+                table.save(path + ".tmp")
+                os.replace(path + ".tmp", path)
+                table = FieldGrid(path)
+
+        self._tables[key] = table
+        self._tables.move_to_end(key)
+        while len(self._tables) > TABLES_SIZE:
+            self._tables.popitem(last=False)
+        return table
 
 
     @property
@@ -286,3 +690,431 @@ class Snapshot:
     def order(self):
         """The approximation order of the model"""
         return self._order
+
+
+_snapshots = Cache(Snapshot)
+"""Process wide cache of snapshots, keyed by model and date"""
+
+
+class Model:
+    """Geo-magnetic model evaluated at arbitrary dates
+
+    The coefficient file of the model is parsed once. Coefficients are then
+    interpolated, or extrapolated with their secular variation, at the
+    requested dates. The coefficient sets of the latest dates are cached.
+    """
+
+    def __init__(self, model="IGRF12", cache_size=128):
+        """Load a geo-magnetic model
+
+        Parameters
+        ----------
+        model : str
+            The geo-magnetic model to use (IGRF12, or WMM2015)
+        cache_size : int, optional
+            The maximum number of per date coefficient sets kept in memory
+
+        Raises
+        ------
+        LibraryError
+            A GULL library error occured, e.g. if the model is not valid
+        """
+        self._model, self._cache_size = model, cache_size
+        self._cache, self._lock = collections.OrderedDict(), threading.Lock()
+
+        path = f"{DATADIR}/gull/{model}.COF"
+        if not os.path.exists(path):
+            # RETURN_PATH_ERROR, as for snapshots
+            raise LibraryError(5)
+        order, epochs, coefficients = _read_coefficients(path)
+        self._epochs, self._coefficients = epochs, coefficients
+
+        # Get the validity range from the library
+        snapshot = Snapshot(model, datetime.date(int(epochs[0]), 1, 1))
+        self._order = min(order, snapshot.order)
+        self._altitude = snapshot.altitude
+
+
+    def __call__(self, date, latitude, longitude, altitude=None, out=None):
+        """Get the magnetic field at a given date and Earth location"""
+        return self.field(date, latitude, longitude, altitude, out=out)
+
+
+    def field(self, date, latitude, longitude, altitude=None, workers=None,
+              out=None):
+        """Get the magnetic field at a given date and Earth location
+
+        Parameters
+        ----------
+        date : str or datetime.date or array_like
+            The day(s) at which the field is evaluated
+        latitude : float or array_like
+            The geodetic latitude(s), in deg
+        longitude : float or array_like
+            The geodetic longitude(s), in deg
+        altitude : float or array_like, optional
+            The altitude(s) above the ellipsoid, in m. Defaults to zero
+        workers : int, optional
+            The number of threads over which the computation is split
+        out : numpy.ndarray, optional
+            A buffer of floats where to store the result
+
+        Returns
+        -------
+        numpy.ndarray
+            The magnetic field components (East, North, Upward), in T
+        """
+        if altitude is None:
+            altitude = 0.
+        date = numpy.asarray(date, "datetime64[D]")
+        date, latitude, longitude, altitude = numpy.broadcast_arrays(
+            date, latitude, longitude, altitude)
+        shape = latitude.shape
+        field = output(out, shape + (3,), _DBL_P)
+
+        # Group the points by date
+        dates, inverse = numpy.unique(date.ravel(), return_inverse=True)
+        coefficients = [self._harmonics(d.item()) for d in dates]
+        if dates.size > 1:
+            order = numpy.argsort(inverse, kind="stable")
+            stops = numpy.cumsum(numpy.bincount(inverse))
+        else:
+            order, stops = None, numpy.array((inverse.size,))
+
+        def regularize(a):
+            a = numpy.ravel(a) if order is None else numpy.ravel(a)[order]
+            return numpy.require(a, float, ["CONTIGUOUS", "ALIGNED"])
+
+        latitude, longitude, altitude = map(regularize,
+                                            (latitude, longitude, altitude))
+        if order is None:
+            values = field.reshape(-1, 3)
+        else:
+            values = numpy.empty((latitude.size, 3))
+
+        def evaluate(s):
+            k = numpy.searchsorted(stops, s.start, side="right")
+            start = s.start
+            while start < s.stop:
+                stop = min(s.stop, stops[k])
+                _harmonics_field(ctypes.byref(coefficients[k][1]),
+                                 latitude[start:stop], longitude[start:stop],
+                                 altitude[start:stop], values[start:stop],
+                                 stop - start)
+                start, k = stop, k + 1
+
+        shard(evaluate, latitude.size, workers)
+        if order is not None:
+            field.reshape(-1, 3)[order] = values
+
+        if (out is None) and (field.size == 3):
+            return field.reshape(3)
+        return field
+
+
+    def coefficients(self, date):
+        """Get the Gauss coefficients at a given date
+
+        Parameters
+        ----------
+        date : str or datetime.date
+            The day at which the coefficients are evaluated
+
+        Returns
+        -------
+        (numpy.ndarray, numpy.ndarray)
+            The g and h coefficients, in nT, indexed by n * (n + 1) / 2 + m
+        """
+        if isinstance(date, str):
+            date = datetime.date.fromisoformat(date)
+        g, h = self._harmonics(date)[0]
+        return g.copy(), h.copy()
+
+
+    def _harmonics(self, date):
+        """Get the coefficients at a given date, and their C descriptor"""
+        with self._lock:
+            try:
+                self._cache.move_to_end(date)
+                return self._cache[date]
+            except KeyError:
+                pass
+
+        gh = _interpolate_coefficients(self._epochs, self._coefficients, date)
+        entry = (gh, _Harmonics(self._order, gh[0].ctypes.data,
+                                gh[1].ctypes.data, *self._altitude))
+        with self._lock:
+            self._cache[date] = entry
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return entry
+
+
+    @property
+    def altitude(self):
+        """The altitude range of the model"""
+        return self._altitude
+
+
+    @property
+    def cache_size(self):
+        """The maximum number of per date coefficient sets kept in memory"""
+        return self._cache_size
+
+
+    @property
+    def epochs(self):
+        """The epochs of the model coefficients, in decimal years"""
+        return tuple(map(float, self._epochs))
+
+
+    @property
+    def model(self):
+        """The world magnetic model"""
+        return self._model
+
+
+    @property
+    def order(self):
+        """The approximation order of the model"""
+        return self._order
+
+
+def _nodes(bounds, step):
+    """Get the nodes of a regular grid along one axis"""
+    n = int(round(abs(bounds[1] - bounds[0]) / step)) + 1
+    return numpy.linspace(bounds[0], bounds[1], max(n, 2))
+
+
+class FieldGrid:
+    """Magnetic field tabulated over a regular geodetic grid
+
+    The field components are stored at the nodes of a latitude, longitude
+    and altitude grid, the altitude running fastest. Lookups are trilinear
+    interpolations over this grid. The interpolation error is estimated at
+    the centers of the grid cells, where it is the largest for a smooth
+    field.
+    """
+
+    def __init__(self, source, bbox=None, resolution=None, workers=None):
+        """Tabulate the field of a snapshot, or load it from a file
+
+        Parameters
+        ----------
+        source : Snapshot or str
+            The snapshot to tabulate, or the path to a field grid file
+            written by `FieldGrid.save`, which is memory mapped
+        bbox : ((float, float), (float, float), (float, float)), optional
+            The latitude and longitude ranges, in deg, and the altitude
+            range, in m, of the region
+        resolution : (float, float, float), optional
+            The spacing of the nodes along latitude and longitude, in deg,
+            and along altitude, in m
+        workers : int, optional
+            The number of threads over which the computation is split
+        """
+        if isinstance(source, str):
+            with open(source, "rb") as f:
+                if f.read(len(FIELD_MAGIC)) != FIELD_MAGIC:
+                    raise ValueError(f"bad field grid file ({source})")
+                size, = struct.unpack("<I", f.read(4))
+                header = json.loads(f.read(size))
+            data = numpy.memmap(source, "<f8", "r",
+                                offset=len(FIELD_MAGIC) + 4 + size,
+                                shape=tuple(header["shape"]) + (3,))
+            self._set(data, header["latitude"], header["longitude"],
+                      header["altitude"], header["model"],
+                      datetime.date.fromisoformat(header["date"]),
+                      header["error"], header["relative_error"])
+            self._path = source
+            return
+
+        if (bbox is None) or (resolution is None):
+            raise ValueError("bbox and resolution are required")
+
+        latitude, longitude, altitude = (tuple(map(float, bounds))
+                                         for bounds in bbox)
+        lat, lon, alt = (_nodes(bounds, step) for bounds, step in
+                         zip((latitude, longitude, altitude), resolution))
+        if (lat[0] == lat[-1]) or (lon[0] == lon[-1]) or (alt[0] == alt[-1]):
+            raise ValueError("bbox ranges must not be empty")
+
+        data = source.grid(lat, lon, alt, workers=workers)
+        self._set(data, latitude, longitude, altitude, source.model,
+                  source.date, 0., 0.)
+        self._path = None
+
+        # Estimate the interpolation error at the cell centers, using at
+        # most 20 cells per axis
+        def centers(nodes):
+            step = max((nodes.size - 1) // 20, 1)
+            return 0.5 * (nodes[:-1:step] + nodes[1::step])
+
+        points = [a.ravel() for a in numpy.meshgrid(
+            centers(lat), centers(lon), centers(alt), indexing="ij")]
+        exact = source.field(*points, workers=workers).reshape(-1, 3)
+        deviation = numpy.linalg.norm(
+            self.field(*points, workers=workers).reshape(-1, 3) - exact,
+            axis=-1)
+        self._error = float(deviation.max())
+        self._relative_error = float(
+            (deviation / numpy.linalg.norm(exact, axis=-1)).max())
+
+
+    def _set(self, data, latitude, longitude, altitude, model, date, error,
+             relative_error):
+        """Set the table data and its C descriptor"""
+        self._data = data
+        self._latitude, self._longitude, self._altitude = (
+            tuple(map(float, bounds))
+            for bounds in (latitude, longitude, altitude))
+        self._model, self._date = model, date
+        self._error, self._relative_error = error, relative_error
+
+        bounds = (self._latitude, self._longitude, self._altitude)
+        n = data.shape[:3]
+        self._table = _Table(data.ctypes.data, (ctypes.c_int * 3)(*n),
+            (ctypes.c_double * 3)(*(b[0] for b in bounds)),
+            (ctypes.c_double * 3)(*((b[1] - b[0]) / (m - 1)
+                                    for b, m in zip(bounds, n))))
+
+
+    def __call__(self, latitude, longitude, altitude=None, out=None):
+        """Get the magnetic field at a given Earth location"""
+        return self.field(latitude, longitude, altitude, out=out)
+
+
+    def field(self, latitude, longitude, altitude=None, workers=None,
+              out=None):
+        """Interpolate the magnetic field at a given Earth location
+
+        Parameters
+        ----------
+        latitude : float or array_like
+            The geodetic latitude(s), in deg
+        longitude : float or array_like
+            The geodetic longitude(s), in deg
+        altitude : float or array_like, optional
+            The altitude(s) above the ellipsoid, in m. Defaults to zero
+        workers : int, optional
+            The number of threads over which the computation is split
+        out : numpy.ndarray, optional
+            A buffer of floats where to store the result
+
+        Returns
+        -------
+        numpy.ndarray
+            The magnetic field components (East, North, Upward), in T, or NaN
+            outside of the grid
+        """
+        if altitude is None:
+            altitude = 0.
+        scalar = (float, int)
+        if (out is None) and isinstance(latitude, scalar) and \
+           isinstance(longitude, scalar) and isinstance(altitude, scalar):
+            field = (ctypes.c_double * 3)()
+            _table_field_s(ctypes.byref(self._table), latitude, longitude,
+                           altitude, field)
+            return numpy.frombuffer(field)
+
+        latitude, longitude, altitude = numpy.broadcast_arrays(
+            latitude, longitude, altitude)
+        shape = latitude.shape
+        latitude, longitude, altitude = (
+            numpy.require(numpy.ravel(a), float, ["CONTIGUOUS", "ALIGNED"])
+            for a in (latitude, longitude, altitude))
+
+        n = latitude.size
+        field = output(out, shape + (3,), _DBL_P)
+        values = field.reshape(-1, 3)
+
+        def evaluate(s):
+            _table_field(ctypes.byref(self._table), latitude[s],
+                         longitude[s], altitude[s], values[s],
+                         s.stop - s.start)
+
+        shard(evaluate, n, workers)
+        if (out is None) and (n == 1):
+            return field.reshape(3)
+        return field
+
+
+    def save(self, path):
+        """Save the field grid to a file
+
+        The file starts with the `FIELD_MAGIC` bytes and a JSON header. The
+        data follow, aligned on `grid.ALIGNMENT` bytes, such that they can be
+        memory mapped.
+
+        Parameters
+        ----------
+        path : str
+            The path of the file to write
+        """
+        header = json.dumps({"shape": list(self._data.shape[:3]),
+            "latitude": self._latitude, "longitude": self._longitude,
+            "altitude": self._altitude, "model": self._model,
+            "date": self._date.isoformat(), "error": self._error,
+            "relative_error": self._relative_error}).encode()
+        size = len(FIELD_MAGIC) + 4 + len(header)
+        header += b" " * (-size % grid.ALIGNMENT)
+
+        with open(path, "wb") as f:
+            f.write(FIELD_MAGIC)
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+            numpy.asarray(self._data, "<f8").tofile(f)
+
+
+    @property
+    def altitude(self):
+        """The altitude range of the grid"""
+        return self._altitude
+
+
+    @property
+    def data(self):
+        """The field components at the grid nodes"""
+        return self._data
+
+
+    @property
+    def date(self):
+        """The date of the tabulated snapshot"""
+        return self._date
+
+
+    @property
+    def error(self):
+        """The estimated interpolation error, in T"""
+        return self._error
+
+
+    @property
+    def latitude(self):
+        """The latitude range of the grid"""
+        return self._latitude
+
+
+    @property
+    def longitude(self):
+        """The longitude range of the grid"""
+        return self._longitude
+
+
+    @property
+    def model(self):
+        """The world magnetic model of the tabulated snapshot"""
+        return self._model
+
+
+    @property
+    def path(self):
+        """The path to the field grid file, if any"""
+        return self._path
+
+
+    @property
+    def relative_error(self):
+        """The estimated interpolation error, relative to the field norm"""
+        return self._relative_error
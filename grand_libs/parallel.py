@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+"""
+Multiprocess evaluation of TURTLE stacks and GULL snapshots
+
+Copyright (C) 2018 The GRAND collaboration
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+import concurrent.futures
+import os
+import weakref
+
+import numpy
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8. Inputs and outputs are pickled to the workers instead
+    shared_memory = None
+
+from . import gull, turtle
+
+__all__ = ["Snapshot", "Stack", "empty", "share"]
+
+
+_blocks = {}
+"""Registry of the shared memory blocks allocated by this process"""
+
+
+def _release(shm, address):
+    """Release a shared memory block"""
+    _blocks.pop(address, None)
+    try:
+        shm.close()
+    except BufferError:
+        # Some view is still alive. Let the OS unmap the block at exit
+        pass
+    shm.unlink()
+
+
+def empty(shape):
+    """Allocate an array of floats in shared memory
+
+    Arrays allocated in shared memory are passed to the worker processes
+    without any copy. The memory is released once the array, and all its
+    views, have been deleted.
+
+    Note that shared memory requires Python 3.8 or later. With older versions
+    a regular array is returned, which is copied to the worker processes.
+
+    Parameters
+    ----------
+    shape : int or tuple of int
+        The shape of the array
+
+    Returns
+    -------
+    numpy.ndarray
+        The uninitialised array
+    """
+    if shared_memory is None:
+        return numpy.empty(shape)
+
+    size = int(numpy.prod(shape)) * numpy.dtype(float).itemsize
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    array = numpy.ndarray(shape, float, buffer=shm.buf)
+
+    address = array.ctypes.data
+    _blocks[address] = (shm.name, size)
+    weakref.finalize(array, _release, shm, address)
+
+    return array
+
+
+def share(a):
+    """Get a shared memory version of an array
+
+    Parameters
+    ----------
+    a : array_like
+        The input data
+
+    Returns
+    -------
+    numpy.ndarray
+        The input array, if it already lies in shared memory, or a shared
+        copy of it
+    """
+    if shared_memory is None:
+        return numpy.asanyarray(a, float)
+    elif _describe(a) is not None:
+        return a
+
+    a = numpy.asanyarray(a, float)
+    shared = empty(a.shape)
+    shared[...] = a
+    return shared
+
+
+def _describe(a):
+    """Get a picklable description of an array lying in shared memory"""
+    if not isinstance(a, numpy.ndarray) or (a.dtype != float) or \
+       not a.flags.c_contiguous:
+        return None
+
+    start = a.ctypes.data
+    for address, (name, size) in _blocks.items():
+        offset = start - address
+        if (offset >= 0) and (offset + a.nbytes <= size):
+            return name, offset, a.shape
+    return None
+
+
+_object = None
+"""The library object held by a worker process"""
+
+
+def _initialise(factory, args):
+    """Create the library object of a worker process"""
+    global _object
+    _object = factory(*args)
+
+
+def _task(method, descriptors, start, stop):
+    """Evaluate a method of the worker object over a slice of the inputs"""
+    blocks = [shared_memory.SharedMemory(name) for name, _, _ in descriptors]
+    try:
+        _evaluate(method, blocks, descriptors, start, stop)
+    finally:
+        for block in blocks:
+            try:
+                block.close()
+            except BufferError:
+                pass
+
+
+def _call(method, *inputs):
+    """Evaluate a method of the worker object over pickled inputs"""
+    return getattr(_object, method)(*inputs)
+
+
+def _evaluate(method, blocks, descriptors, start, stop):
+    """Evaluate a method of the worker object over shared arrays"""
+    arrays = [numpy.ndarray(shape, float, buffer=block.buf, offset=offset)
+              for block, (_, offset, shape) in zip(blocks, descriptors)]
+    *inputs, output = arrays
+    inputs = [a[start:stop] for a in inputs]
+    getattr(_object, method)(*inputs, out=output[start:stop])
+
+
+class _Engine:
+    """Pool of worker processes, each holding a copy of a library object"""
+
+    def __init__(self, factory, args, processes=None):
+        """Start the worker processes
+
+        Parameters
+        ----------
+        factory : callable
+            The library object type, e.g. `turtle.Stack`
+        args : tuple
+            Picklable arguments for creating the library object
+        processes : int, optional
+            The number of worker processes. Defaults to the number of CPUs
+        """
+        if processes is None:
+            processes = os.cpu_count() or 1
+        self._processes = processes
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            processes, initializer=_initialise, initargs=(factory, args))
+
+
+    def __del__(self):
+        self.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def close(self):
+        """Stop the worker processes"""
+        try:
+            executor = self._executor
+        except AttributeError:
+            return
+        if executor is not None:
+            executor.shutdown()
+            self._executor = None
+
+
+    def _map(self, method, inputs, shape, out=None):
+        """Scatter the evaluation of a method over the worker processes"""
+        inputs = [share(numpy.ravel(a)) for a in inputs]
+        if out is None:
+            output = empty(shape)
+        else:
+            if out.size != numpy.prod(shape, dtype=int):
+                raise ValueError(f"out must have shape {shape}")
+            output = share(out)
+
+        n = inputs[0].size
+        if n == 0:
+            return output if out is None else out
+
+        tasks = min(self._processes, n)
+        bounds = [(i * n) // tasks for i in range(tasks + 1)]
+        if shared_memory is None:
+            futures = [self._executor.submit(_call, method,
+                                             *(a[start:stop] for a in inputs))
+                       for start, stop in zip(bounds[:-1], bounds[1:])]
+            for start, stop, future in zip(bounds[:-1], bounds[1:], futures):
+                output[start:stop] = future.result()
+        else:
+            descriptors = [_describe(a) for a in inputs]
+            descriptors.append(_describe(output))
+            futures = [self._executor.submit(_task, method, descriptors,
+                                             start, stop)
+                       for start, stop in zip(bounds[:-1], bounds[1:])]
+            for future in futures:
+                future.result()
+
+        if (out is not None) and (output is not out):
+            out[...] = output.reshape(out.shape)
+            return out
+        else:
+            return output
+
+
+    @property
+    def processes(self):
+        """The number of worker processes"""
+        return self._processes
+
+
+class Stack(_Engine):
+    """Multiprocess proxy for a TURTLE stack"""
+
+    def __init__(self, path, stack_size=0, processes=None, mmap=False,
+                 max_bytes=0):
+        """Create a stack of maps in each worker process
+
+        Parameters
+        ----------
+        path : str
+            The path where the data tiles are located
+        stack_size : integer, optional
+            The maximum number of data tiles kept in memory, per process
+        processes : int, optional
+            The number of worker processes. Defaults to the number of CPUs
+        mmap : bool, optional
+            Flag to memory map the data tiles. The workers then share a
+            single copy of the tiles, through the page cache
+        max_bytes : integer, optional
+            The maximum size of the data tiles kept in memory, in bytes, per
+            process. This requires memory mapped tiles
+        """
+        self._path, self._stack_size = path, stack_size
+        super().__init__(turtle.Stack, (path, stack_size, False, mmap, None,
+                                        None, max_bytes), processes)
+
+
+    def elevation(self, latitude, longitude, out=None):
+        """Get the elevation at the given geodetic coordinates
+
+        The result lies in shared memory. It can be passed back to the worker
+        processes without any copy.
+
+        Parameters
+        ----------
+        latitude : float or array_like
+            The geodetic latitude(s), in deg
+        longitude : float or array_like
+            The geodetic longitude(s), in deg
+        out : numpy.ndarray, optional
+            A buffer where to store the result. Workers write directly to it
+            if it lies in shared memory
+
+        Returns
+        -------
+        float or numpy.ndarray
+            The topography elevation(s) or NaN if outside of the stack
+        """
+        latitude, longitude = map(numpy.asanyarray, (latitude, longitude))
+        if latitude.size != longitude.size:
+            raise ValueError("latitude and longitude must have the same size")
+
+        n = latitude.size
+        elevation = self._map("elevation", (latitude, longitude), (n,), out)
+        if (n == 1) and (out is None):
+            return elevation[0]
+        else:
+            return elevation
+
+
+    @property
+    def path(self):
+        """The path where the data tiles are located"""
+        return self._path
+
+
+    @property
+    def stack_size(self):
+        """The maximum number of data tiles kept in memory, per process"""
+        return self._stack_size
+
+
+class Snapshot(_Engine):
+    """Multiprocess proxy for a GULL snapshot"""
+
+    def __init__(self, model="IGRF12", date="2019-01-01", processes=None):
+        """Create a snapshot of the geo-magnetic field in each worker process
+
+        Parameters
+        ----------
+        model : str
+            The geo-magnetic model to use (IGRF12, or WMM2015)
+        date : str or datetime.date
+            The day at which the snapshot is taken
+        processes : int, optional
+            The number of worker processes. Defaults to the number of CPUs
+        """
+        self._model, self._date = model, date
+        super().__init__(gull.Snapshot, (model, date), processes)
+
+
+    def __call__(self, latitude, longitude, altitude=None, out=None):
+        """Get the magnetic field at a given Earth location
+
+        The result lies in shared memory. It can be passed back to the worker
+        processes without any copy.
+
+        Parameters
+        ----------
+        latitude : float or array_like
+            The geodetic latitude(s), in deg
+        longitude : float or array_like
+            The geodetic longitude(s), in deg
+        altitude : float or array_like, optional
+            The altitude(s) above the ellipsoid, in m. Defaults to zero
+        out : numpy.ndarray, optional
+            A buffer where to store the result. Workers write directly to it
+            if it lies in shared memory
+
+        Returns
+        -------
+        numpy.ndarray
+            The magnetic field components (East, North, Upward), in T
+        """
+        latitude, longitude = map(numpy.asanyarray, (latitude, longitude))
+        if latitude.size != longitude.size:
+            raise ValueError("latitude and longitude must have the same size")
+
+        if altitude is None:
+            altitude = numpy.zeros(latitude.size)
+        else:
+            altitude = numpy.asanyarray(altitude)
+            if latitude.size != altitude.size:
+                raise ValueError(
+                    "latitude and altitude must have the same size")
+
+        n = latitude.size
+        field = self._map("field", (latitude, longitude, altitude), (n, 3),
+                          out)
+        if (n == 1) and (out is None):
+            return field[0]
+        else:
+            return field
+
+
+    @property
+    def date(self):
+        """The date of the snapshot"""
+        return self._date
+
+
+    @property
+    def model(self):
+        """The world magnetic model"""
+        return self._model
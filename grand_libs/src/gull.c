@@ -12,3 +12,301 @@ enum gull_return gull_snapshot_field_v(struct gull_snapshot * snapshot,
 
         return GULL_RETURN_SUCCESS;
 }
+
+/* Trilinear interpolation of tabulated field values
+ *
+ * The table holds the magnetic field components over a regular grid of
+ * latitude, longitude and altitude nodes, the altitude running fastest.
+ * Points outside of the grid are flagged with NaN.
+ */
+struct gull_table {
+        const double * data;
+        int n[3];
+        double x0[3], dx[3];
+};
+
+void gull_table_field(const struct gull_table * table, double latitude,
+    double longitude, double altitude, double magnet[3])
+{
+        const double x[3] = { latitude, longitude, altitude };
+        double u[3];
+        int i[3], k;
+        for (k = 0; k < 3; k++) {
+                const double h = (x[k] - table->x0[k]) / table->dx[k];
+                if (!((h >= 0.) && (h <= table->n[k] - 1))) {
+                        magnet[0] = magnet[1] = magnet[2] = NAN;
+                        return;
+                }
+                i[k] = (int)h;
+                if (i[k] >= table->n[k] - 1) i[k] = table->n[k] - 2;
+                u[k] = h - i[k];
+        }
+
+        const long s2 = 3, s1 = s2 * table->n[2], s0 = s1 * table->n[1];
+        const double * p = table->data + i[0] * s0 + i[1] * s1 + i[2] * s2;
+        magnet[0] = magnet[1] = magnet[2] = 0.;
+        int c;
+        for (c = 0; c < 8; c++) {
+                const double w = ((c & 4) ? u[0] : 1. - u[0]) *
+                    ((c & 2) ? u[1] : 1. - u[1]) *
+                    ((c & 1) ? u[2] : 1. - u[2]);
+                const double * q = p + ((c & 4) ? s0 : 0) +
+                    ((c & 2) ? s1 : 0) + ((c & 1) ? s2 : 0);
+                magnet[0] += w * q[0];
+                magnet[1] += w * q[1];
+                magnet[2] += w * q[2];
+        }
+}
+
+void gull_table_field_v(const struct gull_table * table,
+    const double * latitude, const double * longitude,
+    const double * altitude, double * magnet, long n)
+{
+        for (; n > 0; n--, latitude++, longitude++, altitude++, magnet += 3)
+                gull_table_field(table, *latitude, *longitude, *altitude,
+                    magnet);
+}
+
+/* Batched evaluation of the spherical harmonics expansion
+ *
+ * The Gauss coefficients are provided by the caller as Schmidt
+ * semi-normalised values, in nT, indexed by degree n and order m as
+ * n * (n + 1) / 2 + m. Over a grid, the associated Legendre functions only
+ * depend on the latitude and on the altitude, and the trigonometric terms
+ * only on the longitude. Both are computed once per grid line. The
+ * expansion is then reduced to sums over the order m, on contiguous arrays.
+ */
+#include <stdlib.h>
+#include <string.h>
+
+struct gull_harmonics {
+        int order;
+        const double * g;
+        const double * h;
+        double altitude_min, altitude_max;
+};
+
+#define HARMONICS_INDEX(n, m) ((n) * ((n) + 1) / 2 + (m))
+#define HARMONICS_RADIUS 6371.2
+#define WGS84_A 6378.137
+#define WGS84_F (1. / 298.257223563)
+
+/* Reduced terms of the expansion at a given latitude and altitude
+ *
+ * For each order m, the terms are stored as 6 consecutive arrays: the
+ * north, east and downward geocentric components for the g and for the h
+ * coefficients. The rotation to geodetic components, and the inverse of
+ * the cosine of the geocentric latitude follow.
+ */
+static void harmonics_reduce(const struct gull_harmonics * harmonics,
+    double latitude, double altitude, double * legendre, double * terms)
+{
+        const int order = harmonics->order, size = order + 1;
+
+        /* Geocentric coordinates, in km */
+        const double deg = M_PI / 180.;
+        const double e2 = WGS84_F * (2. - WGS84_F);
+        const double sin_phi = sin(latitude * deg);
+        const double cos_phi = cos(latitude * deg);
+        const double h = altitude * 1E-03;
+        const double rc = WGS84_A / sqrt(1. - e2 * sin_phi * sin_phi);
+        const double p = (rc + h) * cos_phi;
+        const double z = (rc * (1. - e2) + h) * sin_phi;
+        const double r = sqrt(p * p + z * z);
+        const double x = z / r, s = p / r;
+
+        /* Schmidt semi-normalised Legendre functions of the geocentric
+         * latitude, and their derivatives w.r.t. the colatitude
+         */
+        double * P = legendre;
+        double * dP = legendre + HARMONICS_INDEX(order + 1, 0);
+        P[0] = 1., dP[0] = 0.;
+        int n, m;
+        for (n = 1; n <= order; n++) {
+                const int k = HARMONICS_INDEX(n, 0);
+                const int k1 = HARMONICS_INDEX(n - 1, 0);
+                const int k2 = (n > 1) ? HARMONICS_INDEX(n - 2, 0) : 0;
+                for (m = 0; m < n; m++) {
+                        const double a = sqrt((double)(n * n - m * m));
+                        const double b = (m < n - 1) ?
+                            sqrt((double)((n - 1) * (n - 1) - m * m)) : 0.;
+                        const double p2 = (b > 0.) ? P[k2 + m] : 0.;
+                        const double dp2 = (b > 0.) ? dP[k2 + m] : 0.;
+                        P[k + m] = ((2 * n - 1) * x * P[k1 + m] - b * p2) / a;
+                        dP[k + m] = ((2 * n - 1) * (x * dP[k1 + m] -
+                            s * P[k1 + m]) - b * dp2) / a;
+                }
+                if (n == 1) {
+                        P[k + 1] = s;
+                        dP[k + 1] = x;
+                } else {
+                        const double c = sqrt((2 * n - 1) / (2. * n));
+                        P[k + n] = c * s * P[k1 + n - 1];
+                        dP[k + n] = c * (x * P[k1 + n - 1] +
+                            s * dP[k1 + n - 1]);
+                }
+        }
+
+        /* Reduce the sums over the degree n */
+        double * xg = terms, * xh = terms + size;
+        double * yg = terms + 2 * size, * yh = terms + 3 * size;
+        double * zg = terms + 4 * size, * zh = terms + 5 * size;
+        memset(terms, 0x0, 6 * size * sizeof(*terms));
+        const double ratio = HARMONICS_RADIUS / r;
+        double scale = ratio * ratio;
+        for (n = 1; n <= order; n++) {
+                scale *= ratio;
+                const int k = HARMONICS_INDEX(n, 0);
+                const double * g = harmonics->g + k, * hh = harmonics->h + k;
+                for (m = 0; m <= n; m++) {
+                        const double sp = scale * P[k + m];
+                        const double sdp = scale * dP[k + m];
+                        xg[m] += sdp * g[m];
+                        xh[m] += sdp * hh[m];
+                        yg[m] += m * sp * g[m];
+                        yh[m] += m * sp * hh[m];
+                        zg[m] += (n + 1) * sp * g[m];
+                        zh[m] += (n + 1) * sp * hh[m];
+                }
+        }
+
+        /* Rotation to geodetic components */
+        double * rotation = terms + 6 * size;
+        rotation[0] = s * cos_phi + x * sin_phi;
+        rotation[1] = x * cos_phi - s * sin_phi;
+        rotation[2] = 1. / ((s > 1E-10) ? s : 1E-10);
+}
+
+/* Sum the reduced terms over the order m, for a given longitude */
+static void harmonics_sum(int order, const double * terms,
+    const double * cos_m, const double * sin_m, double * magnet)
+{
+        const int size = order + 1;
+        const double * xg = terms, * xh = terms + size;
+        const double * yg = terms + 2 * size, * yh = terms + 3 * size;
+        const double * zg = terms + 4 * size, * zh = terms + 5 * size;
+        double bx = 0., by = 0., bz = 0.;
+        int m;
+        for (m = 0; m <= order; m++) {
+                bx += xg[m] * cos_m[m] + xh[m] * sin_m[m];
+                by += yg[m] * sin_m[m] - yh[m] * cos_m[m];
+                bz -= zg[m] * cos_m[m] + zh[m] * sin_m[m];
+        }
+
+        const double * rotation = terms + 6 * size;
+        by *= rotation[2];
+        magnet[0] = by * 1E-09;
+        magnet[1] = (bx * rotation[0] - bz * rotation[1]) * 1E-09;
+        magnet[2] = -(bx * rotation[1] + bz * rotation[0]) * 1E-09;
+}
+
+/* Trigonometric terms of the multiples of a longitude */
+static void harmonics_trigonometry(int order, double longitude,
+    double * cos_m, double * sin_m)
+{
+        const double c = cos(longitude * M_PI / 180.);
+        const double s = sin(longitude * M_PI / 180.);
+        cos_m[0] = 1., sin_m[0] = 0.;
+        int m;
+        for (m = 1; m <= order; m++) {
+                cos_m[m] = cos_m[m - 1] * c - sin_m[m - 1] * s;
+                sin_m[m] = sin_m[m - 1] * c + cos_m[m - 1] * s;
+        }
+}
+
+/* Evaluate the expansion over a grid of latitudes, longitudes and altitudes
+ *
+ * The field is stored with the altitude running fastest.
+ */
+enum gull_return gull_harmonics_grid(const struct gull_harmonics * harmonics,
+    long n_latitude, const double * latitude, long n_longitude,
+    const double * longitude, long n_altitude, const double * altitude,
+    double * magnet)
+{
+        long i, j, k;
+        for (k = 0; k < n_altitude; k++) {
+                if (!((altitude[k] >= harmonics->altitude_min) &&
+                    (altitude[k] <= harmonics->altitude_max)))
+                        return GULL_RETURN_DOMAIN_ERROR;
+        }
+
+        const int order = harmonics->order, size = order + 1;
+        const long n_terms = 6 * size + 3;
+        double * workspace = malloc(sizeof(*workspace) *
+            (2 * HARMONICS_INDEX(order + 1, 0) + 2 * size * n_longitude +
+            n_terms * n_altitude));
+        if (workspace == NULL)
+                return GULL_RETURN_MEMORY_ERROR;
+        double * legendre = workspace;
+        double * trigonometry = legendre + 2 * HARMONICS_INDEX(order + 1, 0);
+        double * terms = trigonometry + 2 * size * n_longitude;
+
+        for (j = 0; j < n_longitude; j++) {
+                harmonics_trigonometry(order, longitude[j],
+                    trigonometry + 2 * size * j,
+                    trigonometry + 2 * size * j + size);
+        }
+
+        for (i = 0; i < n_latitude; i++) {
+                for (k = 0; k < n_altitude; k++) {
+                        harmonics_reduce(harmonics, latitude[i], altitude[k],
+                            legendre, terms + n_terms * k);
+                }
+                for (j = 0; j < n_longitude; j++) {
+                        const double * cos_m = trigonometry + 2 * size * j;
+                        double * b = magnet + 3 * n_altitude *
+                            (i * n_longitude + j);
+                        for (k = 0; k < n_altitude; k++, b += 3) {
+                                harmonics_sum(order, terms + n_terms * k,
+                                    cos_m, cos_m + size, b);
+                        }
+                }
+        }
+
+        free(workspace);
+        return GULL_RETURN_SUCCESS;
+}
+
+/* Evaluate the expansion at a sequence of points
+ *
+ * Terms are shared between consecutive points of a same latitude and
+ * altitude, or of a same longitude, e.g. for points sorted along a grid.
+ */
+enum gull_return gull_harmonics_field_v(
+    const struct gull_harmonics * harmonics, const double * latitude,
+    const double * longitude, const double * altitude, double * magnet,
+    long n)
+{
+        long i;
+        for (i = 0; i < n; i++) {
+                if (!((altitude[i] >= harmonics->altitude_min) &&
+                    (altitude[i] <= harmonics->altitude_max)))
+                        return GULL_RETURN_DOMAIN_ERROR;
+        }
+
+        const int order = harmonics->order, size = order + 1;
+        double * workspace = malloc(sizeof(*workspace) *
+            (2 * HARMONICS_INDEX(order + 1, 0) + 2 * size + 6 * size + 3));
+        if (workspace == NULL)
+                return GULL_RETURN_MEMORY_ERROR;
+        double * legendre = workspace;
+        double * trigonometry = legendre + 2 * HARMONICS_INDEX(order + 1, 0);
+        double * terms = trigonometry + 2 * size;
+
+        for (i = 0; i < n; i++, magnet += 3) {
+                if ((i == 0) || (latitude[i] != latitude[i - 1]) ||
+                    (altitude[i] != altitude[i - 1])) {
+                        harmonics_reduce(harmonics, latitude[i], altitude[i],
+                            legendre, terms);
+                }
+                if ((i == 0) || (longitude[i] != longitude[i - 1])) {
+                        harmonics_trigonometry(order, longitude[i],
+                            trigonometry, trigonometry + size);
+                }
+                harmonics_sum(order, terms, trigonometry,
+                    trigonometry + size, magnet);
+        }
+
+        free(workspace);
+        return GULL_RETURN_SUCCESS;
+}
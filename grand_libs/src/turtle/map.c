@@ -10,3 +10,145 @@ void turtle_map_elevation_v(struct turtle_map * map,
                         *elevation = NAN;
         }
 }
+
+/* Interpolation over raw grids, e.g. memory mapped from files */
+#include <stdint.h>
+#include <string.h>
+
+enum turtle_grid_type {
+        TURTLE_GRID_INT16 = 0,
+        TURTLE_GRID_INT16_SWAPPED,
+        TURTLE_GRID_FLOAT32,
+        TURTLE_GRID_FLOAT32_SWAPPED
+};
+
+struct turtle_grid {
+        const void * data;
+        int type;
+        int nx, ny;
+        double x0, y0, dx, dy;
+        double scale, offset;
+};
+
+static uint16_t grid_swap16(uint16_t v)
+{
+        return (uint16_t)((v << 8) | (v >> 8));
+}
+
+/* Get the value of a grid node, or NAN for void nodes */
+static double grid_node(const struct turtle_grid * grid, int ix, int iy)
+{
+        const long i = (long)iy * grid->nx + ix;
+        switch (grid->type) {
+        case TURTLE_GRID_INT16:
+        case TURTLE_GRID_INT16_SWAPPED: {
+                uint16_t u = ((const uint16_t *)grid->data)[i];
+                if (grid->type == TURTLE_GRID_INT16_SWAPPED)
+                        u = grid_swap16(u);
+                const int16_t v = (int16_t)u;
+                return (v == INT16_MIN) ? NAN :
+                    grid->offset + grid->scale * v;
+        }
+        case TURTLE_GRID_FLOAT32:
+                return grid->offset +
+                    grid->scale * ((const float *)grid->data)[i];
+        case TURTLE_GRID_FLOAT32_SWAPPED: {
+                uint32_t u = ((const uint32_t *)grid->data)[i];
+                u = ((uint32_t)grid_swap16(u & 0xFFFF) << 16) |
+                    grid_swap16(u >> 16);
+                float f;
+                memcpy(&f, &u, sizeof(f));
+                return grid->offset + grid->scale * f;
+        }
+        default:
+                return NAN;
+        }
+}
+
+enum turtle_return turtle_grid_elevation(const struct turtle_grid * grid,
+    double x, double y, double * elevation, int * inside)
+{
+        const double hx = (x - grid->x0) / grid->dx;
+        const double hy = (y - grid->y0) / grid->dy;
+        if (!((hx >= 0.) && (hx <= grid->nx - 1) && (hy >= 0.) &&
+            (hy <= grid->ny - 1))) {
+                *elevation = NAN;
+                *inside = 0;
+                return TURTLE_RETURN_SUCCESS;
+        }
+
+        int ix = (int)hx, iy = (int)hy;
+        if (ix >= grid->nx - 1) ix = grid->nx - 2;
+        if (iy >= grid->ny - 1) iy = grid->ny - 2;
+        const double u = hx - ix, v = hy - iy;
+
+        *elevation = grid_node(grid, ix, iy) * (1. - u) * (1. - v) +
+            grid_node(grid, ix + 1, iy) * u * (1. - v) +
+            grid_node(grid, ix, iy + 1) * (1. - u) * v +
+            grid_node(grid, ix + 1, iy + 1) * u * v;
+        *inside = !isnan(*elevation);
+        return TURTLE_RETURN_SUCCESS;
+}
+
+void turtle_grid_elevation_v(const struct turtle_grid * grid,
+    const double * x, const double * y, double * elevation, long n)
+{
+        for (; n > 0; n--, x++, y++, elevation++) {
+                int inside;
+                turtle_grid_elevation(grid, *x, *y, elevation, &inside);
+        }
+}
+
+/* Vectorization of the TURTLE/projection functions
+ *
+ * A NULL projection stands for geodetic map coordinates, i.e. x is the
+ * longitude and y the latitude. Failed projections yield NAN.
+ */
+void turtle_projection_project_v(
+    const struct turtle_projection * projection, const double * latitude,
+    const double * longitude, double * x, double * y, long n)
+{
+        for (; n > 0; n--, latitude++, longitude++, x++, y++) {
+                if (projection == NULL) {
+                        *x = *longitude;
+                        *y = *latitude;
+                } else if (turtle_projection_project(projection, *latitude,
+                    *longitude, x, y) != TURTLE_RETURN_SUCCESS) {
+                        *x = *y = NAN;
+                }
+        }
+}
+
+void turtle_projection_unproject_v(
+    const struct turtle_projection * projection, const double * x,
+    const double * y, double * latitude, double * longitude, long n)
+{
+        for (; n > 0; n--, x++, y++, latitude++, longitude++) {
+                if (projection == NULL) {
+                        *latitude = *y;
+                        *longitude = *x;
+                } else if (turtle_projection_unproject(projection, *x, *y,
+                    latitude, longitude) != TURTLE_RETURN_SUCCESS) {
+                        *latitude = *longitude = NAN;
+                }
+        }
+}
+
+void turtle_map_elevation_geodetic_v(struct turtle_map * map,
+    const struct turtle_projection * projection, const double * latitude,
+    const double * longitude, double * elevation, long n)
+{
+        for (; n > 0; n--, latitude++, longitude++, elevation++) {
+                double x = *longitude, y = *latitude;
+                int inside;
+                if (((projection != NULL) && (turtle_projection_project(
+                    projection, *latitude, *longitude, &x, &y) !=
+                    TURTLE_RETURN_SUCCESS)) || isnan(x) || isnan(y)) {
+                        *elevation = NAN;
+                        continue;
+                }
+                turtle_map_elevation(map, x, y, elevation, &inside);
+                if (!inside)
+                        *elevation = NAN;
+        }
+}
@@ -1,14 +1,52 @@
 /* Vectorization of the TURTLE/stack functions */
 
-void turtle_stack_elevation_v(struct turtle_stack * stack,
+enum turtle_return turtle_stack_elevation_v(struct turtle_stack * stack,
     const double * latitude, const double * longitude, double * elevation,
     long n)
 {
         for (; n > 0; n--, latitude++, longitude++, elevation++) {
                 int inside;
-                turtle_stack_elevation(
+                enum turtle_return rc = turtle_stack_elevation(
                     stack, *latitude, *longitude, elevation, &inside);
+                if (rc != TURTLE_RETURN_SUCCESS)
+                        return rc;
                 if (!inside)
                         *elevation = NAN;
         }
+
+        return TURTLE_RETURN_SUCCESS;
+}
+
+/* Thread safe access to TURTLE stacks */
+#include <pthread.h>
+
+static pthread_mutex_t stack_mutex = PTHREAD_MUTEX_INITIALIZER;
+
+int turtle_stack_mutex_lock(void)
+{
+        return pthread_mutex_lock(&stack_mutex);
+}
+
+int turtle_stack_mutex_unlock(void)
+{
+        return pthread_mutex_unlock(&stack_mutex);
+}
+
+/* Vectorization of the TURTLE/client functions */
+
+enum turtle_return turtle_client_elevation_v(struct turtle_client * client,
+    const double * latitude, const double * longitude, double * elevation,
+    long n)
+{
+        for (; n > 0; n--, latitude++, longitude++, elevation++) {
+                int inside;
+                enum turtle_return rc = turtle_client_elevation(
+                    client, *latitude, *longitude, elevation, &inside);
+                if (rc != TURTLE_RETURN_SUCCESS)
+                        return rc;
+                if (!inside)
+                        *elevation = NAN;
+        }
+
+        return TURTLE_RETURN_SUCCESS;
 }
@@ -0,0 +1,785 @@
+/* NumPy ufuncs for the TURTLE and GULL libraries
+ *
+ * The library functions are not linked to this extension. Instead their
+ * addresses are bound at runtime, from the ctypes proxies, using the `bind`
+ * function. The ufuncs must not be called before all the library functions
+ * they depend on have been bound.
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#define NPY_NO_DEPRECATED_API NPY_1_7_API_VERSION
+#include <numpy/arrayobject.h>
+#include <numpy/ufuncobject.h>
+
+#include <math.h>
+#include <stdint.h>
+#include <string.h>
+
+/* Prototypes of the library functions */
+typedef void ecef_from_geodetic_t(double latitude, double longitude,
+    double altitude, double ecef[3]);
+typedef void ecef_from_horizontal_t(double latitude, double longitude,
+    double azimuth, double elevation, double direction[3]);
+typedef void ecef_to_geodetic_t(const double ecef[3], double * latitude,
+    double * longitude, double * altitude);
+typedef void ecef_to_horizontal_t(double latitude, double longitude,
+    const double direction[3], double * azimuth, double * elevation);
+typedef int elevation_t(void * object, double x, double y, double * z,
+    int * inside);
+typedef int snapshot_field_t(void * snapshot, double latitude,
+    double longitude, double altitude, double magnet[3], void ** workspace);
+typedef void snapshot_destroy_t(void ** snapshot);
+typedef int project_t(const void * projection, double u, double v,
+    double * a, double * b);
+
+/* Table of library functions, bound at runtime */
+static struct {
+        ecef_from_geodetic_t * ecef_from_geodetic;
+        ecef_from_horizontal_t * ecef_from_horizontal;
+        ecef_to_geodetic_t * ecef_to_geodetic;
+        ecef_to_horizontal_t * ecef_to_horizontal;
+        elevation_t * map_elevation;
+        elevation_t * stack_elevation;
+        elevation_t * client_elevation;
+        elevation_t * grid_elevation;
+        snapshot_field_t * snapshot_field;
+        snapshot_destroy_t * snapshot_destroy;
+        project_t * projection_project;
+        project_t * projection_unproject;
+} lib;
+
+static const struct {
+        const char * name;
+        void * slot;
+} symbols[] = {
+        { "turtle_ecef_from_geodetic", &lib.ecef_from_geodetic },
+        { "turtle_ecef_from_horizontal", &lib.ecef_from_horizontal },
+        { "turtle_ecef_to_geodetic", &lib.ecef_to_geodetic },
+        { "turtle_ecef_to_horizontal", &lib.ecef_to_horizontal },
+        { "turtle_map_elevation", &lib.map_elevation },
+        { "turtle_stack_elevation", &lib.stack_elevation },
+        { "turtle_client_elevation", &lib.client_elevation },
+        { "turtle_grid_elevation", &lib.grid_elevation },
+        { "gull_snapshot_field", &lib.snapshot_field },
+        { "gull_snapshot_destroy", &lib.snapshot_destroy },
+        { "turtle_projection_project", &lib.projection_project },
+        { "turtle_projection_unproject", &lib.projection_unproject }
+};
+
+/* First error returned by the library to the loops of the calling thread,
+ * if any. It is read and reset from Python with the `error` function.
+ */
+static _Thread_local int last_error = 0;
+
+static int check(int rc)
+{
+        if ((rc != 0) && (last_error == 0))
+                last_error = rc;
+        return rc;
+}
+
+/* Loop settings, passed as the ufunc data */
+struct loop {
+        /* Flag for float32 inputs. Outputs are always float64 */
+        int single;
+        /* The elevation getter, for elevation loops */
+        elevation_t ** elevation;
+        /* The projection function, for projection loops */
+        project_t ** project;
+};
+
+/* Accessors for strided data */
+#define SET(p, v) (*(double *)(p) = (v))
+#define HANDLE(p) ((void *)*(const npy_uintp *)(p))
+
+static double get(const char * p, int single)
+{
+        return single ? *(const float *)p : *(const double *)p;
+}
+
+static void get3(const char * p, npy_intp step, int single, double v[3])
+{
+        v[0] = get(p, single);
+        v[1] = get(p + step, single);
+        v[2] = get(p + 2 * step, single);
+}
+
+static void set3(char * p, npy_intp step, const double v[3])
+{
+        SET(p, v[0]);
+        SET(p + step, v[1]);
+        SET(p + 2 * step, v[2]);
+}
+
+/* Loop over (latitude, longitude, altitude) -> (ecef[3]) */
+static void ecef_from_geodetic_loop(char ** args,
+    npy_intp const * dimensions, npy_intp const * steps, void * data)
+{
+        const int single = ((const struct loop *)data)->single;
+        char * latitude = args[0], * longitude = args[1],
+             * altitude = args[2], * ecef = args[3];
+        npy_intp i;
+        for (i = 0; i < dimensions[0]; i++, latitude += steps[0],
+            longitude += steps[1], altitude += steps[2], ecef += steps[3]) {
+                double r[3];
+                lib.ecef_from_geodetic(get(latitude, single),
+                    get(longitude, single), get(altitude, single), r);
+                set3(ecef, steps[4], r);
+        }
+}
+
+/* Loop over (latitude, longitude, azimuth, elevation) -> (direction[3]) */
+static void ecef_from_horizontal_loop(char ** args,
+    npy_intp const * dimensions, npy_intp const * steps, void * data)
+{
+        const int single = ((const struct loop *)data)->single;
+        char * latitude = args[0], * longitude = args[1],
+             * azimuth = args[2], * elevation = args[3],
+             * direction = args[4];
+        npy_intp i;
+        for (i = 0; i < dimensions[0]; i++, latitude += steps[0],
+            longitude += steps[1], azimuth += steps[2],
+            elevation += steps[3], direction += steps[4]) {
+                double u[3];
+                lib.ecef_from_horizontal(get(latitude, single),
+                    get(longitude, single), get(azimuth, single),
+                    get(elevation, single), u);
+                set3(direction, steps[5], u);
+        }
+}
+
+/* Loop over (ecef[3]) -> (latitude, longitude, altitude) */
+static void ecef_to_geodetic_loop(char ** args,
+    npy_intp const * dimensions, npy_intp const * steps, void * data)
+{
+        const int single = ((const struct loop *)data)->single;
+        char * ecef = args[0], * latitude = args[1], * longitude = args[2],
+             * altitude = args[3];
+        npy_intp i;
+        for (i = 0; i < dimensions[0]; i++, ecef += steps[0],
+            latitude += steps[1], longitude += steps[2],
+            altitude += steps[3]) {
+                double r[3];
+                get3(ecef, steps[4], single, r);
+                lib.ecef_to_geodetic(r, (double *)latitude,
+                    (double *)longitude, (double *)altitude);
+        }
+}
+
+/* Loop over (latitude, longitude, direction[3]) -> (azimuth, elevation) */
+static void ecef_to_horizontal_loop(char ** args,
+    npy_intp const * dimensions, npy_intp const * steps, void * data)
+{
+        const int single = ((const struct loop *)data)->single;
+        char * latitude = args[0], * longitude = args[1],
+             * direction = args[2], * azimuth = args[3],
+             * elevation = args[4];
+        npy_intp i;
+        for (i = 0; i < dimensions[0]; i++, latitude += steps[0],
+            longitude += steps[1], direction += steps[2],
+            azimuth += steps[3], elevation += steps[4]) {
+                double u[3];
+                get3(direction, steps[5], single, u);
+                lib.ecef_to_horizontal(get(latitude, single),
+                    get(longitude, single), u, (double *)azimuth,
+                    (double *)elevation);
+        }
+}
+
+/* Loop over (object, x, y) -> (z), with NaN outside of the topography
+ *
+ * Library errors also yield NaN. The first one is recorded.
+ */
+static void elevation_loop(char ** args, npy_intp const * dimensions,
+    npy_intp const * steps, void * data)
+{
+        const int single = ((const struct loop *)data)->single;
+        elevation_t * elevation = *((const struct loop *)data)->elevation;
+        char * object = args[0], * x = args[1], * y = args[2], * z = args[3];
+        npy_intp i;
+        for (i = 0; i < dimensions[0]; i++, object += steps[0],
+            x += steps[1], y += steps[2], z += steps[3]) {
+                int inside;
+                if ((check(elevation(HANDLE(object), get(x, single),
+                    get(y, single), (double *)z, &inside)) != 0) || !inside)
+                        SET(z, NAN);
+        }
+}
+
+/* Loop over (projection, u, v) -> (a, b)
+ *
+ * A NULL projection stands for geodetic map coordinates, such that the
+ * inputs are only swapped. Failed projections yield NaN.
+ */
+static void projection_loop(char ** args, npy_intp const * dimensions,
+    npy_intp const * steps, void * data)
+{
+        const int single = ((const struct loop *)data)->single;
+        project_t * project = *((const struct loop *)data)->project;
+        char * projection = args[0], * u = args[1], * v = args[2],
+             * a = args[3], * b = args[4];
+        npy_intp i;
+        for (i = 0; i < dimensions[0]; i++, projection += steps[0],
+            u += steps[1], v += steps[2], a += steps[3], b += steps[4]) {
+                const void * p = HANDLE(projection);
+                if (p == NULL) {
+                        SET(a, get(v, single));
+                        SET(b, get(u, single));
+                } else if (project(p, get(u, single), get(v, single),
+                    (double *)a, (double *)b) != 0) {
+                        SET(a, NAN);
+                        SET(b, NAN);
+                }
+        }
+}
+
+/* Loop over (object, projection, latitude, longitude) -> (z)
+ *
+ * The projection and the elevation lookup are fused. The elevation is NaN
+ * outside of the topography, or if the projection fails. Library errors
+ * also yield NaN, and the first one is recorded.
+ */
+static void elevation_geodetic_loop(char ** args,
+    npy_intp const * dimensions, npy_intp const * steps, void * data)
+{
+        const int single = ((const struct loop *)data)->single;
+        elevation_t * elevation = *((const struct loop *)data)->elevation;
+        char * object = args[0], * projection = args[1],
+             * latitude = args[2], * longitude = args[3], * z = args[4];
+        npy_intp i;
+        for (i = 0; i < dimensions[0]; i++, object += steps[0],
+            projection += steps[1], latitude += steps[2],
+            longitude += steps[3], z += steps[4]) {
+                const void * p = HANDLE(projection);
+                double x = get(longitude, single), y = get(latitude, single);
+                int inside;
+                if (((p != NULL) && (lib.projection_project(p, y, x, &x,
+                    &y) != 0)) || isnan(x) || isnan(y) ||
+                    (check(elevation(HANDLE(object), x, y, (double *)z,
+                    &inside)) != 0) || !inside)
+                        SET(z, NAN);
+        }
+}
+
+/* Height of an ECEF position above the ground. Outside of the topography
+ * data, the ground is the ellipsoid. Library errors are recorded.
+ */
+static double ground_height(elevation_t * elevation, void * object,
+    const double r[3])
+{
+        double latitude, longitude, altitude, z;
+        int inside;
+        lib.ecef_to_geodetic(r, &latitude, &longitude, &altitude);
+        if ((check(elevation(object, latitude, longitude, &z, &inside)) !=
+            0) || !inside)
+                return altitude;
+        return altitude - z;
+}
+
+/* Precision on the location of ground intersections, in m */
+#define INTERSECT_PRECISION 1E-03
+
+/* Step along a ray until the ground is crossed, within max_length
+ *
+ * The ray is stepped by half its height above the ground, but at least by
+ * step. On success, the crossing lies between s0 and s1, and h0 is the
+ * height at s0. Otherwise, zero is returned.
+ */
+static int cross(elevation_t * elevation, void * object, const double r0[3],
+    const double u[3], double max_length, double step, double * s0,
+    double * h0, double * s1)
+{
+        double r[3];
+        *s0 = 0.;
+        *h0 = ground_height(elevation, object, r0);
+        if (*h0 == 0.) {
+                *s1 = 0.;
+                return 1;
+        }
+
+        for (;;) {
+                *s1 = fmin(*s0 + fmax(step, 0.5 * fabs(*h0)), max_length);
+                r[0] = r0[0] + *s1 * u[0];
+                r[1] = r0[1] + *s1 * u[1];
+                r[2] = r0[2] + *s1 * u[2];
+                const double h1 = ground_height(elevation, object, r);
+                if ((*h0 > 0.) != (h1 > 0.))
+                        return 1;
+                if (!(*s1 < max_length))
+                        return 0;
+                *s0 = *s1;
+                *h0 = h1;
+        }
+}
+
+/* Distance to the first ground intersection along a ray, or NaN if none is
+ * found within max_length
+ *
+ * Once the ground is crossed, the intersection is refined by bisection.
+ */
+static double intersect(elevation_t * elevation, void * object,
+    const double r0[3], const double u[3], double max_length, double step)
+{
+        double r[3], s0, h0, s1;
+        if (!cross(elevation, object, r0, u, max_length, step, &s0, &h0,
+            &s1))
+                return NAN;
+
+        while (s1 - s0 > INTERSECT_PRECISION) {
+                const double s = 0.5 * (s0 + s1);
+                r[0] = r0[0] + s * u[0];
+                r[1] = r0[1] + s * u[1];
+                r[2] = r0[2] + s * u[2];
+                const double h = ground_height(elevation, object, r);
+                if ((h > 0.) == (h0 > 0.))
+                        s0 = s;
+                else
+                        s1 = s;
+        }
+        return s1;
+}
+
+/* Loop over (object, origin[3], direction[3], max_length, step)
+ *           -> (position[3], distance)
+ *
+ * Rays without any ground intersection, or with a null direction, yield
+ * NaN.
+ */
+static void intersect_loop(char ** args, npy_intp const * dimensions,
+    npy_intp const * steps, void * data)
+{
+        const int single = ((const struct loop *)data)->single;
+        elevation_t * elevation = *((const struct loop *)data)->elevation;
+        char * object = args[0], * origin = args[1], * direction = args[2],
+             * max_length = args[3], * step = args[4], * position = args[5],
+             * distance = args[6];
+        npy_intp i;
+        for (i = 0; i < dimensions[0]; i++, object += steps[0],
+            origin += steps[1], direction += steps[2],
+            max_length += steps[3], step += steps[4], position += steps[5],
+            distance += steps[6]) {
+                double r0[3], u[3], r[3];
+                get3(origin, steps[7], single, r0);
+                get3(direction, steps[8], single, u);
+                const double norm = sqrt(u[0] * u[0] + u[1] * u[1] +
+                    u[2] * u[2]);
+                if (!(norm > 0.)) {
+                        r[0] = r[1] = r[2] = NAN;
+                        SET(distance, NAN);
+                        set3(position, steps[9], r);
+                        continue;
+                }
+                u[0] /= norm;
+                u[1] /= norm;
+                u[2] /= norm;
+
+                const double s = intersect(elevation, HANDLE(object), r0, u,
+                    get(max_length, single), get(step, single));
+                r[0] = r0[0] + s * u[0];
+                r[1] = r0[1] + s * u[1];
+                r[2] = r0[2] + s * u[2];
+                SET(distance, s);
+                set3(position, steps[9], r);
+        }
+}
+
+/* Loop over (object, source[3], target[3], step) -> (visible)
+ *
+ * The stepping stops as soon as the ground is crossed. Both end points are
+ * expected to lie above, or on, the ground. A tolerance is applied at both
+ * of them, such that the check is symmetric.
+ */
+static void visible_loop(char ** args, npy_intp const * dimensions,
+    npy_intp const * steps, void * data)
+{
+        const int single = ((const struct loop *)data)->single;
+        elevation_t * elevation = *((const struct loop *)data)->elevation;
+        char * object = args[0], * source = args[1], * target = args[2],
+             * step = args[3], * visible = args[4];
+        npy_intp i;
+        for (i = 0; i < dimensions[0]; i++, object += steps[0],
+            source += steps[1], target += steps[2], step += steps[3],
+            visible += steps[4]) {
+                double r0[3], r1[3], u[3], s0, h0, s1;
+                get3(source, steps[5], single, r0);
+                get3(target, steps[6], single, r1);
+                u[0] = r1[0] - r0[0];
+                u[1] = r1[1] - r0[1];
+                u[2] = r1[2] - r0[2];
+                const double d = sqrt(u[0] * u[0] + u[1] * u[1] +
+                    u[2] * u[2]);
+                if (d > 0.) {
+                        u[0] /= d;
+                        u[1] /= d;
+                        u[2] /= d;
+                }
+                r0[0] += INTERSECT_PRECISION * u[0];
+                r0[1] += INTERSECT_PRECISION * u[1];
+                r0[2] += INTERSECT_PRECISION * u[2];
+                *(npy_bool *)visible = !cross(elevation, HANDLE(object), r0,
+                    u, fmax(d - 2 * INTERSECT_PRECISION, 0.),
+                    get(step, single), &s0, &h0, &s1);
+        }
+}
+
+/* Loop over (snapshot, latitude, longitude, altitude) -> (field[3])
+ *
+ * A private workspace is used, such that the loop can run concurrently.
+ * The field is set to NaN if the GULL library returns an error.
+ */
+static void snapshot_field_loop(char ** args, npy_intp const * dimensions,
+    npy_intp const * steps, void * data)
+{
+        const int single = ((const struct loop *)data)->single;
+        char * snapshot = args[0], * latitude = args[1],
+             * longitude = args[2], * altitude = args[3], * field = args[4];
+        void * workspace = NULL;
+        npy_intp i;
+        for (i = 0; i < dimensions[0]; i++, snapshot += steps[0],
+            latitude += steps[1], longitude += steps[2],
+            altitude += steps[3], field += steps[4]) {
+                double b[3];
+                if (lib.snapshot_field(HANDLE(snapshot),
+                    get(latitude, single), get(longitude, single),
+                    get(altitude, single), b, &workspace) != 0)
+                        b[0] = b[1] = b[2] = NAN;
+                set3(field, steps[5], b);
+        }
+        lib.snapshot_destroy(&workspace);
+}
+
+/* Local East, North, Upward (ENU) basis at a geodetic location */
+static void enu_basis(double latitude, double longitude, double basis[3][3])
+{
+        const double deg = M_PI / 180.;
+        const double sl = sin(latitude * deg), cl = cos(latitude * deg);
+        const double so = sin(longitude * deg), co = cos(longitude * deg);
+
+        basis[0][0] = -so;
+        basis[0][1] = co;
+        basis[0][2] = 0.;
+        basis[1][0] = -sl * co;
+        basis[1][1] = -sl * so;
+        basis[1][2] = cl;
+        basis[2][0] = cl * co;
+        basis[2][1] = cl * so;
+        basis[2][2] = sl;
+}
+
+/* Loop over (latitude, longitude, altitude, ecef[3]) -> (enu[3])
+ *
+ * ECEF positions are expressed in the local ENU frame of the observer.
+ */
+static void enu_from_ecef_loop(char ** args, npy_intp const * dimensions,
+    npy_intp const * steps, void * data)
+{
+        const int single = ((const struct loop *)data)->single;
+        char * latitude = args[0], * longitude = args[1],
+             * altitude = args[2], * ecef = args[3], * enu = args[4];
+        npy_intp i;
+        for (i = 0; i < dimensions[0]; i++, latitude += steps[0],
+            longitude += steps[1], altitude += steps[2], ecef += steps[3],
+            enu += steps[4]) {
+                const double la = get(latitude, single),
+                             lo = get(longitude, single);
+                double origin[3], r[3], basis[3][3], v[3];
+                lib.ecef_from_geodetic(la, lo, get(altitude, single),
+                    origin);
+                get3(ecef, steps[5], single, r);
+                enu_basis(la, lo, basis);
+
+                int j;
+                for (j = 0; j < 3; j++) {
+                        v[j] = basis[j][0] * (r[0] - origin[0]) +
+                               basis[j][1] * (r[1] - origin[1]) +
+                               basis[j][2] * (r[2] - origin[2]);
+                }
+                set3(enu, steps[6], v);
+        }
+}
+
+/* Loop over (latitude, longitude, altitude, enu[3]) -> (ecef[3])
+ *
+ * Positions in the local ENU frame of the observer are expressed in ECEF.
+ */
+static void ecef_from_enu_loop(char ** args, npy_intp const * dimensions,
+    npy_intp const * steps, void * data)
+{
+        const int single = ((const struct loop *)data)->single;
+        char * latitude = args[0], * longitude = args[1],
+             * altitude = args[2], * enu = args[3], * ecef = args[4];
+        npy_intp i;
+        for (i = 0; i < dimensions[0]; i++, latitude += steps[0],
+            longitude += steps[1], altitude += steps[2], enu += steps[3],
+            ecef += steps[4]) {
+                const double la = get(latitude, single),
+                             lo = get(longitude, single);
+                double origin[3], v[3], basis[3][3], r[3];
+                lib.ecef_from_geodetic(la, lo, get(altitude, single),
+                    origin);
+                get3(enu, steps[5], single, v);
+                enu_basis(la, lo, basis);
+
+                int j;
+                for (j = 0; j < 3; j++) {
+                        r[j] = origin[j] + basis[0][j] * v[0] +
+                               basis[1][j] * v[1] + basis[2][j] * v[2];
+                }
+                set3(ecef, steps[6], r);
+        }
+}
+
+/* Loop over (latitude, longitude, altitude, target_latitude,
+ *            target_longitude, target_altitude)
+ *           -> (azimuth, elevation, distance)
+ *
+ * The horizontal angles and the distance of the target are computed from
+ * the observer location. Coincident points yield NaN angles.
+ */
+static void horizontal_from_geodetic_loop(char ** args,
+    npy_intp const * dimensions, npy_intp const * steps, void * data)
+{
+        const int single = ((const struct loop *)data)->single;
+        char * latitude = args[0], * longitude = args[1],
+             * altitude = args[2], * target_latitude = args[3],
+             * target_longitude = args[4], * target_altitude = args[5],
+             * azimuth = args[6], * elevation = args[7],
+             * distance = args[8];
+        npy_intp i;
+        for (i = 0; i < dimensions[0]; i++, latitude += steps[0],
+            longitude += steps[1], altitude += steps[2],
+            target_latitude += steps[3], target_longitude += steps[4],
+            target_altitude += steps[5], azimuth += steps[6],
+            elevation += steps[7], distance += steps[8]) {
+                const double la = get(latitude, single),
+                             lo = get(longitude, single);
+                double r0[3], r1[3], u[3];
+                lib.ecef_from_geodetic(la, lo, get(altitude, single), r0);
+                lib.ecef_from_geodetic(get(target_latitude, single),
+                    get(target_longitude, single),
+                    get(target_altitude, single), r1);
+                u[0] = r1[0] - r0[0];
+                u[1] = r1[1] - r0[1];
+                u[2] = r1[2] - r0[2];
+
+                const double d = sqrt(u[0] * u[0] + u[1] * u[1] +
+                    u[2] * u[2]);
+                SET(distance, d);
+                if (d > 0.) {
+                        u[0] /= d;
+                        u[1] /= d;
+                        u[2] /= d;
+                        lib.ecef_to_horizontal(la, lo, u, (double *)azimuth,
+                            (double *)elevation);
+                } else {
+                        SET(azimuth, NAN);
+                        SET(elevation, NAN);
+                }
+        }
+}
+
+/* Definitions of the ufuncs
+ *
+ * Each ufunc has a float32 loop and a float64 one. The float32 loop is
+ * registered first, such that it is selected for float32 inputs without any
+ * cast. Other inputs are safely cast to float64.
+ */
+#define LOOPS(loop) static PyUFuncGenericFunction loop ## s[] = { \
+        &loop, &loop }
+
+LOOPS(ecef_from_geodetic_loop);
+LOOPS(ecef_from_horizontal_loop);
+LOOPS(ecef_to_geodetic_loop);
+LOOPS(ecef_to_horizontal_loop);
+LOOPS(elevation_loop);
+LOOPS(projection_loop);
+LOOPS(elevation_geodetic_loop);
+LOOPS(intersect_loop);
+LOOPS(visible_loop);
+LOOPS(snapshot_field_loop);
+LOOPS(enu_from_ecef_loop);
+LOOPS(ecef_from_enu_loop);
+LOOPS(horizontal_from_geodetic_loop);
+
+#define F NPY_FLOAT
+#define D NPY_DOUBLE
+#define H NPY_UINTP
+#define B NPY_BOOL
+static char types_3to1[] = { F, F, F, D, D, D, D, D };
+static char types_4to1[] = { F, F, F, F, D, D, D, D, D, D };
+static char types_1to3[] = { F, D, D, D, D, D, D, D };
+static char types_3to2[] = { F, F, F, D, D, D, D, D, D, D };
+static char types_h2to1[] = { H, F, F, D, H, D, D, D };
+static char types_h3to1[] = { H, F, F, F, D, H, D, D, D, D };
+static char types_h2to2[] = { H, F, F, D, D, H, D, D, D, D };
+static char types_hh2to1[] = { H, H, F, F, D, H, H, D, D, D };
+static char types_h4to2[] = { H, F, F, F, F, D, D,
+                              H, D, D, D, D, D, D };
+static char types_h3tob[] = { H, F, F, F, B, H, D, D, D, B };
+static char types_6to3[] = { F, F, F, F, F, F, D, D, D,
+                             D, D, D, D, D, D, D, D, D };
+#undef F
+#undef D
+#undef H
+#undef B
+
+static struct loop plain_float = { 1, NULL, NULL },
+                   plain_double = { 0, NULL, NULL };
+static struct loop map_float = { 1, &lib.map_elevation },
+                   map_double = { 0, &lib.map_elevation };
+static struct loop stack_float = { 1, &lib.stack_elevation },
+                   stack_double = { 0, &lib.stack_elevation };
+static struct loop client_float = { 1, &lib.client_elevation },
+                   client_double = { 0, &lib.client_elevation };
+static struct loop grid_float = { 1, &lib.grid_elevation },
+                   grid_double = { 0, &lib.grid_elevation };
+static struct loop project_float = { 1, NULL, &lib.projection_project },
+                   project_double = { 0, NULL, &lib.projection_project };
+static struct loop unproject_float = { 1, NULL, &lib.projection_unproject },
+                   unproject_double = { 0, NULL, &lib.projection_unproject };
+
+static void * plain_data[] = { &plain_float, &plain_double };
+static void * map_data[] = { &map_float, &map_double };
+static void * stack_data[] = { &stack_float, &stack_double };
+static void * client_data[] = { &client_float, &client_double };
+static void * grid_data[] = { &grid_float, &grid_double };
+static void * project_data[] = { &project_float, &project_double };
+static void * unproject_data[] = { &unproject_float, &unproject_double };
+
+static const struct {
+        const char * name;
+        PyUFuncGenericFunction * loops;
+        void ** data;
+        char * types;
+        int nin, nout;
+        const char * signature;
+        const char * doc;
+} ufuncs[] = {
+        { "ecef_from_geodetic", ecef_from_geodetic_loops, plain_data,
+          types_3to1, 3, 1, "(),(),()->(3)",
+          "Convert geodetic coordinates to ECEF ones" },
+        { "ecef_from_horizontal", ecef_from_horizontal_loops, plain_data,
+          types_4to1, 4, 1, "(),(),(),()->(3)",
+          "Convert horizontal coordinates to an ECEF direction" },
+        { "ecef_to_geodetic", ecef_to_geodetic_loops, plain_data,
+          types_1to3, 1, 3, "(3)->(),(),()",
+          "Convert ECEF coordinates to geodetic ones" },
+        { "ecef_to_horizontal", ecef_to_horizontal_loops, plain_data,
+          types_3to2, 3, 2, "(),(),(3)->(),()",
+          "Convert an ECEF direction to horizontal coordinates" },
+        { "map_elevation", elevation_loops, map_data, types_h2to1, 3, 1,
+          NULL, "Get the topography elevation from a map" },
+        { "stack_elevation", elevation_loops, stack_data, types_h2to1, 3, 1,
+          NULL, "Get the topography elevation from a stack of maps" },
+        { "client_elevation", elevation_loops, client_data, types_h2to1, 3,
+          1, NULL, "Get the topography elevation using a stack client" },
+        { "grid_elevation", elevation_loops, grid_data, types_h2to1, 3, 1,
+          NULL, "Get the topography elevation from a raw grid" },
+        { "projection_project", projection_loops, project_data,
+          types_h2to2, 3, 2, NULL,
+          "Project geodetic coordinates to map ones" },
+        { "projection_unproject", projection_loops, unproject_data,
+          types_h2to2, 3, 2, NULL,
+          "Unproject map coordinates to geodetic ones" },
+        { "map_elevation_geodetic", elevation_geodetic_loops, map_data,
+          types_hh2to1, 4, 1, NULL,
+          "Get the topography elevation from a map, at geodetic "
+          "coordinates" },
+        { "grid_elevation_geodetic", elevation_geodetic_loops, grid_data,
+          types_hh2to1, 4, 1, NULL,
+          "Get the topography elevation from a raw grid, at geodetic "
+          "coordinates" },
+        { "stack_intersect", intersect_loops, stack_data, types_h4to2, 5,
+          2, "(),(3),(3),(),()->(3),()",
+          "Intersect rays with the topography of a stack of maps" },
+        { "client_intersect", intersect_loops, client_data, types_h4to2, 5,
+          2, "(),(3),(3),(),()->(3),()",
+          "Intersect rays with the topography, using a stack client" },
+        { "stack_visible", visible_loops, stack_data, types_h3tob, 4, 1,
+          "(),(3),(3),()->()",
+          "Check the visibility between points over a stack of maps" },
+        { "client_visible", visible_loops, client_data, types_h3tob, 4, 1,
+          "(),(3),(3),()->()",
+          "Check the visibility between points, using a stack client" },
+        { "snapshot_field", snapshot_field_loops, plain_data, types_h3to1,
+          4, 1, "(),(),(),()->(3)",
+          "Get the magnetic field from a snapshot" },
+        { "enu_from_ecef", enu_from_ecef_loops, plain_data, types_4to1, 4,
+          1, "(),(),(),(3)->(3)",
+          "Express ECEF positions in the local ENU frame of an observer" },
+        { "ecef_from_enu", ecef_from_enu_loops, plain_data, types_4to1, 4,
+          1, "(),(),(),(3)->(3)",
+          "Express positions in the local ENU frame of an observer as ECEF" },
+        { "horizontal_from_geodetic", horizontal_from_geodetic_loops,
+          plain_data, types_6to3, 6, 3, "(),(),(),(),(),()->(),(),()",
+          "Get the direction and distance between geodetic locations" }
+};
+
+/* Bind a library function to its address */
+static PyObject * bind(PyObject * self, PyObject * args)
+{
+        const char * name;
+        unsigned long long address;
+        if (!PyArg_ParseTuple(args, "sK", &name, &address))
+                return NULL;
+
+        size_t i;
+        for (i = 0; i < sizeof(symbols) / sizeof(*symbols); i++) {
+                if (strcmp(name, symbols[i].name) == 0) {
+                        void * function = (void *)(uintptr_t)address;
+                        memcpy(symbols[i].slot, &function, sizeof(function));
+                        Py_RETURN_NONE;
+                }
+        }
+
+        PyErr_Format(PyExc_KeyError, "unknown library function %s", name);
+        return NULL;
+}
+
+/* Get and reset the first library error met by the calling thread */
+static PyObject * error(PyObject * self, PyObject * args)
+{
+        const int rc = last_error;
+        last_error = 0;
+        return PyLong_FromLong(rc);
+}
+
+static PyMethodDef methods[] = {
+        { "bind", bind, METH_VARARGS,
+          "Bind a library function to its address" },
+        { "error", error, METH_NOARGS,
+          "Get and reset the first library error met by the calling thread" },
+        { NULL, NULL, 0, NULL }
+};
+
+static struct PyModuleDef module = {
+        PyModuleDef_HEAD_INIT, "_ufunc",
+        "NumPy ufuncs for the TURTLE and GULL libraries", -1, methods
+};
+
+PyMODINIT_FUNC PyInit__ufunc(void)
+{
+        PyObject * m = PyModule_Create(&module);
+        if (m == NULL)
+                return NULL;
+
+        import_array();
+        import_umath();
+
+        size_t i;
+        for (i = 0; i < sizeof(ufuncs) / sizeof(*ufuncs); i++) {
+                PyObject * f = PyUFunc_FromFuncAndDataAndSignature(
+                    ufuncs[i].loops, ufuncs[i].data, ufuncs[i].types, 2,
+                    ufuncs[i].nin, ufuncs[i].nout, PyUFunc_None,
+                    ufuncs[i].name, ufuncs[i].doc, 0, ufuncs[i].signature);
+                if ((f == NULL) ||
+                    (PyModule_AddObject(m, ufuncs[i].name, f) != 0)) {
+                        Py_XDECREF(f);
+                        Py_DECREF(m);
+                        return NULL;
+                }
+        }
+
+        return m;
+}
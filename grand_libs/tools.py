@@ -18,16 +18,26 @@ You should have received a copy of the GNU Lesser General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>
 """
 
+import collections
+import concurrent.futures
 import contextlib
+import ctypes
+import hashlib
 import json
 import os
 import sys
 import tempfile
+import threading
+import weakref
 from distutils.command.install import install
+
+import numpy
+
 from grand_pkg import git
 from . import LIBDIR
 
-__all__ = ["Meta", "Temporary", "define"]
+__all__ = ["Cache", "Library", "Meta", "Pool", "Symbol", "Temporary",
+           "checksum", "define", "output", "releases_gil", "shard"]
 
 
 @contextlib.contextmanager
@@ -83,32 +93,326 @@ class Meta:
             json.dump(self._meta, f)
 
 
+def checksum(paths):
+    """Get the SHA-1 checksum of a set of source files
+
+    Parameters
+    ----------
+    paths : iterable of str
+        The paths to the source files
+
+    Returns
+    -------
+    str
+        The hexadecimal digest of the files content, in the given order
+    """
+    sha1 = hashlib.sha1()
+    for path in paths:
+        with open(path, "rb") as f:
+            sha1.update(f.read())
+    return sha1.hexdigest()
+
+
+class Library:
+    """Shared library, installed and loaded on first use"""
+
+    def __init__(self, path, install=None, initialise=None):
+        """Declare a shared library, without loading it
+
+        Parameters
+        ----------
+        path : str
+            The path to the library object
+        install : callable, optional
+            Idempotent installer of the library, called before loading it
+        initialise : callable, optional
+            Hook called once the library has been loaded
+        """
+        self._path, self._install = path, install
+        self._initialise, self._handle = initialise, None
+        self._ready, self._lock = False, threading.RLock()
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return Symbol(self, name)
+
+    def load(self):
+        """Get the library handle, installing and loading it if needed"""
+        if self._ready:
+            return self._handle
+
+        with self._lock:
+            if self._handle is None:
+                if self._install is not None:
+                    self._install()
+                self._handle = ctypes.cdll.LoadLibrary(self._path)
+                if self._initialise is not None:
+                    self._initialise()
+                self._ready = True
+            return self._handle
+
+    @property
+    def loaded(self):
+        """Flag telling if the library has been loaded"""
+        return self._ready
+
+
+class Symbol:
+    """Function of a `Library`, resolved on first use"""
+
+    def __init__(self, library, name):
+        self._library, self._name = library, name
+        self._function, self._setup, self._wrappers = None, None, []
+
+    def __call__(self, *args):
+        return self.resolve()(*args)
+
+    def resolve(self):
+        """Get the `ctypes` function, loading the library if needed"""
+        if self._function is None:
+            function = getattr(self._library.load(), self._name)
+            if self._setup is not None:
+                self._setup(function)
+            for wrapper in self._wrappers:
+                wrapper.__wrapped__ = function
+            self._function = function
+        return self._function
+
+    @property
+    def _flags_(self):
+        return self.resolve()._flags_
+
+
 def define(source, arguments=None, result=None, exception=None):
-    """Decorator for defining wrapped library functions"""
+    """Decorator for defining wrapped library functions
+
+    The source function must be loaded from a `ctypes.CDLL` library, e.g.
+    with `ctypes.cdll.LoadLibrary`. Then the GIL is released for the whole
+    duration of the C call, such that vectorized library functions can run
+    concurrently from several Python threads. The source can also be a
+    `Symbol` of a `Library`. Its prototype is then set on first use.
+    """
+
+    def setup(function):
+        if not releases_gil(function):
+            raise ValueError("library function would hold the GIL")
+
+        # Set the C prototype
+        if arguments:
+            function.argtypes = arguments
+        if result:
+            function.restype = result
 
-    # Set the C prototype
-    if arguments:
-        source.argtypes = arguments
-    if result:
-        source.restype = result
+    if isinstance(source, Symbol):
+        source._setup = setup
+    else:
+        setup(source)
 
     def decorator(function):
-        # Return the (wrapped) function
+        # Return the (wrapped) function. Wrappers call their __wrapped__
+        # attribute, which is replaced by the ctypes function once a lazy
+        # symbol is resolved
         if exception is not None:
             def wrapped(*args):
                 """Wrapper for library functions with error check"""
-                r = source(*args)
+                r = wrapped.__wrapped__(*args)
                 if r != 0:
                     raise exception(r)
                 else:
                     return r
-
-            return wrapped
         else:
             def wrapped(*args):
                 """Wrapper for library functions without error check"""
-                return source(*args)
+                return wrapped.__wrapped__(*args)
 
-            return wrapped
+        wrapped.__wrapped__ = source
+        if isinstance(source, Symbol):
+            source._wrappers.append(wrapped)
+        return wrapped
 
     return decorator
+
+
+def output(out, shape, pointer):
+    """Get a buffer for the output of a vectorized library function
+
+    Parameters
+    ----------
+    out : numpy.ndarray or None
+        A preallocated buffer, or None in order to allocate a new one
+    shape : int or tuple of int
+        The shape of the output
+    pointer : type
+        The `numpy.ctypeslib.ndpointer` type of the output argument
+
+    Returns
+    -------
+    numpy.ndarray
+        The output buffer
+
+    Raises
+    ------
+    TypeError
+        The buffer does not comply with the pointer type, e.g. if it is not
+        contiguous
+    ValueError
+        The buffer size does not match the output shape
+    """
+    if out is None:
+        return numpy.empty(shape, pointer._dtype_)
+
+    pointer.from_param(out)
+    if out.size != numpy.prod(shape, dtype=int):
+        raise ValueError(f"out must have shape {shape}")
+    return out
+
+
+def releases_gil(function):
+    """Check if a (wrapped) library function runs without holding the GIL
+
+    Parameters
+    ----------
+    function : callable
+        A ctypes foreign function, or a wrapper defined with `define`
+
+    Returns
+    -------
+    bool
+        True if the GIL is released during the C call
+    """
+    source = getattr(function, "__wrapped__", function)
+    return not (source._flags_ & ctypes._FUNCFLAG_PYTHONAPI)
+
+
+class Pool:
+    """Pool of library objects leased to concurrent callers"""
+
+    def __init__(self, create, destroy):
+        """Initialise an empty pool
+
+        Parameters
+        ----------
+        create : callable
+            Factory for new library objects
+        destroy : callable
+            Finaliser for library objects
+        """
+        self._create, self._destroy = create, destroy
+        self._idle, self._lock = [], threading.Lock()
+
+    def acquire(self):
+        """Take an object from the pool, creating it if none is idle"""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._create()
+
+    def release(self, item):
+        """Give an object back to the pool"""
+        with self._lock:
+            self._idle.append(item)
+
+    @contextlib.contextmanager
+    def lease(self):
+        """Lease an object from the pool, creating it if none is idle"""
+        item = self.acquire()
+        try:
+            yield item
+        finally:
+            self.release(item)
+
+    def clear(self):
+        """Destroy all idle objects"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for item in idle:
+            self._destroy(item)
+
+
+class Cache:
+    """Cache of library objects, keyed by their construction parameters
+
+    Objects are referenced weakly, such that a cached object is shared as
+    long as it is alive somewhere. The most recently requested objects are
+    also kept alive by the cache, up to a bounded number of them.
+    """
+
+    def __init__(self, create, size=16):
+        """Initialise an empty cache
+
+        Parameters
+        ----------
+        create : callable
+            Factory for new library objects, called with the cache key as
+            arguments
+        size : int, optional
+            The maximum number of objects kept alive by the cache
+        """
+        self._create, self._size = create, size
+        self._objects = weakref.WeakValueDictionary()
+        self._recent = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._objects)
+
+    def get(self, *key):
+        """Get the object for a key, creating it if not cached"""
+        with self._lock:
+            item = self._objects.get(key)
+            if item is not None:
+                self._keep(key, item)
+                return item
+
+        # Objects are created without holding the lock. A concurrent
+        # creation of the same object is resolved in favour of the first one
+        item = self._create(*key)
+        with self._lock:
+            item = self._objects.setdefault(key, item)
+            self._keep(key, item)
+        return item
+
+    def _keep(self, key, item):
+        """Keep an object alive, evicting the least recently used one(s)"""
+        self._recent[key] = item
+        self._recent.move_to_end(key)
+        while len(self._recent) > self._size:
+            self._recent.popitem(last=False)
+
+    def clear(self):
+        """Release all objects held by the cache"""
+        with self._lock:
+            self._objects.clear()
+            self._recent.clear()
+
+    @property
+    def size(self):
+        """The maximum number of objects kept alive by the cache"""
+        return self._size
+
+
+def shard(function, size, workers=None):
+    """Apply a function over contiguous slices of a batch, using threads
+
+    Parameters
+    ----------
+    function : callable
+        The function to apply. It is called with a `slice` of the batch
+    size : int
+        The batch size
+    workers : int, optional
+        The number of threads to use. By default the function is applied
+        once over the full batch, in the calling thread
+    """
+    if (workers is None) or (workers <= 1) or (size <= 1):
+        function(slice(0, size))
+        return
+
+    workers = min(workers, size)
+    bounds = [(i * size) // workers for i in range(workers + 1)]
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        futures = [executor.submit(function, slice(start, stop))
+                   for start, stop in zip(bounds[:-1], bounds[1:])]
+        for future in futures:
+            future.result()
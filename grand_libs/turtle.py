@@ -18,21 +18,29 @@ You should have received a copy of the GNU Lesser General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>
 """
 
+import collections
+import concurrent.futures
 import ctypes
+import functools
 import glob
+import math
 import os
 import shutil
 import subprocess
+import threading
+import time
 
 import numpy
 
-from . import LIBDIR, SRCDIR
-from .tools import Meta, Temporary, define
+from . import LIBDIR, SRCDIR, grid, ufunc
+from .tools import Cache, Library, Meta, Pool, Temporary, checksum, define, \
+                   output, shard
 
 
-__all__ = ["LIBNAME", "LIBPATH", "LIBHASH", "LibraryError", "Map", "Stack",
-           "ecef_from_geodetic", "ecef_from_horizontal", "ecef_to_geodetic",
-           "ecef_to_horizontal"]
+__all__ = ["GEODETIC", "LIBNAME", "LIBPATH", "LIBHASH", "LibraryError", "Map",
+           "RegionalGrid", "Stack", "ecef_from_enu", "ecef_from_geodetic",
+           "ecef_from_horizontal", "ecef_to_geodetic", "ecef_to_horizontal",
+           "convert", "enu_from_ecef", "horizontal_from_geodetic", "install"]
 
 
 LIBNAME = "libturtle.so"
@@ -47,12 +55,23 @@ LIBHASH = "7436e40aaa97fe719f6a0b6d823690986cedd3dc"
 """The git hash of the library"""
 
 
-def _install():
-    """Install the TURTLE library to the top package location"""
+GEODETIC = numpy.dtype([("latitude", float), ("longitude", float),
+                        ("altitude", float)])
+"""Structured data type for geodetic coordinates"""
+
+
+def install():
+    """Install the TURTLE library to the top package location
+
+    The library is only rebuilt if its version, or the source of its
+    extensions, changed. It is otherwise installed on first use.
+    """
 
     # Check for an existing install
     meta = Meta("turtle")
-    if meta["LIBHASH"] == LIBHASH:
+    sources = sorted(glob.glob(f"{SRCDIR}/turtle/*.c"))
+    srchash = checksum(sources)
+    if (meta["LIBHASH"] == LIBHASH) and (meta["SRCHASH"] == srchash):
         return
 
     def system(command):
@@ -61,7 +80,7 @@ def _install():
     # Install the library with its vectorization binding
     with Temporary("https://github.com/niess/turtle", LIBHASH) as _:
         # Extend the source with vectorization
-        for path in glob.glob(f"{SRCDIR}/turtle/*.c"):
+        for path in sources:
             target = f"src/turtle/{os.path.basename(path)}"
             system(f"cat {target} {path} > tmp.c")
             system(f"mv tmp.c {target}")
@@ -77,15 +96,12 @@ def _install():
 
     # Dump the meta data
     meta["LIBHASH"] = LIBHASH
+    meta["SRCHASH"] = srchash
     meta.update()
 
 
-# Install the library on import, if needed
-_install()
-
-
-_lib = ctypes.cdll.LoadLibrary(LIBPATH)
-"""Proxy for the TURTLE library"""
+_lib = Library(LIBPATH, install, lambda: _error_set_trap())
+"""Proxy for the TURTLE library, installed and loaded on first use"""
 
 
 # Set the trap for TURTLE errors
@@ -99,8 +115,6 @@ def _error_get_last():
     """Get the last TURTLE error"""
     pass
 
-_error_set_trap()
-
 
 class LibraryError(RuntimeError):
     """A TURTLE library error"""
@@ -176,11 +190,43 @@ def _stack_destroy(stack):
 
 @define (_lib.turtle_stack_elevation_v,
          arguments = (ctypes.c_void_p, _CST_DBL_P, _CST_DBL_P, _DBL_P,
-                      numpy.ctypeslib.c_intp))
+                      numpy.ctypeslib.c_intp),
+         result = ctypes.c_int,
+         exception = LibraryError)
 def _stack_elevation(latitude, longitude, elevation, size):
     """Get the topography elevation from a stack of maps"""
     pass
 
+@functools.lru_cache(maxsize=None)
+def _stack_mutex():
+    """Get the lock and unlock callbacks for thread safe stacks"""
+    lib = _lib.load()
+    return (ctypes.cast(lib.turtle_stack_mutex_lock, ctypes.c_void_p),
+            ctypes.cast(lib.turtle_stack_mutex_unlock, ctypes.c_void_p))
+
+@define (_lib.turtle_client_create,
+         arguments = (ctypes.POINTER(ctypes.c_void_p), ctypes.c_void_p),
+         result = ctypes.c_int,
+         exception = LibraryError)
+def _client_create(client, stack):
+    """Create a new client for a thread safe stack"""
+    pass
+
+@define (_lib.turtle_client_destroy,
+         arguments=(ctypes.POINTER(ctypes.c_void_p),))
+def _client_destroy(client):
+    """Destroy a stack client"""
+    pass
+
+@define (_lib.turtle_client_elevation_v,
+         arguments = (ctypes.c_void_p, _CST_DBL_P, _CST_DBL_P, _DBL_P,
+                      numpy.ctypeslib.c_intp),
+         result = ctypes.c_int,
+         exception = LibraryError)
+def _client_elevation(client, latitude, longitude, elevation, size):
+    """Get the topography elevation using a stack client"""
+    pass
+
 @define (_lib.turtle_map_load,
          arguments = (ctypes.POINTER(ctypes.c_void_p), ctypes.c_char_p),
          result = ctypes.c_int,
@@ -202,6 +248,232 @@ def _map_elevation(latitude, x, y, size):
     """Get the topography elevation from a map"""
     pass
 
+class _MapInfo(ctypes.Structure):
+    """C structure for map meta data"""
+    _fields_ = (("nx", ctypes.c_int), ("ny", ctypes.c_int),
+                ("x", ctypes.c_double * 2), ("y", ctypes.c_double * 2),
+                ("z", ctypes.c_double * 2), ("encoding", ctypes.c_char_p))
+
+@define (_lib.turtle_map_meta,
+         arguments = (ctypes.c_void_p, ctypes.POINTER(_MapInfo),
+                      ctypes.POINTER(ctypes.c_char_p)),
+         result = ctypes.c_int,
+         exception = LibraryError)
+def _map_meta(map, info, projection):
+    """Get the meta data of a map"""
+    pass
+
+@define (_lib.turtle_map_projection,
+         arguments = (ctypes.c_void_p,),
+         result = ctypes.c_void_p)
+def _map_projection(map):
+    """Get the projection of a map"""
+    pass
+
+@define (_lib.turtle_map_elevation_geodetic_v,
+         arguments = (ctypes.c_void_p, ctypes.c_void_p, _CST_DBL_P,
+                      _CST_DBL_P, _DBL_P, numpy.ctypeslib.c_intp))
+def _map_elevation_geodetic(map, projection, latitude, longitude, elevation,
+                            size):
+    """Get the topography elevation from a map, at geodetic coordinates"""
+    pass
+
+@define (_lib.turtle_projection_create,
+         arguments = (ctypes.POINTER(ctypes.c_void_p), ctypes.c_char_p),
+         result = ctypes.c_int,
+         exception = LibraryError)
+def _projection_create(projection, name):
+    """Create a new projection object"""
+    pass
+
+@define (_lib.turtle_projection_destroy,
+         arguments=(ctypes.POINTER(ctypes.c_void_p),))
+def _projection_destroy(projection):
+    """Destroy a projection object"""
+    pass
+
+@define (_lib.turtle_projection_project_v,
+         arguments = (ctypes.c_void_p, _CST_DBL_P, _CST_DBL_P, _DBL_P, _DBL_P,
+                      numpy.ctypeslib.c_intp))
+def _projection_project(projection, latitude, longitude, x, y, size):
+    """Project geodetic coordinates to map ones"""
+    pass
+
+@define (_lib.turtle_projection_unproject_v,
+         arguments = (ctypes.c_void_p, _CST_DBL_P, _CST_DBL_P, _DBL_P, _DBL_P,
+                      numpy.ctypeslib.c_intp))
+def _projection_unproject(projection, x, y, latitude, longitude, size):
+    """Unproject map coordinates to geodetic ones"""
+    pass
+
+class _Grid(ctypes.Structure):
+    """C descriptor of a raw grid"""
+    _fields_ = (("data", ctypes.c_void_p), ("type", ctypes.c_int),
+                ("nx", ctypes.c_int), ("ny", ctypes.c_int),
+                ("x0", ctypes.c_double), ("y0", ctypes.c_double),
+                ("dx", ctypes.c_double), ("dy", ctypes.c_double),
+                ("scale", ctypes.c_double), ("offset", ctypes.c_double))
+
+@define (_lib.turtle_grid_elevation_v,
+         arguments = (ctypes.POINTER(_Grid), _CST_DBL_P, _CST_DBL_P, _DBL_P,
+                      numpy.ctypeslib.c_intp))
+def _grid_elevation(grid, x, y, elevation, size):
+    """Get the topography elevation from a raw grid"""
+    pass
+
+_C_DBL3 = ctypes.c_double * 3
+_C_DBL_P = ctypes.POINTER(ctypes.c_double)
+_C_INT_P = ctypes.POINTER(ctypes.c_int)
+
+@define (_lib.turtle_ecef_from_geodetic,
+         arguments = (ctypes.c_double, ctypes.c_double, ctypes.c_double,
+                      _C_DBL_P))
+def _ecef_from_geodetic_s(latitude, longitude, altitude, ecef):
+    """Convert a geodetic position to ECEF coordinates"""
+    pass
+
+@define (_lib.turtle_ecef_from_horizontal,
+         arguments = (ctypes.c_double, ctypes.c_double, ctypes.c_double,
+                      ctypes.c_double, _C_DBL_P))
+def _ecef_from_horizontal_s(latitude, longitude, azimuth, elevation,
+                            direction):
+    """Convert horizontal angles to an ECEF direction"""
+    pass
+
+@define (_lib.turtle_ecef_to_geodetic,
+         arguments = (_C_DBL_P, _C_DBL_P, _C_DBL_P, _C_DBL_P))
+def _ecef_to_geodetic_s(ecef, latitude, longitude, altitude):
+    """Convert an ECEF position to geodetic coordinates"""
+    pass
+
+@define (_lib.turtle_ecef_to_horizontal,
+         arguments = (ctypes.c_double, ctypes.c_double, _C_DBL_P, _C_DBL_P,
+                      _C_DBL_P))
+def _ecef_to_horizontal_s(latitude, longitude, direction, azimuth,
+                          elevation):
+    """Convert an ECEF direction to horizontal angles"""
+    pass
+
+@define (_lib.turtle_stack_elevation,
+         arguments = (ctypes.c_void_p, ctypes.c_double, ctypes.c_double,
+                      _C_DBL_P, _C_INT_P),
+         result = ctypes.c_int,
+         exception = LibraryError)
+def _stack_elevation_s(stack, latitude, longitude, elevation, inside):
+    """Get the topography elevation at a single point of a stack"""
+    pass
+
+@define (_lib.turtle_client_elevation,
+         arguments = (ctypes.c_void_p, ctypes.c_double, ctypes.c_double,
+                      _C_DBL_P, _C_INT_P),
+         result = ctypes.c_int,
+         exception = LibraryError)
+def _client_elevation_s(client, latitude, longitude, elevation, inside):
+    """Get the topography elevation at a single point using a client"""
+    pass
+
+@define (_lib.turtle_map_elevation,
+         arguments = (ctypes.c_void_p, ctypes.c_double, ctypes.c_double,
+                      _C_DBL_P, _C_INT_P),
+         result = ctypes.c_int,
+         exception = LibraryError)
+def _map_elevation_s(map, x, y, elevation, inside):
+    """Get the topography elevation at a single point of a map"""
+    pass
+
+@define (_lib.turtle_grid_elevation,
+         arguments = (ctypes.POINTER(_Grid), ctypes.c_double, ctypes.c_double,
+                      _C_DBL_P, _C_INT_P),
+         result = ctypes.c_int)
+def _grid_elevation_s(grid, x, y, elevation, inside):
+    """Get the topography elevation at a single point of a raw grid"""
+    pass
+
+@define (_lib.turtle_projection_project,
+         arguments = (ctypes.c_void_p, ctypes.c_double, ctypes.c_double,
+                      _C_DBL_P, _C_DBL_P),
+         result = ctypes.c_int)
+def _projection_project_s(projection, latitude, longitude, x, y):
+    """Project a single geodetic position to map coordinates"""
+    pass
+
+@define (_lib.turtle_projection_unproject,
+         arguments = (ctypes.c_void_p, ctypes.c_double, ctypes.c_double,
+                      _C_DBL_P, _C_DBL_P),
+         result = ctypes.c_int)
+def _projection_unproject_s(projection, x, y, latitude, longitude):
+    """Unproject a single map position to geodetic coordinates"""
+    pass
+
+
+_ufunc = ufunc.Binding(_lib, ("turtle_ecef_from_geodetic",
+    "turtle_ecef_from_horizontal", "turtle_ecef_to_geodetic",
+    "turtle_ecef_to_horizontal", "turtle_map_elevation",
+    "turtle_stack_elevation", "turtle_client_elevation",
+    "turtle_grid_elevation", "turtle_projection_project",
+    "turtle_projection_unproject"))
+"""Compiled ufuncs for the TURTLE library, false if not available"""
+
+
+def _new_client(stack):
+    """Create a new client for a thread safe stack"""
+    client = ctypes.c_void_p(None)
+    _client_create(ctypes.byref(client), stack)
+    return client
+
+
+def _delete_client(client):
+    """Destroy a stack client"""
+    _client_destroy(ctypes.byref(client))
+
+
+def _scalar(*args):
+    """Check if all arguments are Python scalars"""
+    for a in args:
+        if not isinstance(a, (float, int)):
+            return False
+    return True
+
+
+def _vector(a):
+    """Check if an argument is a sequence of 3 Python scalars"""
+    return isinstance(a, (tuple, list)) and (len(a) == 3) and _scalar(*a)
+
+
+def _handle(pointer):
+    """Get the address of a library object as a ufunc operand"""
+    return numpy.uintp(pointer.value)
+
+
+def _checked(function, *args, **kwargs):
+    """Call a compiled ufunc, raising the first library error it met"""
+    _ufunc.error()
+    result = function(*args, **kwargs)
+    code = _ufunc.error()
+    if code != 0:
+        raise LibraryError(code)
+    return result
+
+
+def _squeeze_vector(a):
+    """Reduce a single 3-vector result to a flat array"""
+    return a.reshape(3) if a.size == 3 else a
+
+
+def _squeeze_scalar(a):
+    """Reduce a single scalar result to a numpy scalar"""
+    return a.reshape(-1)[0] if a.size == 1 else a
+
+
+def _unpack(geodetic):
+    """Split packed geodetic coordinates into views of their components"""
+    geodetic = numpy.asanyarray(geodetic)
+    if geodetic.dtype.names is not None:
+        return tuple(geodetic[name] for name in GEODETIC.names)
+    elif geodetic.shape[-1:] != (3,):
+        raise ValueError("geodetic coordinates must be n x 3")
+    return tuple(geodetic[..., i] for i in range(3))
+
 
 def _regularize(a):
     """Regularize an array (or float) input"""
@@ -209,8 +481,47 @@ def _regularize(a):
     return numpy.require(a, float, ["CONTIGUOUS", "ALIGNED"])
 
 
-def ecef_from_geodetic(latitude, longitude, altitude):
-    """Convert geodetic coordinates to ECEF ones"""
+def ecef_from_geodetic(latitude, longitude=None, altitude=None, out=None):
+    """Convert geodetic coordinates to ECEF ones
+
+    The geodetic coordinates can also be provided packed as a single
+    argument, either as a n x 3 array or as a `GEODETIC` structured array.
+    Packed coordinates are read in place.
+
+    Parameters
+    ----------
+    latitude : float or array_like
+        The geodetic latitude(s), in deg, or the packed geodetic coordinates
+    longitude : float or array_like, optional
+        The geodetic longitude(s), in deg
+    altitude : float or array_like, optional
+        The altitude(s) above the ellipsoid, in m
+    out : numpy.ndarray, optional
+        A buffer of floats where to store the result
+
+    Returns
+    -------
+    numpy.ndarray
+        The ECEF coordinates, in m
+    """
+
+    if (longitude is None) and (altitude is None):
+        if (out is None) and _vector(latitude):
+            latitude, longitude, altitude = latitude
+        else:
+            latitude, longitude, altitude = _unpack(latitude)
+    elif (longitude is None) or (altitude is None):
+        raise ValueError("missing longitude or altitude")
+
+    if (out is None) and _scalar(latitude, longitude, altitude):
+        ecef = _C_DBL3()
+        _ecef_from_geodetic_s(latitude, longitude, altitude, ecef)
+        return numpy.frombuffer(ecef)
+
+    if _ufunc:
+        ecef = _ufunc.ecef_from_geodetic(latitude, longitude, altitude,
+                                         out=out)
+        return ecef if out is not None else _squeeze_vector(ecef)
 
     latitude, longitude, altitude = map(_regularize, (latitude, longitude,
                                                       altitude))
@@ -220,16 +531,46 @@ def ecef_from_geodetic(latitude, longitude, altitude):
         raise ValueError("latitude and altitude must have the same size")
 
     if latitude.size == 1:
-        ecef = numpy.zeros(3)
+        ecef = output(out, 3, _DBL_P)
     else:
-        ecef = numpy.zeros((latitude.size, 3))
+        ecef = output(out, (latitude.size, 3), _DBL_P)
 
     _ecef_from_geodetic(latitude, longitude, altitude, ecef, latitude.size)
     return ecef
 
 
-def ecef_from_horizontal(latitude, longitude, azimuth, elevation):
-    """Convert horizontal coordinates to an ECEF direction"""
+def ecef_from_horizontal(latitude, longitude, azimuth, elevation, out=None):
+    """Convert horizontal coordinates to an ECEF direction
+
+    Parameters
+    ----------
+    latitude : float or array_like
+        The geodetic latitude(s) of the observer, in deg
+    longitude : float or array_like
+        The geodetic longitude(s) of the observer, in deg
+    azimuth : float or array_like
+        The azimuth angle(s), in deg
+    elevation : float or array_like
+        The elevation angle(s), in deg
+    out : numpy.ndarray, optional
+        A buffer of floats where to store the result
+
+    Returns
+    -------
+    numpy.ndarray
+        The ECEF direction(s)
+    """
+
+    if (out is None) and _scalar(latitude, longitude, azimuth, elevation):
+        direction = _C_DBL3()
+        _ecef_from_horizontal_s(latitude, longitude, azimuth, elevation,
+                                direction)
+        return numpy.frombuffer(direction)
+
+    if _ufunc:
+        direction = _ufunc.ecef_from_horizontal(latitude, longitude, azimuth,
+                                                elevation, out=out)
+        return direction if out is not None else _squeeze_vector(direction)
 
     latitude, longitude, azimuth, elevation = map(_regularize,
         (latitude, longitude, azimuth, elevation))
@@ -241,40 +582,125 @@ def ecef_from_horizontal(latitude, longitude, azimuth, elevation):
         raise ValueError("latitude and elevation must have the same size")
 
     if latitude.size == 1:
-        direction = numpy.zeros(3)
+        direction = output(out, 3, _DBL_P)
     else:
-        direction = numpy.zeros((latitude.size, 3))
+        direction = output(out, (latitude.size, 3), _DBL_P)
 
     _ecef_from_horizontal(
         latitude, longitude, azimuth, elevation, direction, latitude.size)
     return direction
 
 
-def ecef_to_geodetic(ecef):
-    """Convert ECEF coordinates to geodetic ones"""
+def ecef_to_geodetic(ecef, out=None, layout=None):
+    """Convert ECEF coordinates to geodetic ones
+
+    By default the geodetic coordinates are returned as separate arrays.
+    They can instead be packed in a single array, as n x 3 floats with
+    `layout="stacked"` or as `GEODETIC` records with `layout="structured"`.
+    Packed coordinates are written in place.
+
+    Parameters
+    ----------
+    ecef : array_like
+        The ECEF coordinates, in m, as a 3-vector or a n x 3 array
+    out : tuple of numpy.ndarray or numpy.ndarray, optional
+        Buffers of floats where to store the latitude, longitude and
+        altitude, or a single buffer for packed coordinates
+    layout : str, optional
+        The layout of packed coordinates, "stacked" or "structured"
+
+    Returns
+    -------
+    tuple or numpy.ndarray
+        The geodetic latitude(s) and longitude(s), in deg, and the
+        altitude(s), in m, or the packed coordinates
+    """
+
+    if layout is not None:
+        if layout not in ("stacked", "structured"):
+            raise ValueError(f"bad layout ({layout})")
+        if out is None:
+            shape = numpy.shape(ecef)[:-1]
+            if layout == "stacked":
+                out = numpy.empty(shape + (3,))
+            else:
+                out = numpy.empty(shape, GEODETIC)
+        components = _unpack(out)
+
+        if _ufunc:
+            _ufunc.ecef_to_geodetic(ecef, out=components)
+        else:
+            for component, value in zip(components, ecef_to_geodetic(ecef)):
+                component[...] = value
+        return out
+
+    if (out is None) and _vector(ecef):
+        latitude, longitude, altitude = (ctypes.c_double() for _ in range(3))
+        _ecef_to_geodetic_s(_C_DBL3(*ecef), latitude, longitude, altitude)
+        return latitude.value, longitude.value, altitude.value
+
+    if _ufunc:
+        if (out is not None) and (len(out) != 3):
+            raise ValueError("out must contain 3 buffers")
+        if out is not None:
+            return _ufunc.ecef_to_geodetic(ecef, out=tuple(out))
+        geodetic = _ufunc.ecef_to_geodetic(ecef)
+        return tuple(map(_squeeze_scalar, geodetic))
 
     ecef = _regularize(ecef)
     if (ecef.size < 3) or ((ecef.size % 3) != 0):
         raise ValueError("ecef coordinates must be n x 3")
 
     n = int(ecef.size / 3)
-    if n == 1:
-        set0 = lambda x:numpy.zeros(1)
-        latitude, longitude, altitude = map(set0, range(3)) 
-    else:
-        set0 = lambda x: numpy.zeros(n)
-        latitude, longitude, altitude = map(set0, range(3))
+    if out is None:
+        out = (None, None, None)
+    elif len(out) != 3:
+        raise ValueError("out must contain 3 buffers")
+    latitude, longitude, altitude = (output(o, n, _DBL_P) for o in out)
 
-    _ecef_to_geodetic(ecef, latitude, longitude, altitude, latitude.size)
+    _ecef_to_geodetic(ecef, latitude, longitude, altitude, n)
 
-    if n == 1:
+    if (n == 1) and (out[0] is None):
         return latitude[0], longitude[0], altitude[0]
     else:
         return latitude, longitude, altitude
 
 
-def ecef_to_horizontal(latitude, longitude, direction):
-    """Convert an ECEF direction to horizontal coordinates"""
+def ecef_to_horizontal(latitude, longitude, direction, out=None):
+    """Convert an ECEF direction to horizontal coordinates
+
+    Parameters
+    ----------
+    latitude : float or array_like
+        The geodetic latitude(s) of the observer, in deg
+    longitude : float or array_like
+        The geodetic longitude(s) of the observer, in deg
+    direction : array_like
+        The ECEF direction(s), as a 3-vector or a n x 3 array
+    out : tuple of numpy.ndarray, optional
+        Buffers of floats where to store the azimuth and elevation
+
+    Returns
+    -------
+    tuple
+        The azimuth and elevation angle(s), in deg
+    """
+
+    if (out is None) and _scalar(latitude, longitude) and _vector(direction):
+        azimuth, elevation = ctypes.c_double(), ctypes.c_double()
+        _ecef_to_horizontal_s(latitude, longitude, _C_DBL3(*direction),
+                              azimuth, elevation)
+        return azimuth.value, elevation.value
+
+    if _ufunc:
+        if (out is not None) and (len(out) != 2):
+            raise ValueError("out must contain 2 buffers")
+        if out is not None:
+            return _ufunc.ecef_to_horizontal(latitude, longitude, direction,
+                                             out=tuple(out))
+        horizontal = _ufunc.ecef_to_horizontal(latitude, longitude,
+                                               direction)
+        return tuple(map(_squeeze_scalar, horizontal))
 
     latitude, longitude, direction = map(_regularize, (latitude, longitude,
                                                        direction))
@@ -286,39 +712,556 @@ def ecef_to_horizontal(latitude, longitude, direction):
     if latitude.size != n:
         raise ValueError("latitude and direction must have consistent shapes")
 
-    if n == 1:
-        set0 = lambda x:numpy.zeros(1)
-        azimuth, elevation = map(set0, range(2))
-    else:
-        set0 = lambda x: numpy.zeros(n)
-        azimuth, elevation = map(set0, range(2))
+    if out is None:
+        out = (None, None)
+    elif len(out) != 2:
+        raise ValueError("out must contain 2 buffers")
+    azimuth, elevation = (output(o, n, _DBL_P) for o in out)
 
     _ecef_to_horizontal(
         latitude, longitude, direction, azimuth, elevation, latitude.size)
 
-    if n == 1:
-        return azimuth[0], elevation[0] if n == 1 else azimuth, elevation
+    if (n == 1) and (out[0] is None):
+        return azimuth[0], elevation[0]
     else:
         return azimuth, elevation
 
 
+def _enu_basis(latitude, longitude):
+    """Get the local East, North, Upward basis at geodetic locations"""
+    latitude, longitude = numpy.radians(latitude), numpy.radians(longitude)
+    sl, cl = numpy.sin(latitude), numpy.cos(latitude)
+    so, co = numpy.sin(longitude), numpy.cos(longitude)
+    return (numpy.stack((-so, co, numpy.zeros_like(so)), axis=-1),
+            numpy.stack((-sl * co, -sl * so, cl), axis=-1),
+            numpy.stack((cl * co, cl * so, sl), axis=-1))
+
+
+def _enu_from_ecef(observer, ecef):
+    """Express ECEF positions in a local ENU frame, without ufuncs"""
+    latitude, longitude, altitude = observer
+    origin = ecef_from_geodetic(latitude, longitude, altitude)
+    r = numpy.asanyarray(ecef, float) - origin
+    return numpy.stack([numpy.sum(b * r, axis=-1)
+                        for b in _enu_basis(latitude, longitude)], axis=-1)
+
+
+def enu_from_ecef(observer, ecef, out=None):
+    """Express ECEF positions in the local ENU frame of observer(s)
+
+    The East, North, Upward (ENU) frame is centred on the observer, with its
+    upward axis along the normal to the ellipsoid.
+
+    Parameters
+    ----------
+    observer : array_like
+        The packed geodetic coordinates of the observer(s), as a 3-sequence,
+        a n x 3 array or a `GEODETIC` structured array
+    ecef : array_like
+        The ECEF position(s), in m, as a 3-vector or a n x 3 array
+    out : numpy.ndarray, optional
+        A buffer of floats where to store the result
+
+    Returns
+    -------
+    numpy.ndarray
+        The ENU coordinates, in m
+    """
+    observer = _unpack(observer)
+
+    if _ufunc:
+        enu = _ufunc.enu_from_ecef(*observer, ecef, out=out)
+        return enu if out is not None else _squeeze_vector(enu)
+
+    enu = _enu_from_ecef(observer, ecef)
+    if out is not None:
+        out[...] = enu
+        return out
+    return enu
+
+
+def ecef_from_enu(observer, enu, out=None):
+    """Express positions in the local ENU frame of observer(s) as ECEF
+
+    Parameters
+    ----------
+    observer : array_like
+        The packed geodetic coordinates of the observer(s), as a 3-sequence,
+        a n x 3 array or a `GEODETIC` structured array
+    enu : array_like
+        The ENU position(s), in m, as a 3-vector or a n x 3 array
+    out : numpy.ndarray, optional
+        A buffer of floats where to store the result
+
+    Returns
+    -------
+    numpy.ndarray
+        The ECEF coordinates, in m
+    """
+    observer = _unpack(observer)
+
+    if _ufunc:
+        ecef = _ufunc.ecef_from_enu(*observer, enu, out=out)
+        return ecef if out is not None else _squeeze_vector(ecef)
+
+    latitude, longitude, altitude = observer
+    enu = numpy.asanyarray(enu, float)
+    ecef = ecef_from_geodetic(latitude, longitude, altitude) + sum(
+        b * enu[..., i, None] for i, b in enumerate(
+            _enu_basis(latitude, longitude)))
+    if out is not None:
+        out[...] = ecef
+        return out
+    return ecef
+
+
+def horizontal_from_geodetic(observer, target, out=None):
+    """Get the direction and the distance of target(s) seen from observer(s)
+
+    The computation is fused in a single pass when the compiled ufuncs are
+    available, i.e. no intermediate ECEF arrays are allocated.
+
+    Parameters
+    ----------
+    observer : array_like
+        The packed geodetic coordinates of the observer(s), as a 3-sequence,
+        a n x 3 array or a `GEODETIC` structured array
+    target : array_like
+        The packed geodetic coordinates of the target(s)
+    out : tuple of numpy.ndarray, optional
+        Buffers of floats where to store the azimuth, elevation and distance
+
+    Returns
+    -------
+    tuple
+        The azimuth and elevation angle(s), in deg, and the distance(s), in
+        m. Angles are NaN for coincident points
+    """
+    observer, target = _unpack(observer), _unpack(target)
+    if (out is not None) and (len(out) != 3):
+        raise ValueError("out must contain 3 buffers")
+
+    if _ufunc:
+        if out is not None:
+            return _ufunc.horizontal_from_geodetic(*observer, *target,
+                                                   out=tuple(out))
+        horizontal = _ufunc.horizontal_from_geodetic(*observer, *target)
+        return tuple(map(_squeeze_scalar, horizontal))
+
+    enu = _enu_from_ecef(observer, ecef_from_geodetic(*target))
+    distance = numpy.linalg.norm(enu, axis=-1)
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        azimuth = numpy.degrees(numpy.arctan2(enu[..., 0], enu[..., 1]))
+        elevation = numpy.degrees(numpy.arcsin(enu[..., 2] / distance))
+    azimuth = numpy.where(distance > 0, azimuth, numpy.nan)
+    horizontal = (azimuth, elevation, distance)
+    if out is not None:
+        for o, value in zip(out, horizontal):
+            o[...] = value
+        return tuple(out)
+    return tuple(map(_squeeze_scalar, horizontal))
+
+
+class _Tile:
+    """Raw grid bound to its C descriptor"""
+
+    def __init__(self, grid_):
+        data = grid_.data
+        ny, nx = data.shape
+        (x0, x1), (y0, y1) = grid_.x, grid_.y
+        type_ = 0 if data.dtype.kind == "i" else 2
+        if not data.dtype.isnative:
+            type_ += 1
+
+        self.grid = grid_
+        self.descriptor = _Grid(data.ctypes.data, type_, nx, ny, x0, y0,
+                                (x1 - x0) / (nx - 1), (y1 - y0) / (ny - 1),
+                                grid_.scale, grid_.offset)
+        self.handle = numpy.uintp(ctypes.addressof(self.descriptor))
+
+
+    def elevation(self, x, y, out=None):
+        """Get the elevation at the given grid coordinates"""
+        if (out is None) and _scalar(x, y):
+            elevation, inside = ctypes.c_double(), ctypes.c_int()
+            _grid_elevation_s(ctypes.byref(self.descriptor), x, y, elevation,
+                              inside)
+            return elevation.value
+
+        if _ufunc:
+            elevation = _ufunc.grid_elevation(self.handle, x, y, out=out)
+            return elevation if out is not None else \
+                   _squeeze_scalar(elevation)
+
+        x, y = map(_regularize, (x, y))
+        if x.size != y.size:
+            raise ValueError("x and y must have the same size")
+
+        n = x.size
+        elevation = output(out, n, _DBL_P)
+        _grid_elevation(ctypes.byref(self.descriptor), x, y, elevation, n)
+
+        if (n == 1) and (out is None):
+            return elevation[0]
+        else:
+            return elevation
+
+
+@functools.lru_cache(maxsize=None)
+def _prefetcher():
+    """Get the thread pool loading tiles in the background"""
+    return concurrent.futures.ThreadPoolExecutor(
+        4, thread_name_prefix="turtle-prefetch")
+
+
+def _tile_origin(latitude, longitude):
+    """Get the origin of the tile containing a geodetic point, or None
+
+    Points on the northern and eastern edges, i.e. at a latitude of 90 deg or
+    at a longitude of 180 deg, belong to the last tiles.
+    """
+    if not ((abs(latitude) <= 90) and (abs(longitude) <= 180)):
+        return None
+    return min(math.floor(latitude), 89), min(math.floor(longitude), 179)
+
+
+def _tile_indices(latitude, longitude):
+    """Get the origins of the tiles covering a geodetic range"""
+    latitude = range(max(math.floor(min(latitude)), -90),
+                     min(math.floor(max(latitude)), 89) + 1)
+    longitude = range(max(math.floor(min(longitude)), -180),
+                      min(math.floor(max(longitude)), 179) + 1)
+    return [(i, j) for i in latitude for j in longitude]
+
+
+def _tile_keys(latitude, longitude):
+    """Get the ids of the tiles containing geodetic points, or -1 if invalid
+
+    Tiles are clamped as for `_tile_origin`.
+    """
+    with numpy.errstate(invalid="ignore"):
+        origin = (numpy.minimum(numpy.floor(latitude), 89),
+                  numpy.minimum(numpy.floor(longitude), 179))
+        key = (origin[0] + 90) * 360 + (origin[1] + 180)
+        valid = (numpy.abs(latitude) <= 90) & (numpy.abs(longitude) <= 180)
+    key[~valid] = -1
+    return key.astype(numpy.int64)
+
+
+_LATENCY_BINS = 10. ** numpy.arange(-6, 3)
+"""Edges of the tile load latency histogram, in s"""
+
+
+class _TileCache:
+    """LRU cache of memory mapped 1 deg x 1 deg tiles"""
+
+    def __init__(self, path, size, on_load=None, on_evict=None,
+                 max_bytes=0):
+        # Index the tile loaders, from a store file or from a directory
+        self._loaders = {}
+        if path.endswith(".store"):
+            store = grid.Store(path)
+            for name in store:
+                index = grid.tile_index(name)
+                if index is not None:
+                    self._loaders[index] = functools.partial(store.get,
+                                                             name)
+        else:
+            for name in sorted(os.listdir(path)):
+                index = grid.tile_index(name)
+                if (index is not None) and (index not in self._loaders) and \
+                   (os.path.splitext(name)[1] in (".grid", ".hgt")):
+                    self._loaders[index] = functools.partial(grid.load,
+                        os.path.join(path, name))
+
+        self._size, self._max_bytes = size, max_bytes
+        self._tiles = collections.OrderedDict()
+        self._pending, self._pinned = {}, set()
+        self._lock = threading.Lock()
+
+        self._on_load, self._on_evict = on_load, on_evict
+        self._hits, self._misses, self._loads, self._evictions = 0, 0, 0, 0
+        self._bytes, self._load_time = 0, 0.
+        self._latency = numpy.zeros(_LATENCY_BINS.size + 1, int)
+
+
+    def _request(self, index, lookup=False):
+        """Request the loading of a tile
+
+        Returns the future of the tile, or None if there is none, and a flag
+        telling if the caller is in charge of loading the tile. Lookups are
+        accounted as cache hits or misses.
+        """
+        with self._lock:
+            tile = self._tiles.get(index)
+            if tile is not None:
+                self._tiles.move_to_end(index)
+                self._hits += lookup
+                future = concurrent.futures.Future()
+                future.set_result(tile)
+                return future, False
+
+            future = self._pending.get(index)
+            if future is not None:
+                self._hits += lookup
+                return future, False
+
+            if index not in self._loaders:
+                return None, False
+            self._misses += lookup
+            future = concurrent.futures.Future()
+            self._pending[index] = future
+            return future, True
+
+
+    def _load(self, index, future):
+        """Load a requested tile, outside of the cache lock"""
+        t0 = time.perf_counter()
+        try:
+            tile = _Tile(self._loaders[index]())
+        except BaseException as e:
+            with self._lock:
+                del self._pending[index]
+            future.set_exception(e)
+            return
+        latency = time.perf_counter() - t0
+
+        with self._lock:
+            del self._pending[index]
+            self._tiles[index] = tile
+            self._loads += 1
+            self._bytes += tile.grid.data.nbytes
+            self._load_time += latency
+            self._latency[numpy.searchsorted(_LATENCY_BINS, latency)] += 1
+
+            evicted = self._evict(index)
+        future.set_result(tile)
+
+        if self._on_load is not None:
+            self._on_load(index, latency)
+        if self._on_evict is not None:
+            for i, _ in evicted:
+                self._on_evict(i)
+
+
+    def _evict(self, index):
+        """Evict the oldest tiles in excess of the cache budget
+
+        Pinned tiles and the last loaded one are kept. Evicted tiles are
+        unmapped once no evaluation uses them. This must be called with the
+        cache lock held.
+        """
+        def exceeded():
+            return ((self._size > 0) and (len(self._tiles) > self._size)) or \
+                   ((self._max_bytes > 0) and
+                    (self._bytes > self._max_bytes))
+
+        evicted = []
+        if exceeded():
+            for i in list(self._tiles):
+                if (i == index) or (i in self._pinned):
+                    continue
+                tile = self._tiles.pop(i)
+                self._bytes -= tile.grid.data.nbytes
+                evicted.append((i, tile))
+                if not exceeded():
+                    break
+        self._evictions += len(evicted)
+        return evicted
+
+
+    def pin(self, indices):
+        """Load the tiles with the given origins and keep them in the cache"""
+        for index in indices:
+            if self.get(index) is not None:
+                with self._lock:
+                    self._pinned.add(index)
+
+
+    def unpin(self, indices):
+        """Release pinned tiles, evicting them if the cache is full"""
+        with self._lock:
+            self._pinned.difference_update(indices)
+            evicted = self._evict(None)
+        if self._on_evict is not None:
+            for i, _ in evicted:
+                self._on_evict(i)
+
+
+    def stats(self, histogram=False):
+        """Get the cache statistics"""
+        with self._lock:
+            stats = {"hits": self._hits, "misses": self._misses,
+                     "loads": self._loads, "evictions": self._evictions,
+                     "tiles": len(self._tiles), "pinned": len(self._pinned),
+                     "bytes": self._bytes, "load_time": self._load_time}
+            if histogram:
+                stats["latency"] = (self._latency.copy(), _LATENCY_BINS)
+        return stats
+
+
+    def get(self, index):
+        """Get the tile with the given origin, or None if there is none"""
+        future, owner = self._request(index, lookup=True)
+        if future is None:
+            return None
+        if owner:
+            self._load(index, future)
+        return future.result()
+
+
+    def prefetch(self, indices):
+        """Load the tiles with the given origins in the background
+
+        Returns the futures of the tiles.
+        """
+        futures = []
+        for index in indices:
+            future, owner = self._request(index)
+            if future is None:
+                continue
+            if owner:
+                _prefetcher().submit(self._load, index, future)
+            futures.append(future)
+        return futures
+
+
+    def elevation(self, latitude, longitude, out, workers=None):
+        """Get the elevation at the given geodetic coordinates
+
+        Coordinates are bucketed by tile. Each bucket is evaluated with a
+        single call over the corresponding tile. Missing tiles are loaded in
+        the background while the first buckets are evaluated.
+        """
+        latitude = numpy.ravel(latitude).astype(float, copy=False)
+        longitude = numpy.ravel(longitude).astype(float, copy=False)
+        values = numpy.full(latitude.size, numpy.nan)
+
+        key = _tile_keys(latitude, longitude)
+        order = numpy.argsort(key, kind="stable")
+        key = key[order]
+        bounds = numpy.flatnonzero(numpy.diff(key)) + 1
+        bounds = numpy.concatenate(((0,), bounds, (key.size,)))
+
+        # Prefetch the footprint of the batch, within the cache size. With a
+        # memory budget, tile sizes are unknown before loading. Background
+        # loads could then evict tiles not yet evaluated, thus tiles are
+        # only loaded on demand
+        indices = [(int(k // 360) - 90, int(k % 360) - 180)
+                   for k in key[bounds[:-1]] if k >= 0]
+        if (len(indices) > 1) and (self._max_bytes <= 0):
+            self.prefetch(indices[1:self._size] if self._size > 0 else
+                          indices[1:])
+
+        def evaluate(s):
+            for start, stop in zip(bounds[s.start:s.stop],
+                                   bounds[s.start + 1:s.stop + 1]):
+                k = key[start]
+                if k < 0:
+                    continue
+                tile = self.get((int(k // 360) - 90, int(k % 360) - 180))
+                if tile is None:
+                    continue
+                i = order[start:stop]
+                values[i] = tile.elevation(longitude[i], latitude[i])
+
+        shard(evaluate, bounds.size - 1, workers)
+        out[...] = values.reshape(out.shape)
+        return out
+
+
+def _project(projection, u, v, out, forward):
+    """Apply a map projection, or its inverse, to vectorized coordinates
+
+    A None projection stands for geodetic map coordinates. Failed
+    projections yield NaN.
+    """
+    if (out is None) and _scalar(u, v):
+        if projection is None:
+            return float(v), float(u)
+        a, b = ctypes.c_double(), ctypes.c_double()
+        function = _projection_project_s if forward else \
+                   _projection_unproject_s
+        if function(projection, u, v, a, b) != 0:
+            return numpy.nan, numpy.nan
+        return a.value, b.value
+
+    if (out is not None) and (len(out) != 2):
+        raise ValueError("out must contain 2 buffers")
+
+    if _ufunc:
+        handle = numpy.uintp(0 if projection is None else projection.value)
+        function = _ufunc.projection_project if forward else \
+                   _ufunc.projection_unproject
+        if out is not None:
+            return function(handle, u, v, out=tuple(out))
+        return tuple(map(_squeeze_scalar, function(handle, u, v)))
+
+    u, v = map(_regularize, (u, v))
+    if u.size != v.size:
+        raise ValueError("coordinates must have the same size")
+
+    n = u.size
+    a, b = (output(o, n, _DBL_P) for o in (out or (None, None)))
+    function = _projection_project if forward else _projection_unproject
+    function(projection, u, v, a, b, n)
+
+    if (n == 1) and (out is None):
+        return a[0], b[0]
+    else:
+        return a, b
+
+
 class Map:
     """Proxy for a TURTLE map object"""
 
-    def __init__(self, path):
+    def __init__(self, path, mmap=False, name=None):
         """Initialise a map object from a data file
 
+        Raw grid files (.grid) and store files (.store) are always memory
+        mapped. SRTM tiles (.hgt) are memory mapped on request. Other formats
+        are loaded in memory by the TURTLE library.
+
         Parameters
         ----------
         path : str
             The path where the data are located
+        mmap : bool, optional
+            Flag to memory map the data instead of loading them. The opening
+            is then immediate, and the data pages are shared between
+            processes
+        name : str, optional
+            The name of the map within a store file. It can be omitted if
+            the store contains a single map
 
         Raises
         ------
         LibraryError
             A TURTLE library error occured, e.g. if the data could not be loaded
         """
-        self._map, self._path = None, None
+        self._map, self._path, self._tile = None, None, None
+        self._projection, self._projection_name = None, None
+        self._owner = False
+
+        if path.endswith(".store"):
+            store = grid.Store(path)
+            if name is None:
+                if len(store) != 1:
+                    raise ValueError("a map name is required")
+                name, = store
+            self._tile = _Tile(store.get(name))
+        elif mmap or path.endswith(".grid"):
+            self._tile = _Tile(grid.load(path))
+
+        if self._tile is not None:
+            self._path = path
+            name = self._tile.grid.projection
+            if name is not None:
+                projection = ctypes.c_void_p(None)
+                _projection_create(ctypes.byref(projection), name.encode())
+                self._projection, self._owner = projection, True
+                self._projection_name = name
+            return
 
         # Create the map object
         map_ = ctypes.c_void_p(None)
@@ -329,9 +1272,20 @@ class Map:
         self._map = map_
         self._path = path
 
+        # Get the map projection, if any
+        projection = ctypes.c_char_p(None)
+        _map_meta(self._map, ctypes.byref(_MapInfo()),
+                  ctypes.byref(projection))
+        if projection.value is not None:
+            self._projection = ctypes.c_void_p(_map_projection(self._map))
+            self._projection_name = projection.value.decode()
+
 
     def __del__(self):
         try:
+            if self._owner:
+                _projection_destroy(ctypes.byref(self._projection))
+                self._projection, self._owner = None, False
             if self._map is None:
                 return
         except AttributeError:
@@ -341,22 +1295,196 @@ class Map:
         self._map = None
 
 
-    def elevation(self, x, y):
-        """Get the elevation at the given map coordinates"""
+    def elevation(self, x, y, out=None):
+        """Get the elevation at the given map coordinates
+
+        Parameters
+        ----------
+        x : float or array_like
+            The map x-coordinate(s)
+        y : float or array_like
+            The map y-coordinate(s)
+        out : numpy.ndarray, optional
+            A buffer of floats where to store the result
+
+        Returns
+        -------
+        float or numpy.ndarray
+            The topography elevation(s) or NaN if outside of the map
+        """
+
+        if self._tile is not None:
+            return self._tile.elevation(x, y, out)
+
+        if (out is None) and _scalar(x, y):
+            if self._map is None:
+                return numpy.nan
+            elevation, inside = ctypes.c_double(), ctypes.c_int()
+            _map_elevation_s(self._map, x, y, elevation, inside)
+            return elevation.value if inside.value else numpy.nan
+
+        if _ufunc and (self._map is not None):
+            elevation = _ufunc.map_elevation(_handle(self._map), x, y,
+                                             out=out)
+            return elevation if out is not None else \
+                   _squeeze_scalar(elevation)
 
         x, y = map(_regularize, (x, y))
         if x.size != y.size:
             raise ValueError("x and y must have the same size")
 
         n = x.size
-        elevation = numpy.zeros(n)
+        elevation = output(out, n, _DBL_P)
 
         if self._map is None:
-            elevation = numpy.nan
-            return elevation
+            elevation[...] = numpy.nan
         else:
             _map_elevation(self._map, x, y, elevation, n)
-            return elevation[0] if n == 1 else elevation
+
+        if (n == 1) and (out is None):
+            return elevation[0]
+        else:
+            return elevation
+
+
+    def from_geodetic(self, latitude, longitude, out=None):
+        """Convert geodetic coordinates to map ones
+
+        Parameters
+        ----------
+        latitude : float or array_like
+            The geodetic latitude(s), in deg
+        longitude : float or array_like
+            The geodetic longitude(s), in deg
+        out : tuple of numpy.ndarray, optional
+            Buffers of floats where to store the x and y coordinates
+
+        Returns
+        -------
+        tuple
+            The map x and y coordinate(s), or NaN if the projection failed
+        """
+        return _project(self._projection, latitude, longitude, out, True)
+
+
+    def to_geodetic(self, x, y, out=None):
+        """Convert map coordinates to geodetic ones
+
+        Parameters
+        ----------
+        x : float or array_like
+            The map x-coordinate(s)
+        y : float or array_like
+            The map y-coordinate(s)
+        out : tuple of numpy.ndarray, optional
+            Buffers of floats where to store the latitude and longitude
+
+        Returns
+        -------
+        tuple
+            The geodetic latitude(s) and longitude(s), in deg, or NaN if the
+            projection failed
+        """
+        return _project(self._projection, x, y, out, False)
+
+
+    def elevation_geodetic(self, latitude, longitude, out=None):
+        """Get the elevation at the given geodetic coordinates
+
+        The projection to map coordinates and the elevation lookup are done
+        in a single loop.
+
+        Parameters
+        ----------
+        latitude : float or array_like
+            The geodetic latitude(s), in deg
+        longitude : float or array_like
+            The geodetic longitude(s), in deg
+        out : numpy.ndarray, optional
+            A buffer of floats where to store the result
+
+        Returns
+        -------
+        float or numpy.ndarray
+            The topography elevation(s) or NaN if outside of the map
+        """
+        if (out is None) and _scalar(latitude, longitude):
+            x, y = self.from_geodetic(latitude, longitude)
+            return numpy.nan if math.isnan(x) else self.elevation(x, y)
+
+        if _ufunc:
+            handle = numpy.uintp(0 if self._projection is None else
+                                 self._projection.value)
+            if self._tile is not None:
+                elevation = _ufunc.grid_elevation_geodetic(self._tile.handle,
+                    handle, latitude, longitude, out=out)
+            elif self._map is not None:
+                elevation = _checked(_ufunc.map_elevation_geodetic,
+                    _handle(self._map), handle, latitude, longitude,
+                    out=out)
+            else:
+                return self.elevation(latitude, longitude, out)
+            return elevation if out is not None else \
+                   _squeeze_scalar(elevation)
+
+        if (self._tile is not None) or (self._map is None):
+            return self.elevation(*self.from_geodetic(latitude, longitude),
+                                  out=out)
+
+        latitude, longitude = map(_regularize, (latitude, longitude))
+        if latitude.size != longitude.size:
+            raise ValueError("latitude and longitude must have the same size")
+
+        n = latitude.size
+        elevation = output(out, n, _DBL_P)
+        _map_elevation_geodetic(self._map, self._projection, latitude,
+                                longitude, elevation, n)
+
+        if (n == 1) and (out is None):
+            return elevation[0]
+        else:
+            return elevation
+
+
+    def save(self, path):
+        """Save the map data to a raw grid file
+
+        Raw grid files can be memory mapped, e.g. by `Map` objects.
+
+        Parameters
+        ----------
+        path : str
+            The path of the file to write
+        """
+        self._grid().save(path)
+
+
+    def _grid(self):
+        """Get the map data as a raw grid"""
+        if self._tile is not None:
+            return self._tile.grid
+
+        info = _MapInfo()
+        _map_meta(self._map, ctypes.byref(info), None)
+        x = numpy.linspace(info.x[0], info.x[1], info.nx)
+        y = numpy.linspace(info.y[0], info.y[1], info.ny)
+        data = numpy.empty((info.ny, info.nx), numpy.float32)
+        for i, yi in enumerate(y):
+            data[i] = self.elevation(x, numpy.full(info.nx, yi))
+        return grid.Grid(data, info.x, info.y,
+                         projection=self._projection_name)
+
+
+    @property
+    def mmap(self):
+        """Flag telling if the map data are memory mapped"""
+        return self._tile is not None
+
+
+    @property
+    def projection(self):
+        """The name of the map projection, or None for geodetic coordinates"""
+        return self._projection_name
 
 
     @property
@@ -368,7 +1496,8 @@ class Map:
 class Stack:
     """Proxy for a TURTLE stack object"""
 
-    def __init__(self, path, stack_size=0):
+    def __init__(self, path, stack_size=0, threadsafe=False, mmap=False,
+                 on_load=None, on_evict=None, max_bytes=0):
         """Create a stack of maps for a world wide topography model
 
         Parameters
@@ -377,26 +1506,65 @@ class Stack:
             The path where the data tiles are located
         stack_size : integer, optional
             The maximum number of data tiles kept in memory
+        threadsafe : bool, optional
+            Flag to allow concurrent access to the stack from several threads
+        mmap : bool, optional
+            Flag to memory map the data tiles instead of loading them with
+            the TURTLE library. Only .hgt and .grid tiles are supported. The
+            data pages are then shared between processes and the stack is
+            always threadsafe. Store files (.store) are always memory mapped
+        on_load : callable, optional
+            Hook called as `on_load((latitude, longitude), latency)` when a
+            memory mapped tile is loaded, with the tile origin in deg and the
+            load latency in s. It might be called from a background thread
+        on_evict : callable, optional
+            Hook called as `on_evict((latitude, longitude))` when a memory
+            mapped tile is evicted from the stack
+        max_bytes : integer, optional
+            The maximum size of the data tiles kept in memory, in bytes. This
+            requires a memory mapped stack. The oldest tiles are evicted
+            first. Pinned tiles and the last loaded one are never evicted
 
         Raises
         ------
         LibraryError
             A TURTLE library error occured, e.g. if the data format is not valid
+        ValueError
+            A memory budget, or hooks, are requested for a native stack
         """
         self._stack, self._path, self._stack_size = None, None, None
+        self._clients, self._tiles, self._max_bytes = None, None, max_bytes
+
+        if mmap or path.endswith(".store"):
+            self._tiles = _TileCache(path, stack_size, on_load, on_evict,
+                                     max_bytes)
+            self._path, self._stack_size = path, stack_size
+            return
+        elif max_bytes > 0:
+            raise ValueError("max_bytes requires a memory mapped stack")
+        elif (on_load is not None) or (on_evict is not None):
+            raise ValueError("hooks require a memory mapped stack")
 
         # Create the stack object
         stack_ = ctypes.c_void_p(None)
         path_ = ctypes.c_char_p(path.encode())
         stack_size_ = ctypes.c_int(stack_size)
+        if threadsafe:
+            lock, unlock = _stack_mutex()
+        else:
+            lock, unlock = None, None
 
-        if (_stack_create(ctypes.byref(stack_), path_, stack_size_, None, None)
-            != 0):
+        if (_stack_create(ctypes.byref(stack_), path_, stack_size_, lock,
+                          unlock) != 0):
             return
         self._stack = stack_
         self._path = path
         self._stack_size = stack_size
 
+        if threadsafe:
+            self._clients = Pool(functools.partial(_new_client, stack_),
+                                 _delete_client)
+
 
     def __del__(self):
         try:
@@ -405,22 +1573,503 @@ class Stack:
         except AttributeError:
             return
 
+        if self._clients is not None:
+            self._clients.clear()
         _stack_destroy(ctypes.byref(self._stack))
         self._stack = None
 
 
-    def elevation(self, latitude, longitude):
-        """Get the elevation at the given geodetic coordinates"""
+    @staticmethod
+    def get(path, stack_size=0, threadsafe=False, mmap=False, max_bytes=0):
+        """Get a shared stack from the process wide cache
+
+        Stacks are cached by construction parameters, such that the tiles
+        directory is scanned only once. A cached stack is shared as long as
+        it is referenced, and the most recent ones are kept alive by the
+        cache. Note that loaded tiles are shared as well.
+
+        Parameters
+        ----------
+        path : str
+            The path where the data tiles are located
+        stack_size : integer, optional
+            The maximum number of data tiles kept in memory
+        threadsafe : bool, optional
+            Flag to allow concurrent access to the stack from several threads
+        mmap : bool, optional
+            Flag to memory map the data tiles
+        max_bytes : integer, optional
+            The maximum size of the data tiles kept in memory, in bytes
+
+        Returns
+        -------
+        Stack
+            The shared stack
+        """
+        return _stacks.get(os.path.abspath(path), stack_size, threadsafe,
+                           mmap, max_bytes)
+
+
+    @staticmethod
+    def clear():
+        """Release the stacks held by the process wide cache"""
+        _stacks.clear()
+
+
+    def elevation(self, latitude, longitude, workers=None, out=None,
+                  reorder=False):
+        """Get the elevation at the given geodetic coordinates
+
+        Parameters
+        ----------
+        latitude : float or array_like
+            The geodetic latitude(s), in deg
+        longitude : float or array_like
+            The geodetic longitude(s), in deg
+        workers : int, optional
+            The number of threads over which the computation is split. This
+            requires a threadsafe stack
+        out : numpy.ndarray, optional
+            A buffer of floats where to store the result
+        reorder : bool, optional
+            Flag to evaluate the coordinates grouped by tile, instead of in
+            input order. This avoids reloading tiles when the stack size is
+            smaller than the set of tiles spanned by the batch. Memory mapped
+            stacks always proceed by tile
+
+        Returns
+        -------
+        float or numpy.ndarray
+            The topography elevation(s) or NaN if outside of the stack
+        """
+
+        if self._tiles is not None:
+            return self._elevation_mmap(latitude, longitude, workers, out)
+
+        if (out is None) and _scalar(latitude, longitude):
+            elevation, inside = ctypes.c_double(), ctypes.c_int()
+            if self._clients is None:
+                _stack_elevation_s(self._stack, latitude, longitude,
+                                   elevation, inside)
+            else:
+                client = self._clients.acquire()
+                try:
+                    _client_elevation_s(client, latitude, longitude,
+                                        elevation, inside)
+                finally:
+                    self._clients.release(client)
+            return elevation.value if inside.value else numpy.nan
+
+        if (self._clients is None) and (workers is not None) and \
+           (workers > 1):
+            raise ValueError("workers require a threadsafe stack")
+
+        if reorder:
+            return self._elevation_sorted(latitude, longitude, workers, out)
+
+        if _ufunc:
+            return self._elevation_ufunc(latitude, longitude, workers, out)
 
         latitude, longitude = map(_regularize, (latitude, longitude))
         if latitude.size != longitude.size:
             raise ValueError("latitude and longitude must have the same size")
 
         n = latitude.size
-        elevation = numpy.zeros(n)
+        elevation = output(out, n, _DBL_P)
+
+        if self._clients is None:
+            _stack_elevation(self._stack, latitude, longitude, elevation, n)
+        else:
+            latitude, longitude = latitude.ravel(), longitude.ravel()
+            values = elevation.reshape(-1)
+
+            def evaluate(s):
+                with self._clients.lease() as client:
+                    _client_elevation(client, latitude[s], longitude[s],
+                                      values[s], s.stop - s.start)
+
+            shard(evaluate, n, workers)
+
+        if (n == 1) and (out is None):
+            return elevation[0]
+        else:
+            return elevation
+
+
+    def intersect(self, origin, direction, max_length, step=10.,
+                  workers=None, out=None):
+        """Intersect rays with the topography
+
+        Rays are stepped by half their height above the ground, but at least
+        by `step`. Once the ground is crossed, the intersection is refined
+        by bisection, down to 1 mm. Outside of the topography data, the
+        ground is the ellipsoid.
+
+        Parameters
+        ----------
+        origin : array_like
+            The ECEF origin(s) of the rays, in m, as a 3-vector or a n x 3
+            array
+        direction : array_like
+            The ECEF direction(s) of the rays, as a 3-vector or a n x 3 array
+        max_length : float or array_like
+            The maximum distance travelled along the rays, in m
+        step : float or array_like, optional
+            The minimum stepping distance, in m
+        workers : int, optional
+            The number of threads over which the computation is split. This
+            requires a threadsafe stack
+        out : tuple of numpy.ndarray, optional
+            Buffers of floats where to store the intersection positions and
+            distances
+
+        Returns
+        -------
+        tuple
+            The ECEF position(s) of the first intersections, in m, and the
+            distance(s) to these intersections, in m. Both are NaN for rays
+            that do not hit the ground within `max_length`
+        """
+        if (self._clients is None) and (self._tiles is None) and \
+           (workers is not None) and (workers > 1):
+            raise ValueError("workers require a threadsafe stack")
+        if (out is not None) and (len(out) != 2):
+            raise ValueError("out must contain 2 buffers")
+
+        origin, direction, max_length, step = numpy.broadcast_arrays(
+            *(numpy.asanyarray(a) for a in (origin, direction,
+                                            numpy.expand_dims(max_length, -1),
+                                            numpy.expand_dims(step, -1))))
+        shape = origin.shape[:-1]
+        if out is None:
+            position, distance = numpy.empty(origin.shape), \
+                                 numpy.empty(shape)
+        else:
+            position, distance = out
+        max_length, step = max_length[..., 0], step[..., 0]
+
+        if _ufunc and (self._tiles is None):
+            if self._clients is None:
+                def evaluate(s):
+                    _checked(_ufunc.stack_intersect, _handle(self._stack),
+                        origin[s], direction[s], max_length[s], step[s],
+                        out=(position[s], distance[s]))
+            else:
+                def evaluate(s):
+                    with self._clients.lease() as client:
+                        _checked(_ufunc.client_intersect, _handle(client),
+                            origin[s], direction[s], max_length[s], step[s],
+                            out=(position[s], distance[s]))
+        else:
+            def evaluate(s):
+                p, d = self._intersect(origin[s].reshape(-1, 3),
+                    direction[s].reshape(-1, 3), max_length[s].ravel(),
+                    step[s].ravel())
+                position[s] = p.reshape(position[s].shape)
+                distance[s] = d.reshape(distance[s].shape)
+
+        if origin.ndim == 1:
+            evaluate(Ellipsis)
+        else:
+            shard(evaluate, origin.shape[0], workers)
+
+        if out is None:
+            return _squeeze_vector(position), _squeeze_scalar(distance)
+        return position, distance
+
+
+    def visible(self, source, target, step=10., workers=None, out=None):
+        """Check if the straight lines between points are above the ground
+
+        Sources and targets are broadcast together. For example, all pairs
+        between n sources and m antennas are checked with `source[:, None]`
+        and `target[None]`, resulting in a n x m array. Lines are stepped as
+        for `Stack.intersect`, but the stepping stops as soon as the ground
+        is crossed. Both end points are expected to lie above, or on, the
+        ground. A tolerance of 1 mm is applied at both of them, such that
+        swapping sources and targets yields the same result.
+
+        Parameters
+        ----------
+        source : array_like
+            The ECEF position(s) of the sources, in m, as a 3-vector or a
+            n x 3 array
+        target : array_like
+            The ECEF position(s) of the targets, in m, as a 3-vector or a
+            n x 3 array
+        step : float or array_like, optional
+            The minimum stepping distance, in m
+        workers : int, optional
+            The number of threads over which the computation is split. This
+            requires a threadsafe stack
+        out : numpy.ndarray, optional
+            A buffer of booleans where to store the result
+
+        Returns
+        -------
+        bool or numpy.ndarray
+            True if the line between a source and a target is not obstructed
+            by the topography
+        """
+        if (self._clients is None) and (self._tiles is None) and \
+           (workers is not None) and (workers > 1):
+            raise ValueError("workers require a threadsafe stack")
+
+        source, target, step = numpy.broadcast_arrays(
+            numpy.asanyarray(source), numpy.asanyarray(target),
+            numpy.expand_dims(step, -1))
+        step = step[..., 0]
+        visible = numpy.empty(step.shape, bool) if out is None else out
+
+        if _ufunc and (self._tiles is None):
+            if self._clients is None:
+                def evaluate(s):
+                    _checked(_ufunc.stack_visible, _handle(self._stack),
+                        source[s], target[s], step[s], out=visible[s])
+            else:
+                def evaluate(s):
+                    with self._clients.lease() as client:
+                        _checked(_ufunc.client_visible, _handle(client),
+                            source[s], target[s], step[s], out=visible[s])
+        else:
+            def evaluate(s):
+                r0 = source[s].reshape(-1, 3).astype(float)
+                u = target[s].reshape(-1, 3) - r0
+                d = numpy.linalg.norm(u, axis=1)
+                r0 += 1E-03 * u / numpy.where(d > 0, d, 1)[:, None]
+                _, distance = self._intersect(r0, u, numpy.maximum(
+                    d - 2E-03, 0), step[s].ravel(), refine=False)
+                visible[s] = numpy.isnan(distance).reshape(visible[s].shape)
+
+        if source.ndim == 1:
+            evaluate(Ellipsis)
+        else:
+            shard(evaluate, source.shape[0], workers)
+
+        if (out is None) and (visible.ndim == 0):
+            return bool(visible)
+        return visible
+
+
+    def _intersect(self, origin, direction, max_length, step, refine=True):
+        """Intersect rays with the topography, using vectorized steps"""
+        n = origin.shape[0]
+        origin = origin.astype(float)
+        norm = numpy.linalg.norm(direction, axis=1, keepdims=True)
+        direction = direction / numpy.where(norm > 0, norm, 1)
+        valid = norm[:, 0] > 0
+
+        def height(index, s):
+            r = origin[index] + s[:, None] * direction[index]
+            latitude, longitude, altitude = map(numpy.atleast_1d,
+                                                ecef_to_geodetic(r))
+            z = numpy.atleast_1d(self.elevation(latitude, longitude))
+            return altitude - numpy.where(numpy.isnan(z), 0, z)
+
+        # Step until the ground is crossed
+        s0, s1 = numpy.zeros(n), numpy.full(n, numpy.nan)
+        h0 = height(numpy.arange(n), s0)
+        s1[valid & (h0 == 0)] = 0
+        crossed = numpy.zeros(n, bool)
+        active = numpy.flatnonzero(valid & (h0 != 0))
+        while active.size:
+            h = h0[active]
+            s = numpy.minimum(s0[active] + numpy.maximum(step[active],
+                0.5 * numpy.abs(h)), max_length[active])
+            h1 = height(active, s)
+            hit = (h > 0) != (h1 > 0)
+            s1[active[hit]], crossed[active[hit]] = s[hit], True
+            s0[active[~hit]], h0[active[~hit]] = s[~hit], h1[~hit]
+            active = active[~hit & (s < max_length[active])]
+
+        if not refine:
+            return None, s1
+
+        # Refine the intersections by bisection
+        active = numpy.flatnonzero(crossed)
+        active = active[s1[active] - s0[active] > 1E-03]
+        while active.size:
+            s = 0.5 * (s0[active] + s1[active])
+            above = (height(active, s) > 0) == (h0[active] > 0)
+            s0[active[above]] = s[above]
+            s1[active[~above]] = s[~above]
+            active = active[s1[active] - s0[active] > 1E-03]
+
+        return origin + s1[:, None] * direction, s1
+
+
+    def _elevation_mmap(self, latitude, longitude, workers, out):
+        """Get the elevation from memory mapped tiles"""
+        if (out is None) and _scalar(latitude, longitude):
+            index = _tile_origin(latitude, longitude)
+            tile = None if index is None else self._tiles.get(index)
+            if tile is None:
+                return numpy.nan
+            return tile.elevation(longitude, latitude)
+
+        latitude, longitude = numpy.broadcast_arrays(latitude, longitude)
+        elevation = numpy.empty(latitude.shape) if out is None else out
+        self._tiles.elevation(latitude, longitude, elevation, workers)
+        return elevation if out is not None else _squeeze_scalar(elevation)
+
+
+    def _elevation_sorted(self, latitude, longitude, workers, out):
+        """Get the elevation with the coordinates sorted by tile"""
+        latitude, longitude = numpy.broadcast_arrays(latitude, longitude)
+        elevation = numpy.empty(latitude.shape) if out is None else out
+
+        latitude = numpy.ravel(latitude).astype(float, copy=False)
+        longitude = numpy.ravel(longitude).astype(float, copy=False)
+        order = numpy.argsort(_tile_keys(latitude, longitude), kind="stable")
+
+        sorted_ = numpy.empty(latitude.size)
+        self.elevation(latitude[order], longitude[order], workers,
+                       out=sorted_)
+        values = numpy.empty_like(sorted_)
+        values[order] = sorted_
+        elevation[...] = values.reshape(elevation.shape)
+        return elevation if out is not None else _squeeze_scalar(elevation)
+
+
+    def _elevation_ufunc(self, latitude, longitude, workers, out):
+        """Get the elevation using the compiled ufuncs"""
+        latitude, longitude = numpy.broadcast_arrays(latitude, longitude)
+        elevation = numpy.empty(latitude.shape) if out is None else out
+
+        if self._clients is None:
+            _checked(_ufunc.stack_elevation, _handle(self._stack), latitude,
+                     longitude, out=elevation)
+        else:
+            # Concurrent evaluations are split along the first axis
+            def evaluate(s):
+                with self._clients.lease() as client:
+                    _checked(_ufunc.client_elevation, _handle(client),
+                             latitude[s], longitude[s], out=elevation[s])
+
+            if latitude.ndim == 0:
+                evaluate(Ellipsis)
+            else:
+                shard(evaluate, latitude.shape[0], workers)
+
+        return elevation if out is not None else _squeeze_scalar(elevation)
+
+
+    def pin(self, latitude, longitude):
+        """Load the data tiles covering a geodetic range and keep them
+
+        Pinned tiles are never evicted, but they count in the memory budget.
+        This requires a memory mapped stack
+
+        Parameters
+        ----------
+        latitude : (float, float)
+            The geodetic latitude range, in deg
+        longitude : (float, float)
+            The geodetic longitude range, in deg
+
+        Raises
+        ------
+        ValueError
+            The stack is not memory mapped
+        """
+        if self._tiles is None:
+            raise ValueError("pinning requires a memory mapped stack")
+        self._tiles.pin(_tile_indices(latitude, longitude))
+
+
+    def unpin(self, latitude, longitude):
+        """Release the pinned data tiles covering a geodetic range
+
+        Parameters
+        ----------
+        latitude : (float, float)
+            The geodetic latitude range, in deg
+        longitude : (float, float)
+            The geodetic longitude range, in deg
 
-        _stack_elevation(self._stack, latitude, longitude, elevation, n)
-        return elevation[0] if n == 1 else elevation
+        Raises
+        ------
+        ValueError
+            The stack is not memory mapped
+        """
+        if self._tiles is None:
+            raise ValueError("pinning requires a memory mapped stack")
+        self._tiles.unpin(_tile_indices(latitude, longitude))
+
+
+    def stats(self, histogram=False):
+        """Get the statistics of the tiles cache
+
+        Lookups of tiles being prefetched count as hits. Loads include the
+        prefetched tiles. Only memory mapped stacks are instrumented, since
+        native stacks manage their tiles within the TURTLE library
+
+        Parameters
+        ----------
+        histogram : bool, optional
+            Flag to include the histogram of the tiles load latency
+
+        Returns
+        -------
+        dict
+            The numbers of `hits`, `misses`, `loads` and `evictions`, the
+            number of resident `tiles`, of `pinned` ones, their size in
+            `bytes`, and the total `load_time` in s. The `latency` histogram
+            is given as `(counts, edges)`, where `counts[i]` is the number of
+            loads with a latency between `edges[i - 1]` and `edges[i]`. The
+            first and last bins are open
+
+        Raises
+        ------
+        ValueError
+            The stack is not memory mapped
+        """
+        if self._tiles is None:
+            raise ValueError("statistics require a memory mapped stack")
+        return self._tiles.stats(histogram)
+
+
+    def prefetch(self, latitude, longitude, wait=False):
+        """Load the data tiles covering a geodetic range in the background
+
+        The tiles are loaded by a pool of threads, such that I/O overlaps
+        with the elevation computations. This requires a memory mapped or a
+        threadsafe stack. Note that tiles in excess of the stack size evict
+        previous ones
+
+        Parameters
+        ----------
+        latitude : (float, float)
+            The geodetic latitude range, in deg
+        longitude : (float, float)
+            The geodetic longitude range, in deg
+        wait : bool, optional
+            Flag to wait until all tiles are loaded
+
+        Raises
+        ------
+        ValueError
+            The stack is not threadsafe
+        """
+        indices = _tile_indices(latitude, longitude)
+        if self._tiles is not None:
+            futures = self._tiles.prefetch(indices)
+        elif self._clients is None:
+            raise ValueError("prefetching requires a threadsafe stack")
+        else:
+            # Tiles are loaded by the TURTLE library on a first access
+            def load(index):
+                elevation, inside = ctypes.c_double(), ctypes.c_int()
+                with self._clients.lease() as client:
+                    _client_elevation_s(client, index[0] + 0.5,
+                                        index[1] + 0.5, elevation, inside)
+
+            futures = [_prefetcher().submit(load, index)
+                       for index in indices]
+
+        if wait:
+            for future in futures:
+                future.result()
 
 
     @property
@@ -433,3 +2082,197 @@ class Stack:
     def stack_size(self):
         """The maximum number of data tiles kept in memory"""
         return self._stack_size
+
+
+    @property
+    def max_bytes(self):
+        """The maximum size of the data tiles kept in memory, in bytes"""
+        return self._max_bytes
+
+
+    @property
+    def mmap(self):
+        """Flag telling if the data tiles are memory mapped"""
+        return self._tiles is not None
+
+
+    @property
+    def threadsafe(self):
+        """Flag telling if the stack can be shared between threads"""
+        return (self._clients is not None) or (self._tiles is not None)
+
+
+_stacks = Cache(lambda path, stack_size, threadsafe, mmap, max_bytes:
+    Stack(path, stack_size, threadsafe, mmap, max_bytes=max_bytes))
+"""Process wide cache of stacks, keyed by construction parameters"""
+
+
+class RegionalGrid:
+    """Dense elevation grid over a geodetic region
+
+    The elevation is sampled once from a stack or from a map, and stored as
+    a single contiguous array. Lookups are then bilinear interpolations over
+    this array, without any tile management.
+    """
+
+    def __init__(self, source, latitude=None, longitude=None,
+                 resolution=None):
+        """Sample a regional grid, or load it from a raw grid file
+
+        Parameters
+        ----------
+        source : Stack or Map or str
+            The topography to sample, or the path to a raw grid file written
+            by `RegionalGrid.save`, which is memory mapped
+        latitude : (float, float), optional
+            The geodetic latitude range of the region, in deg
+        longitude : (float, float), optional
+            The geodetic longitude range of the region, in deg
+        resolution : float, optional
+            The spacing of the grid nodes, in deg
+        """
+        if isinstance(source, str):
+            self._tile, self._path = _Tile(grid.load(source)), source
+            return
+
+        if (latitude is None) or (longitude is None) or (resolution is None):
+            raise ValueError("latitude, longitude and resolution are "
+                             "required")
+
+        def nodes(bounds):
+            n = int(round(abs(bounds[1] - bounds[0]) / resolution)) + 1
+            return numpy.linspace(bounds[0], bounds[1], max(n, 2))
+
+        latitude = tuple(map(float, latitude))
+        longitude = tuple(map(float, longitude))
+        lat, lon = nodes(latitude), nodes(longitude)
+        data = numpy.empty((lat.size, lon.size), numpy.float32)
+        for i, lat_i in enumerate(lat):
+            if isinstance(source, Map):
+                data[i] = source.elevation_geodetic(
+                    numpy.full(lon.size, lat_i), lon)
+            else:
+                data[i] = source.elevation(numpy.full(lon.size, lat_i), lon)
+
+        self._tile = _Tile(grid.Grid(data, longitude, latitude))
+        self._path = None
+
+
+    def elevation(self, latitude, longitude, out=None):
+        """Get the elevation at the given geodetic coordinates
+
+        Parameters
+        ----------
+        latitude : float or array_like
+            The geodetic latitude(s), in deg
+        longitude : float or array_like
+            The geodetic longitude(s), in deg
+        out : numpy.ndarray, optional
+            A buffer of floats where to store the result
+
+        Returns
+        -------
+        float or numpy.ndarray
+            The topography elevation(s) or NaN if outside of the region
+        """
+        return self._tile.elevation(longitude, latitude, out)
+
+
+    def save(self, path):
+        """Save the regional grid to a raw grid file
+
+        Parameters
+        ----------
+        path : str
+            The path of the file to write
+        """
+        self._tile.grid.save(path)
+
+
+    @property
+    def data(self):
+        """The elevation values at the grid nodes, latitude first"""
+        return self._tile.grid.data
+
+
+    @property
+    def latitude(self):
+        """The latitude range of the region"""
+        return self._tile.grid.y
+
+
+    @property
+    def longitude(self):
+        """The longitude range of the region"""
+        return self._tile.grid.x
+
+
+    @property
+    def path(self):
+        """The path to the raw grid file, if any"""
+        return self._path
+
+
+_EXTENSIONS = (".asc", ".grd", ".grid", ".hgt", ".png", ".tif")
+"""Extensions of the topography data files"""
+
+
+def convert(source, destination):
+    """Convert topography data to a compact store file
+
+    The maps are packed as int16 data, with a scale and an offset per map.
+    Tiles keep their name, e.g. N38E083, other maps are named after their
+    file. The store can then be opened directly by `Map` or `Stack` objects.
+
+    Parameters
+    ----------
+    source : str
+        The path to a data file, or to a directory of data files
+    destination : str
+        The path of the store file to write
+    """
+    if os.path.isdir(source):
+        paths = sorted(os.path.join(source, name)
+                       for name in os.listdir(source)
+                       if os.path.splitext(name)[1] in _EXTENSIONS)
+    else:
+        paths = [source]
+
+    grids = {}
+    for path in paths:
+        basename = os.path.basename(path)
+        index = grid.tile_index(basename)
+        if index is None:
+            name = os.path.splitext(basename)[0]
+        else:
+            name = grid.tile_name(*index)
+        if name not in grids:
+            # Raw grids and SRTM tiles are mapped as is, other formats are
+            # sampled from the TURTLE map
+            mmap = os.path.splitext(path)[1] in (".grid", ".hgt")
+            grids[name] = grid.pack(Map(path, mmap=mmap)._grid())
+
+    grid.save_store(destination, grids)
+
+
+def main(args=None):
+    """Command line interface for TURTLE data tools"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m grand_libs.turtle",
+        description="Tools for TURTLE topography data")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    parser_convert = subparsers.add_parser("convert",
+        help="convert topography data to a compact store file")
+    parser_convert.add_argument("source",
+        help="path to a data file, or to a directory of data files")
+    parser_convert.add_argument("destination",
+        help="path of the store file to write")
+    args = parser.parse_args(args)
+
+    if args.command == "convert":
+        convert(args.source, args.destination)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled NumPy ufuncs for the TURTLE and GULL libraries
+
+Copyright (C) 2018 The GRAND collaboration
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+import ctypes
+import functools
+import importlib.util
+import os
+import shlex
+import subprocess
+import sys
+import sysconfig
+import threading
+import warnings
+
+import numpy
+
+from . import LIBDIR, SRCDIR
+from .tools import Meta, checksum
+
+__all__ = ["Binding", "BuildError", "LIBNAME", "LIBPATH", "bind", "install",
+           "load"]
+
+
+LIBNAME = "_ufunc" + sysconfig.get_config_var("EXT_SUFFIX")
+"""The OS specific name of the ufunc extension module"""
+
+
+LIBPATH = os.path.join(LIBDIR, LIBNAME)
+"""The full path to the ufunc extension module"""
+
+
+class BuildError(RuntimeError):
+    """The ufunc extension module could not be built"""
+
+    def __init__(self, output):
+        """Set a build error
+
+        Parameters
+        ----------
+        output : str
+            The output of the compiler
+        """
+        self.output = output
+        super().__init__(
+            f"could not build the ufunc extension module:\n{output}")
+
+
+def install():
+    """Build the ufunc extension module to the top package location
+
+    Raises
+    ------
+    BuildError
+        The compilation failed. The compiler output is attached to the error
+    """
+
+    # Check for an existing build
+    source = os.path.join(SRCDIR, "ufunc.c")
+    srchash = checksum((source,))
+
+    meta = Meta("ufunc")
+    if (meta["SRCHASH"] == srchash) and os.path.exists(LIBPATH):
+        return
+
+    # Build the extension
+    if not os.path.exists(LIBDIR):
+        os.makedirs(LIBDIR)
+
+    command = shlex.split(sysconfig.get_config_var("CC") or "cc")
+    command += ["-O3", "-shared", "-fPIC"]
+    if sys.platform == "darwin":
+        command += ["-undefined", "dynamic_lookup"]
+    command += ["-I" + sysconfig.get_paths()["include"],
+                "-I" + numpy.get_include(), "-o", LIBPATH, source]
+    try:
+        subprocess.run(command, check=True, stdout=subprocess.PIPE,
+                       stderr=subprocess.STDOUT, universal_newlines=True)
+    except subprocess.CalledProcessError as error:
+        raise BuildError(error.output) from None
+    except OSError as error:
+        # The compiler could not be executed
+        raise BuildError(str(error)) from None
+
+    # Dump the meta data
+    meta["SRCHASH"] = srchash
+    meta.update()
+
+
+@functools.lru_cache(maxsize=None)
+def load():
+    """Load the ufunc extension module, building it if needed
+
+    Returns
+    -------
+    module or None
+        The extension module, or None if it could not be built, e.g. if no C
+        compiler is available. A warning is then issued, and callers should
+        fall back to the ctypes bindings
+    """
+    try:
+        install()
+        spec = importlib.util.spec_from_file_location(
+            f"{__package__}._ufunc", LIBPATH)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    except (OSError, ImportError, BuildError) as error:
+        warnings.warn(f"{error}\nfalling back to the ctypes bindings",
+                      RuntimeWarning)
+        return None
+    return module
+
+
+def bind(module, lib, names):
+    """Bind library functions to the ufunc extension module
+
+    Parameters
+    ----------
+    module : module
+        The ufunc extension module, as returned by `load`
+    lib : ctypes.CDLL
+        The library exporting the functions
+    names : iterable of str
+        The names of the functions to bind
+    """
+    for name in names:
+        address = ctypes.cast(getattr(lib, name), ctypes.c_void_p).value
+        module.bind(name, address)
+
+
+class Binding:
+    """Compiled ufuncs bound to a library, loaded on first use
+
+    The binding evaluates as false if the ufunc extension is not available.
+    Callers should then fall back to the ctypes bindings. Otherwise, the
+    attributes of the extension module are forwarded.
+    """
+
+    def __init__(self, library, names):
+        """Declare the ufuncs of a library, without loading them
+
+        Parameters
+        ----------
+        library : tools.Library
+            The library exporting the functions
+        names : iterable of str
+            The names of the functions to bind
+        """
+        self._library, self._names = library, tuple(names)
+        self._module, self._loaded = None, False
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return self.load() is not None
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        module = self.load()
+        if module is None:
+            raise AttributeError(name)
+        return getattr(module, name)
+
+    def load(self):
+        """Get the extension module, loading and binding it if needed
+
+        Returns
+        -------
+        module or None
+            The extension module, or None if it could not be built
+        """
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    module = load()
+                    if module is not None:
+                        bind(module, self._library.load(), self._names)
+                    self._module, self._loaded = module, True
+        return self._module
+
+    @property
+    def loaded(self):
+        """Flag telling if the binding has been loaded"""
+        return self._loaded
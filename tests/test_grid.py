@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the grand_libs.grid module
+"""
+
+import os
+import tempfile
+import unittest
+
+import numpy
+
+from grand_libs import grid
+
+
+class GridTest(unittest.TestCase):
+    """Unit tests for the grid sub-package"""
+
+    def test_tile(self):
+        self.assertEqual(grid.tile_name(38, 83), "N38E083")
+        self.assertEqual(grid.tile_name(-1, -72), "S01W072")
+        self.assertEqual(grid.tile_index("N38E083.SRTMGL1.hgt"), (38, 83))
+        self.assertEqual(grid.tile_index("S01W072.grid"), (-1, -72))
+        self.assertEqual(grid.tile_index("map.png"), None)
+
+
+    def test_io(self):
+        data = numpy.arange(12, dtype=numpy.int16).reshape(3, 4)
+        data[2, 3] = numpy.iinfo(numpy.int16).min
+        grid_ = grid.Grid(data, (0, 3), (10, 8), scale=0.5, offset=100)
+        self.assertEqual(grid_.x, (0, 3))
+        self.assertEqual(grid_.y, (10, 8))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "test.grid")
+            grid_.save(path)
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(len(grid.MAGIC)), grid.MAGIC)
+
+            loaded = grid.load(path)
+            self.assertIsInstance(loaded.data, numpy.memmap)
+            self.assertEqual(loaded.data.offset % grid.ALIGNMENT, 0)
+            self.assertTrue(numpy.array_equal(loaded.data, data))
+            self.assertEqual(loaded.x, grid_.x)
+            self.assertEqual(loaded.y, grid_.y)
+            self.assertEqual(loaded.scale, 0.5)
+            self.assertEqual(loaded.offset, 100)
+            self.assertIs(loaded.projection, None)
+            del loaded
+
+            grid.Grid(data, (0, 3), (10, 8), projection="UTM 31N").save(path)
+            loaded = grid.load(path)
+            self.assertEqual(loaded.projection, "UTM 31N")
+            del loaded
+
+            # SRTM tiles are mapped as big endian data, north row first
+            path = os.path.join(tmpdir, "S01W072.hgt")
+            data.astype(">i2").tofile(path)
+            with self.assertRaises(ValueError) as context:
+                grid.load(path)
+            numpy.zeros((3, 3), ">i2").tofile(path)
+            loaded = grid.load(path)
+            self.assertEqual(loaded.data.dtype, numpy.dtype(">i2"))
+            self.assertEqual(loaded.x, (-72, -71))
+            self.assertEqual(loaded.y, (0, -1))
+            del loaded
+
+        with self.assertRaises(ValueError) as context:
+            grid.Grid(data.astype(numpy.int32), (0, 1), (0, 1))
+        with self.assertRaises(ValueError) as context:
+            grid.load("map.png")
+
+
+    def test_store(self):
+        # Check the packing of float data
+        data = numpy.linspace(-100, 900, 12, dtype=numpy.float32)
+        data = data.reshape(3, 4)
+        data[0, 1] = numpy.nan
+        packed = grid.pack(grid.Grid(data, (0, 3), (10, 8)))
+        self.assertEqual(packed.data.dtype, numpy.dtype("<i2"))
+        self.assertEqual(packed.data[0, 1], numpy.iinfo(numpy.int16).min)
+        z = packed.offset + packed.scale * packed.data
+        valid = numpy.isfinite(data)
+        self.assertTrue(numpy.allclose(z[valid], data[valid],
+                                       atol=packed.scale))
+
+        # Check the store roundtrip
+        tile = grid.Grid(numpy.arange(16, dtype=">i2").reshape(4, 4), (3, 4),
+                         (46, 45))
+        grids = {"N45E003": grid.pack(tile), "map": packed}
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "test.store")
+            grid.save_store(path, grids)
+            store = grid.Store(path)
+            self.assertEqual(store.path, path)
+            self.assertEqual(len(store), 2)
+            self.assertEqual(sorted(store), ["N45E003", "map"])
+            self.assertTrue("map" in store)
+            for name, ref in grids.items():
+                loaded = store.get(name)
+                self.assertEqual(loaded.data.ctypes.data % grid.ALIGNMENT, 0)
+                self.assertTrue(numpy.array_equal(loaded.data, ref.data))
+                self.assertEqual(loaded.x, ref.x)
+                self.assertEqual(loaded.y, ref.y)
+                self.assertEqual(loaded.scale, ref.scale)
+                self.assertEqual(loaded.offset, ref.offset)
+            del store, loaded
+
+            with self.assertRaises(ValueError) as context:
+                grid.Store(os.path.join(os.path.dirname(__file__),
+                                        "map.png"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,10 +3,16 @@
 Unit tests for the grand_libs.gull module
 """
 
+import concurrent.futures
+import datetime
 import os
+import tempfile
 import unittest
 
+import numpy
+
 from grand_libs import gull
+from grand_libs.tools import releases_gil
 
 
 class GullTest(unittest.TestCase):
@@ -18,11 +24,17 @@ class GullTest(unittest.TestCase):
 
 
     def test_install(self):
+        gull.install()
         self.assertTrue(os.path.exists(gull.LIBPATH))
 
 
     def test_load(self):
-        self.assertNotEqual(gull._lib, None)
+        self.assertNotEqual(gull._lib.load(), None)
+        self.assertTrue(gull._lib.loaded)
+
+
+    def test_gil(self):
+        self.assertTrue(releases_gil(gull._snapshot_field))
 
 
     def test_snapshot(self):
@@ -51,6 +63,8 @@ class GullTest(unittest.TestCase):
         ref = (0, 2.2983E-05, -4.0852E-05)
 
         m = snapshot(45., 3.)
+        self.assertTrue(numpy.array_equal(
+            m, snapshot(numpy.array([45.]), 3.)))
         tol = 6
         self.assertAlmostEqual(m[0], ref[0], tol)
         self.assertAlmostEqual(m[1], ref[1], tol)
@@ -66,6 +80,225 @@ class GullTest(unittest.TestCase):
             self.assertAlmostEqual(m[i, 2], ref[2], tol)
 
 
+    def test_snapshot_threads(self):
+        snapshot = gull.Snapshot("WMM2015", "2018-06-04")
+        n = 1000
+        latitude = numpy.linspace(-60, 60, n)
+        longitude = numpy.linspace(-180, 180, n)
+        altitude = numpy.linspace(0, 1E+04, n)
+        ref = snapshot(latitude, longitude, altitude)
+
+        # Check the sharded evaluation
+        for workers in (2, 4):
+            m = snapshot.field(latitude, longitude, altitude, workers=workers)
+            self.assertEqual(m.shape, ref.shape)
+            self.assertTrue(numpy.array_equal(m, ref))
+
+        # Check the output buffer
+        buf = numpy.empty((n, 3))
+        m = snapshot.field(latitude, longitude, altitude, workers=2, out=buf)
+        self.assertIs(m, buf)
+        self.assertTrue(numpy.array_equal(buf, ref))
+
+        # Check concurrent calls on a shared snapshot
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            futures = [executor.submit(snapshot, latitude, longitude,
+                                       altitude) for _ in range(8)]
+            for future in futures:
+                self.assertTrue(numpy.array_equal(future.result(), ref))
+
+
+    def test_snapshot_cache(self):
+        gull.Snapshot.clear()
+        snapshot = gull.Snapshot.get("WMM2015", "2018-06-04")
+        self.assertIs(gull.Snapshot.get("WMM2015", "2018-06-04"), snapshot)
+        self.assertIs(gull.Snapshot.get("WMM2015",
+                                        datetime.date(2018, 6, 4)), snapshot)
+        self.assertIsNot(gull.Snapshot.get("WMM2015", "2018-06-05"), snapshot)
+        self.assertIsNot(gull.Snapshot.get(), snapshot)
+        self.assertEqual(gull.Snapshot.get().model, "IGRF12")
+
+        gull.Snapshot.clear()
+        self.assertIsNot(gull.Snapshot.get("WMM2015", "2018-06-04"), snapshot)
+        gull.Snapshot.clear()
+
+        with self.assertRaises(gull.LibraryError):
+            gull.Snapshot.get("Unknown")
+
+
+    def test_grid(self):
+        snapshot = gull.Snapshot("WMM2015", "2018-06-04")
+        latitude = numpy.linspace(-80, 80, 9)
+        longitude = numpy.linspace(-180, 180, 13)
+        altitude = numpy.array((0, 1E+04, 1E+05))
+        m = snapshot.grid(latitude, longitude, altitude)
+        self.assertEqual(m.shape, (9, 13, 3, 3))
+
+        # Check the batched evaluation against the point by point one
+        lat, lon, alt = (a.ravel() for a in numpy.meshgrid(
+            latitude, longitude, altitude, indexing="ij"))
+        ref = snapshot(lat, lon, alt).reshape(m.shape)
+        self.assertTrue(numpy.allclose(m, ref, rtol=0, atol=1E-09))
+
+        m = snapshot.grid(45., 3.)
+        self.assertEqual(m.shape, (1, 1, 1, 3))
+        self.assertTrue(numpy.allclose(m[0, 0, 0], snapshot(45., 3.),
+                                       rtol=0, atol=1E-09))
+
+        # Check the sharded evaluation and the output buffer
+        buf = numpy.empty((9, 13, 3, 3))
+        self.assertIs(snapshot.grid(latitude, longitude, altitude, workers=3,
+                                    out=buf), buf)
+        self.assertTrue(numpy.array_equal(
+            buf, snapshot.grid(latitude, longitude, altitude)))
+
+        with self.assertRaises(gull.LibraryError):
+            snapshot.grid(latitude, longitude, -1E+04)
+
+        # Check the extrapolation before the first epoch of the model
+        snapshot = gull.Snapshot("IGRF12", "2000-01-01")
+        m = snapshot.grid(latitude, longitude, altitude)
+        ref = snapshot(lat, lon, alt).reshape(m.shape)
+        self.assertTrue(numpy.allclose(m, ref, rtol=0, atol=1E-09))
+
+
+    def test_model(self):
+        model = gull.Model("WMM2015", cache_size=4)
+        self.assertEqual(model.model, "WMM2015")
+        self.assertEqual(model.order, 12)
+        self.assertEqual(model.epochs, (2015.,))
+        self.assertEqual(model.altitude, (-1E+03, 600E+03))
+        self.assertEqual(model.cache_size, 4)
+
+        # Check the evaluation against snapshots
+        dates = ("2018-06-04", "2017-01-01", "2019-12-31")
+        snapshots = [gull.Snapshot("WMM2015", date) for date in dates]
+        m = model(dates[0], 45., 3.)
+        self.assertEqual(m.shape, (3,))
+        self.assertTrue(numpy.allclose(m, snapshots[0](45., 3.), rtol=0,
+                                       atol=1E-09))
+
+        n = 30
+        date = numpy.array(10 * dates, "datetime64[D]")
+        latitude = numpy.linspace(-60, 60, n)
+        longitude = numpy.linspace(-180, 180, n)
+        altitude = numpy.linspace(0, 1E+04, n)
+        m = model.field(date, latitude, longitude, altitude)
+        self.assertEqual(m.shape, (n, 3))
+        for i in range(n):
+            ref = snapshots[i % 3](latitude[i], longitude[i], altitude[i])
+            self.assertTrue(numpy.allclose(m[i], ref, rtol=0, atol=1E-09))
+
+        buf = numpy.empty((n, 3))
+        self.assertIs(model.field(date, latitude, longitude, altitude,
+                                  workers=4, out=buf), buf)
+        self.assertTrue(numpy.array_equal(buf, m))
+
+        # Check the broadcasting of dates
+        m = model(date[:3, None], 45., numpy.array((2., 3.)))
+        self.assertEqual(m.shape, (3, 2, 3))
+        self.assertTrue(numpy.array_equal(m[1, 1], model(dates[1], 45., 3.)))
+
+        # Check the coefficients cache
+        for day in range(1, 11):
+            model(f"2018-01-{day:02d}", 45., 3.)
+        self.assertEqual(len(model._cache), 4)
+        g, h = model.coefficients("2018-01-10")
+        self.assertEqual(g.size, 91)
+        self.assertEqual(h[0], 0)
+
+        with self.assertRaises(gull.LibraryError):
+            model(dates[0], 45., 3., -1E+04)
+
+        # Check dates before the first epoch of the model
+        model = gull.Model("IGRF12")
+        for date in ("1999-12-31", "1950-06-01", "2007-03-15"):
+            ref = gull.Snapshot("IGRF12", date)(45., 3.)
+            self.assertTrue(numpy.allclose(model(date, 45., 3.), ref,
+                                           rtol=0, atol=1E-09))
+
+        with self.assertRaises(gull.LibraryError):
+            gull.Model("Unknown")
+
+
+    def test_tabulate(self):
+        snapshot = gull.Snapshot("WMM2015", "2018-06-04")
+        bbox = ((44, 46), (2, 4), (0, 5E+03))
+        table = snapshot.tabulate(bbox, (0.1, 0.1, 500))
+        self.assertIs(snapshot.tabulate(bbox, (0.1, 0.1, 500)), table)
+        self.assertEqual(table.data.shape, (21, 21, 11, 3))
+        self.assertEqual(table.latitude, (44, 46))
+        self.assertEqual(table.altitude, (0, 5E+03))
+        self.assertEqual(table.model, "WMM2015")
+        self.assertIsNone(table.path)
+        self.assertLess(table.relative_error, 1E-03)
+
+        # Check the interpolation against the full model
+        n = 100
+        latitude = numpy.linspace(44.03, 45.97, n)
+        longitude = numpy.linspace(3.95, 2.05, n)
+        altitude = numpy.linspace(10, 4990, n)
+        ref = snapshot(latitude, longitude, altitude)
+        m = table(latitude, longitude, altitude)
+        self.assertEqual(m.shape, ref.shape)
+        error = numpy.linalg.norm(m - ref, axis=-1)
+        self.assertTrue((error <= 2 * table.error + 1E-15).all())
+        self.assertTrue(numpy.array_equal(
+            table.field(latitude, longitude, altitude, workers=2), m))
+        self.assertTrue(numpy.array_equal(
+            table(float(latitude[1]), float(longitude[1]),
+                  float(altitude[1])), m[1]))
+
+        # Check the grid nodes and the outer points
+        self.assertTrue(numpy.allclose(table(44., 2., 0.),
+                                       snapshot(44., 2., 0.), rtol=1E-12))
+        self.assertTrue(numpy.isnan(table(43., 3., 0.)).all())
+        self.assertTrue(numpy.isnan(table(45., 3., -1.)).all())
+
+        # Check the memory mapped file
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "field.grid")
+            other = gull.Snapshot("WMM2015", "2018-06-04")
+            mapped = other.tabulate(bbox, (0.1, 0.1, 500), path)
+            self.assertEqual(mapped.path, path)
+            self.assertIsInstance(mapped.data, numpy.memmap)
+            self.assertTrue(numpy.array_equal(
+                mapped(latitude, longitude, altitude), m))
+            self.assertEqual(mapped.error, table.error)
+
+            loaded = gull.FieldGrid(path)
+            self.assertEqual(loaded.date, snapshot.date)
+            self.assertTrue(numpy.array_equal(
+                loaded(latitude, longitude, altitude), m))
+
+            # A cached table is saved when a path is provided
+            path = os.path.join(tmpdir, "cached.grid")
+            saved = snapshot.tabulate(bbox, (0.1, 0.1, 500), path)
+            self.assertIsNot(saved, table)
+            self.assertEqual(saved.path, path)
+            self.assertTrue(os.path.exists(path))
+            self.assertIsInstance(saved.data, numpy.memmap)
+            self.assertTrue(numpy.array_equal(
+                saved(latitude, longitude, altitude), m))
+            self.assertIs(snapshot.tabulate(bbox, (0.1, 0.1, 500)), saved)
+            self.assertIs(snapshot.tabulate(bbox, (0.1, 0.1, 500), path),
+                          saved)
+
+            # A mismatching file is overwritten
+            other = gull.Snapshot("WMM2015", "2018-06-05")
+            mapped = other.tabulate(bbox, (0.1, 0.1, 500), path)
+            self.assertEqual(gull.FieldGrid(path).date, other.date)
+
+        # Check the bounded cache of tables
+        snapshot = gull.Snapshot("WMM2015", "2018-06-04")
+        bbox = ((44, 45), (2, 3), (0, 1E+03))
+        tables = [snapshot.tabulate(bbox, (0.5, 0.5, 500 + i))
+                  for i in range(gull.TABLES_SIZE + 1)]
+        self.assertIs(snapshot.tabulate(bbox, (0.5, 0.5, 500 + 1)),
+                      tables[1])
+        self.assertIsNot(snapshot.tabulate(bbox, (0.5, 0.5, 500)), tables[0])
+
+
     def test_snapshot_error(self):
         with self.assertRaises(gull.LibraryError) as context:
             snapshot = gull.Snapshot("Unknown")
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the grand_libs.parallel module
+"""
+
+import os
+import unittest
+import unittest.mock
+
+import numpy
+
+import grand_store
+from grand_libs import gull, parallel, turtle
+
+
+class ParallelTest(unittest.TestCase):
+    """Unit tests for the parallel module"""
+
+    def test_share(self):
+        a = parallel.empty((10, 3))
+        self.assertEqual(a.shape, (10, 3))
+        self.assertIs(parallel.share(a), a)
+        v = a[2:5]
+        self.assertIs(parallel.share(v), v)
+
+        b = numpy.arange(5.)
+        c = parallel.share(b)
+        if parallel.shared_memory is not None:
+            self.assertIsNot(c, b)
+        self.assertTrue(numpy.array_equal(c, b))
+        self.assertIs(parallel.share(c), c)
+
+
+    def test_pickled(self):
+        n = 100
+        latitude = numpy.linspace(-60, 60, n)
+        longitude = numpy.linspace(-180, 180, n)
+        altitude = numpy.linspace(0, 1E+04, n)
+        ref = gull.Snapshot("WMM2015", "2018-06-04").field(
+            latitude, longitude, altitude)
+
+        # Check the fallback for Python versions without shared memory
+        with unittest.mock.patch.object(parallel, "shared_memory", None):
+            a = parallel.empty((10, 3))
+            self.assertEqual(parallel._describe(a), None)
+            with parallel.Snapshot("WMM2015", "2018-06-04",
+                                   processes=2) as s:
+                field = s(latitude, longitude, altitude)
+                self.assertTrue(numpy.array_equal(field, ref))
+
+                buf = numpy.empty((n, 3))
+                self.assertIs(s(latitude, longitude, altitude, out=buf), buf)
+                self.assertTrue(numpy.array_equal(buf, ref))
+
+
+    def test_snapshot(self):
+        n = 1000
+        latitude = numpy.linspace(-60, 60, n)
+        longitude = numpy.linspace(-180, 180, n)
+        altitude = numpy.linspace(0, 1E+04, n)
+        ref = gull.Snapshot("WMM2015", "2018-06-04")(latitude, longitude,
+                                                      altitude)
+
+        with parallel.Snapshot("WMM2015", "2018-06-04", processes=2) as s:
+            self.assertEqual(s.model, "WMM2015")
+            self.assertEqual(s.processes, 2)
+            field = s(latitude, longitude, altitude)
+            self.assertEqual(field.shape, (n, 3))
+            self.assertTrue(numpy.array_equal(field, ref))
+
+            buf = parallel.empty((n, 3))
+            field = s(latitude, longitude, altitude, out=buf)
+            self.assertIs(field, buf)
+            self.assertTrue(numpy.array_equal(buf, ref))
+
+            buf = numpy.empty((n, 3))
+            field = s(latitude, longitude, altitude, out=buf)
+            self.assertIs(field, buf)
+            self.assertTrue(numpy.array_equal(buf, ref))
+
+            field = s(latitude[0], longitude[0], altitude[0])
+            self.assertEqual(field.shape, (3,))
+            self.assertTrue(numpy.array_equal(field, ref[0]))
+
+            # Check empty inputs
+            field = s(latitude[:0], longitude[:0], altitude[:0])
+            self.assertEqual(field.shape, (0, 3))
+            buf = numpy.empty((0, 3))
+            self.assertIs(s(latitude[:0], longitude[:0], altitude[:0],
+                            out=buf), buf)
+
+
+    def test_stack(self):
+        # Fetch a test tile
+        dirname, basename = "tests/topography", "N38E083.SRTMGL1.hgt"
+        path = os.path.join(dirname, basename)
+        if not os.path.exists(path):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                pass
+            with open(path, "wb") as f:
+                f.write(grand_store.get(basename))
+
+        n = 100
+        latitude = parallel.share(numpy.linspace(38.1, 38.9, n))
+        longitude = parallel.share(numpy.linspace(83.1, 83.9, n))
+        ref = turtle.Stack(dirname).elevation(latitude, longitude)
+
+        with parallel.Stack(dirname, processes=2) as stack:
+            self.assertEqual(stack.path, dirname)
+            elevation = stack.elevation(latitude, longitude)
+            self.assertTrue(numpy.array_equal(elevation, ref))
+
+            elevation = stack.elevation(45.5, 3.5)
+            self.assertTrue(numpy.isnan(elevation))
+
+
+if __name__ == "__main__":
+    unittest.main()
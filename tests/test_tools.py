@@ -3,7 +3,10 @@
 Unit tests for the grand_libs.tools module
 """
 
+import ctypes
 import os
+import subprocess
+import sys
 import unittest
 
 import grand_libs.tools
@@ -32,5 +35,105 @@ class ToolsTest(unittest.TestCase):
         self.assertEqual(path, os.getcwd())
 
 
+    def test_define(self):
+        libc = ctypes.CDLL(None)
+
+        @grand_libs.tools.define(libc.abs, arguments=(ctypes.c_int,),
+                                 result=ctypes.c_int)
+        def _abs(i):
+            pass
+
+        self.assertEqual(_abs(-3), 3)
+        self.assertTrue(grand_libs.tools.releases_gil(_abs))
+
+        libpy = ctypes.PyDLL(None)
+        self.assertFalse(grand_libs.tools.releases_gil(libpy.abs))
+        with self.assertRaises(ValueError) as context:
+            grand_libs.tools.define(libpy.abs)
+
+
+    def test_library(self):
+        installed = []
+        library = grand_libs.tools.Library(None, lambda: installed.append(1))
+        self.assertFalse(library.loaded)
+
+        @grand_libs.tools.define(library.abs, arguments=(ctypes.c_int,),
+                                 result=ctypes.c_int)
+        def _abs(i):
+            pass
+
+        self.assertFalse(library.loaded)
+        self.assertEqual(_abs(-3), 3)
+        self.assertTrue(library.loaded)
+        self.assertEqual(installed, [1])
+        self.assertTrue(grand_libs.tools.releases_gil(_abs))
+        self.assertIsNot(_abs.__wrapped__, library.abs)
+
+        library.load()
+        self.assertEqual(installed, [1])
+
+
+    def test_lazy_import(self):
+        # Importing the wrappers must not load, nor install, the libraries
+        code = "; ".join((
+            "from grand_libs import gull, turtle",
+            "assert not (gull._lib.loaded or turtle._lib.loaded)",
+            "assert not (gull._ufunc.loaded or turtle._ufunc.loaded)"))
+        subprocess.run((sys.executable, "-c", code), check=True)
+
+        grand_libs.install()
+        grand_libs.install()
+
+
+    def test_pool(self):
+        created, destroyed = [], []
+        def create():
+            created.append(len(created))
+            return created[-1]
+
+        pool = grand_libs.tools.Pool(create, destroyed.append)
+        with pool.lease() as a:
+            with pool.lease() as b:
+                self.assertNotEqual(a, b)
+        with pool.lease() as c:
+            self.assertIn(c, (a, b))
+        self.assertEqual(len(created), 2)
+
+        pool.clear()
+        self.assertEqual(sorted(destroyed), [0, 1])
+
+
+    def test_cache(self):
+        class Item:
+            def __init__(self, *args):
+                self.args = args
+
+        cache = grand_libs.tools.Cache(Item, size=2)
+        a = cache.get(1, "a")
+        self.assertEqual(a.args, (1, "a"))
+        self.assertIs(cache.get(1, "a"), a)
+        self.assertIsNot(cache.get(2, "a"), a)
+        self.assertEqual(cache.size, 2)
+
+        # Evicted objects are shared while alive, and released otherwise
+        cache.get(3, "a")
+        self.assertIs(cache.get(1, "a"), a)
+        self.assertEqual(len(cache), 2)
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertIsNot(cache.get(1, "a"), a)
+
+
+    def test_shard(self):
+        for workers in (None, 1, 3, 20):
+            done = 10 * [0]
+            def function(s):
+                for i in range(s.start, s.stop):
+                    done[i] += 1
+            grand_libs.tools.shard(function, len(done), workers)
+            self.assertEqual(done, 10 * [1])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -4,12 +4,29 @@ Unit tests for the grand_libs.turtle module
 """
 
 import os
+import tempfile
 import unittest
+import unittest.mock
 
 import numpy
 
 import grand_store
-from grand_libs import turtle
+from grand_libs import grid, turtle
+from grand_libs.tools import releases_gil
+
+
+def fetch_tile():
+    """Fetch a test tile, and return the topography directory"""
+    dirname, basename = "tests/topography", "N38E083.SRTMGL1.hgt"
+    path = os.path.join(dirname, basename)
+    if not os.path.exists(path):
+        try:
+            os.makedirs(dirname)
+        except OSError:
+            pass
+        with open(path, "wb") as f:
+            f.write(grand_store.get(basename))
+    return dirname
 
 
 class TurtleTest(unittest.TestCase):
@@ -20,11 +37,22 @@ class TurtleTest(unittest.TestCase):
         self.assertNotEqual(turtle.LIBHASH, None)
 
     def test_install(self):
+        turtle.install()
         self.assertTrue(os.path.exists(turtle.LIBPATH))
 
 
     def test_load(self):
-        self.assertNotEqual(turtle._lib, None)
+        self.assertNotEqual(turtle._lib.load(), None)
+        self.assertTrue(turtle._lib.loaded)
+
+    def test_gil(self):
+        # Check that vectorized functions run without the GIL
+        for function in (turtle._ecef_from_geodetic,
+                         turtle._ecef_from_horizontal,
+                         turtle._ecef_to_geodetic, turtle._ecef_to_horizontal,
+                         turtle._map_elevation, turtle._stack_elevation,
+                         turtle._client_elevation):
+            self.assertTrue(releases_gil(function))
 
     def test_ecef(self):
         # Reference values
@@ -86,18 +114,153 @@ class TurtleTest(unittest.TestCase):
         for i in range(n):
             self.assertAlmostEqual(horizontal[1][i], ref["horizontal"][1], 0)
 
+        # Check the output buffers
+        buf = numpy.empty((n, 3))
+        ecef = turtle.ecef_from_geodetic(n * (ref["geodetic"][0],),
+            n * (ref["geodetic"][1],), n * (ref["geodetic"][2],), out=buf)
+        self.assertIs(ecef, buf)
+        for i in range(n):
+            for j in range(3):
+                self.assertAlmostEqual(ecef[i,j], ref["ecef"][j], 4)
+
+        direction = turtle.ecef_from_horizontal(ref["geodetic"][0],
+            ref["geodetic"][1], ref["horizontal"][0], ref["horizontal"][1],
+            out=numpy.empty(3))
+        for i in range(3):
+            self.assertAlmostEqual(direction[i], ref["direction"][i], 2)
+
+        bufs = [numpy.empty(n) for _ in range(3)]
+        geodetic = turtle.ecef_to_geodetic(ecef, out=bufs)
+        for i in range(3):
+            self.assertIs(geodetic[i], bufs[i])
+            for j in range(n):
+                self.assertAlmostEqual(bufs[i][j], ref["geodetic"][i], 4)
+
+        horizontal = turtle.ecef_to_horizontal(n * (ref["geodetic"][0],),
+            n * (ref["geodetic"][1],), n * (ref["direction"],), out=bufs[:2])
+        for i in range(n):
+            self.assertAlmostEqual(bufs[1][i], ref["horizontal"][1], 0)
+
+        if not turtle._ufunc:
+            with self.assertRaises(TypeError) as context:
+                turtle.ecef_from_geodetic(*ref["geodetic"], out=buf[:, 0])
+        else:
+            # The compiled ufuncs accept strided buffers and broadcasting
+            buf = numpy.empty((3, n))
+            ecef = turtle.ecef_from_geodetic(ref["geodetic"][0],
+                n * (ref["geodetic"][1],), ref["geodetic"][2], out=buf.T)
+            for i in range(n):
+                for j in range(3):
+                    self.assertAlmostEqual(buf[j,i], ref["ecef"][j], 4)
+        with self.assertRaises(ValueError) as context:
+            turtle.ecef_from_geodetic(*ref["geodetic"],
+                                      out=numpy.empty((n, 2)))
+
+
+    def test_scalar(self):
+        # Check that the scalar path matches the vectorized one
+        geodetic = (45., 3, 1E+03)
+        vectorized = [numpy.array([v]) for v in geodetic]
+        ecef = turtle.ecef_from_geodetic(*geodetic)
+        self.assertIsInstance(ecef, numpy.ndarray)
+        self.assertTrue(numpy.array_equal(
+            ecef, turtle.ecef_from_geodetic(*vectorized)))
+
+        self.assertEqual(turtle.ecef_to_geodetic(tuple(ecef)),
+            tuple(turtle.ecef_to_geodetic(ecef)))
+
+        direction = turtle.ecef_from_horizontal(45., 3., 30., 10.)
+        self.assertTrue(numpy.array_equal(direction,
+            turtle.ecef_from_horizontal(45., 3., numpy.array([30.]), 10.)))
+
+        self.assertEqual(turtle.ecef_to_horizontal(45., 3., list(direction)),
+            tuple(turtle.ecef_to_horizontal(45., 3., direction)))
+
+        path = os.path.join(os.path.dirname(__file__), "map.png")
+        map_ = turtle.Map(path)
+        x, y = 496000.5, 5067000.5
+        self.assertEqual(map_.elevation(x, y),
+                         map_.elevation(numpy.array([x]), y))
+
+    def test_packed(self):
+        # Check the n x 3 and structured layouts of geodetic coordinates
+        n = 10
+        geodetic = numpy.empty((n, 3))
+        geodetic[:, 0] = numpy.linspace(-60, 60, n)
+        geodetic[:, 1] = numpy.linspace(-180, 180, n)
+        geodetic[:, 2] = numpy.linspace(0, 1E+03, n)
+        ref = turtle.ecef_from_geodetic(*geodetic.T)
+
+        ecef = turtle.ecef_from_geodetic(geodetic)
+        self.assertTrue(numpy.array_equal(ecef, ref))
+        self.assertTrue(numpy.array_equal(
+            turtle.ecef_from_geodetic(tuple(geodetic[0])), ref[0]))
+
+        records = numpy.empty(n, turtle.GEODETIC)
+        for i, name in enumerate(("latitude", "longitude", "altitude")):
+            records[name] = geodetic[:, i]
+        self.assertTrue(numpy.array_equal(
+            turtle.ecef_from_geodetic(records), ref))
+
+        stacked = turtle.ecef_to_geodetic(ecef, layout="stacked")
+        self.assertEqual(stacked.shape, (n, 3))
+        self.assertTrue(numpy.allclose(stacked, geodetic))
+
+        buf = numpy.empty(n, turtle.GEODETIC)
+        structured = turtle.ecef_to_geodetic(ecef, out=buf,
+                                             layout="structured")
+        self.assertIs(structured, buf)
+        for name in turtle.GEODETIC.names:
+            self.assertTrue(numpy.allclose(structured[name], records[name]))
+
+        with self.assertRaises(ValueError) as context:
+            turtle.ecef_to_geodetic(ecef, layout="packed")
+        with self.assertRaises(ValueError) as context:
+            turtle.ecef_from_geodetic(numpy.empty((n, 2)))
+        with self.assertRaises(ValueError) as context:
+            turtle.ecef_from_geodetic(45., 3.)
+
+    def test_fused(self):
+        # Check the fused kernels against their composition
+        n = 10
+        observer = (45., 3., 1E+03)
+        target = numpy.empty((n, 3))
+        target[:, 0] = numpy.linspace(44, 46, n)
+        target[:, 1] = numpy.linspace(2, 4, n)
+        target[:, 2] = numpy.linspace(0, 1E+04, n)
+
+        r0 = turtle.ecef_from_geodetic(observer)
+        r1 = turtle.ecef_from_geodetic(target)
+        u = r1 - r0
+        d = numpy.linalg.norm(u, axis=1)
+        ref = turtle.ecef_to_horizontal(n * (observer[0],),
+            n * (observer[1],), u / d[:, None])
+
+        azimuth, elevation, distance = turtle.horizontal_from_geodetic(
+            observer, target)
+        self.assertTrue(numpy.allclose(azimuth, ref[0]))
+        self.assertTrue(numpy.allclose(elevation, ref[1]))
+        self.assertTrue(numpy.allclose(distance, d))
+
+        horizontal = turtle.horizontal_from_geodetic(observer, observer)
+        self.assertTrue(numpy.isnan(horizontal[0]))
+        self.assertEqual(horizontal[2], 0)
+
+        # Check the ENU transforms
+        enu = turtle.enu_from_ecef(observer, r1)
+        self.assertEqual(enu.shape, (n, 3))
+        self.assertTrue(numpy.allclose(numpy.linalg.norm(enu, axis=1), d))
+        self.assertTrue(numpy.allclose(turtle.ecef_from_enu(observer, enu),
+                                       r1))
+
+        up = turtle.ecef_from_geodetic(observer[0], observer[1],
+                                       observer[2] + 1E+02)
+        self.assertTrue(numpy.allclose(turtle.enu_from_ecef(observer, up),
+                                       (0, 0, 1E+02), atol=1E-06))
 
     def test_stack(self):
         # Fetch a test tile
-        dirname, basename = "tests/topography", "N38E083.SRTMGL1.hgt"
-        path = os.path.join(dirname, basename)
-        if not os.path.exists(path):
-            try:
-                os.makedirs(dirname)
-            except OSError:
-                pass
-            with open(path, "wb") as f:
-                f.write(grand_store.get(basename))
+        dirname = fetch_tile()
 
         # Check the stack initalisation
         stack = turtle.Stack(dirname)
@@ -109,6 +272,9 @@ class TurtleTest(unittest.TestCase):
         elevation = stack.elevation(38.5, 83.5)
         self.assertFalse(numpy.isnan(elevation))
 
+        self.assertIsInstance(elevation, float)
+        self.assertEqual(elevation, stack.elevation(numpy.array([38.5]), 83.5))
+
         # Check the elevation getter for out of map entries
         elevation = stack.elevation(45.5, 3.5)
         self.assertTrue(numpy.isnan(elevation))
@@ -119,9 +285,50 @@ class TurtleTest(unittest.TestCase):
         for i in range(n):
             self.assertFalse(numpy.isnan(elevation[i]))
 
+        # Check the elevation getter with an output buffer
+        buf = numpy.empty(n)
+        elevation = stack.elevation(n * (38.5,), n * (83.5,), out=buf)
+        self.assertIs(elevation, buf)
+        for i in range(n):
+            self.assertFalse(numpy.isnan(buf[i]))
+
         # Check the manual deletion
         del stack
 
+        # Check the thread safe stack
+        stack = turtle.Stack(dirname, threadsafe=True)
+        self.assertTrue(stack.threadsafe)
+        elevation = stack.elevation(38.5, 83.5)
+        self.assertFalse(numpy.isnan(elevation))
+
+        n = 100
+        latitude = numpy.linspace(38.1, 38.9, n)
+        longitude = numpy.linspace(83.1, 83.9, n)
+        ref = stack.elevation(latitude, longitude)
+        elevation = stack.elevation(latitude, longitude, workers=4)
+        for i in range(n):
+            self.assertEqual(elevation[i], ref[i])
+        del stack
+
+        with self.assertRaises(ValueError) as context:
+            turtle.Stack(dirname).elevation(latitude, longitude, workers=4)
+
+        # Check the evaluation grouped by tile
+        stack = turtle.Stack(dirname, stack_size=1)
+        latitude = numpy.array(((38.5, 45.5, 38.2), (46.5, 38.7, 45.1)))
+        longitude = numpy.array(((83.5, 3.5, 83.2), (4.5, 83.7, 3.1)))
+        ref = stack.elevation(latitude.ravel(), longitude.ravel())
+        ref = ref.reshape(latitude.shape)
+        elevation = stack.elevation(latitude, longitude, reorder=True)
+        self.assertEqual(elevation.shape, (2, 3))
+        self.assertTrue(numpy.array_equal(elevation, ref, equal_nan=True))
+        buf = numpy.empty((3, 2)).T
+        stack.elevation(latitude, longitude, out=buf, reorder=True)
+        self.assertTrue(numpy.array_equal(buf, ref, equal_nan=True))
+        self.assertEqual(stack.elevation(38.5, 83.5, reorder=True),
+                         ref[0, 0])
+        del stack
+
         # Check the empty stack initalisation
         stack = turtle.Stack("")
         self.assertNotEqual(stack._stack, None)
@@ -133,6 +340,527 @@ class TurtleTest(unittest.TestCase):
         self.assertTrue(numpy.isnan(elevation))
 
 
+    def test_mmap(self):
+        # Check the memory mapped stack against the native one
+        dirname = fetch_tile()
+        n = 100
+        latitude = numpy.linspace(38.01, 38.99, n)
+        longitude = numpy.linspace(83.01, 83.99, n)
+        ref = turtle.Stack(dirname).elevation(latitude, longitude)
+
+        stack = turtle.Stack(dirname, mmap=True)
+        self.assertTrue(stack.mmap)
+        self.assertTrue(stack.threadsafe)
+        elevation = stack.elevation(latitude, longitude)
+        self.assertTrue(numpy.allclose(elevation, ref))
+        self.assertEqual(stack.elevation(38.5, 83.5),
+                         stack.elevation(numpy.array([38.5]), 83.5))
+        self.assertTrue(numpy.isnan(stack.elevation(45.5, 3.5)))
+
+        elevation = stack.elevation(numpy.concatenate((latitude, (45.5,))),
+            numpy.concatenate((longitude, (3.5,))), workers=2)
+        self.assertTrue(numpy.array_equal(elevation[:n], stack.elevation(
+            latitude, longitude)))
+        self.assertTrue(numpy.isnan(elevation[n]))
+
+        # Check the memory mapped map against the native one
+        path = os.path.join(dirname, "N38E083.SRTMGL1.hgt")
+        map_ = turtle.Map(path, mmap=True)
+        self.assertTrue(map_.mmap)
+        self.assertTrue(numpy.allclose(map_.elevation(longitude, latitude),
+                                       turtle.Map(path).elevation(longitude,
+                                                                  latitude)))
+
+        # Check the conversion to a raw grid
+        path = os.path.join(os.path.dirname(__file__), "map.png")
+        map_ = turtle.Map(path)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            grid_path = os.path.join(tmpdir, "map.grid")
+            map_.save(grid_path)
+            grid_map = turtle.Map(grid_path)
+            self.assertTrue(grid_map.mmap)
+            x = numpy.linspace(495000, 497000, 11)
+            y = numpy.linspace(5066000, 5068000, 11)
+            self.assertTrue(numpy.allclose(grid_map.elevation(x, y),
+                                           map_.elevation(x, y)))
+            self.assertTrue(numpy.isnan(grid_map.elevation(0, 0)))
+            del grid_map
+
+        with self.assertRaises(ValueError) as context:
+            turtle.Map(path, mmap=True)
+
+
+    def test_mmap_edges(self):
+        # Check the tiles at the northern and eastern edges of the globe
+        path = os.path.join(fetch_tile(), "N38E083.SRTMGL1.hgt")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in ("N38E179", "N39W180", "N89E083"):
+                with open(path, "rb") as f, \
+                     open(os.path.join(tmpdir, name + ".SRTMGL1.hgt"),
+                          "wb") as g:
+                    g.write(f.read())
+
+            latitude = numpy.array((38.5, 90., 90., 38.5, 95.))
+            longitude = numpy.array((180., 83.5, 180., -180., 3.5))
+            ref = turtle.Stack(tmpdir).elevation(latitude[:4], longitude[:4])
+            self.assertFalse(numpy.isnan(ref[:2]).any())
+
+            stack = turtle.Stack(tmpdir, mmap=True)
+            elevation = stack.elevation(latitude, longitude)
+            self.assertTrue(numpy.allclose(elevation[:4], ref,
+                                           equal_nan=True))
+            self.assertTrue(numpy.isnan(elevation[4]))
+            for i, z in enumerate(elevation):
+                self.assertTrue(numpy.allclose(stack.elevation(
+                    float(latitude[i]), float(longitude[i])), z,
+                    equal_nan=True))
+            stack.pin((89.5, 90), (179.5, 180))
+            del stack
+
+
+    def test_stack_cache(self):
+        dirname = fetch_tile()
+        turtle.Stack.clear()
+        stack = turtle.Stack.get(dirname)
+        self.assertIs(turtle.Stack.get(dirname), stack)
+        self.assertIs(turtle.Stack.get(os.path.join(dirname, ".")), stack)
+        self.assertIsNot(turtle.Stack.get(dirname, 1), stack)
+        self.assertIsNot(turtle.Stack.get(dirname, mmap=True), stack)
+        self.assertEqual(stack.elevation(38.5, 83.5),
+                         turtle.Stack(dirname).elevation(38.5, 83.5))
+
+        turtle.Stack.clear()
+        self.assertIsNot(turtle.Stack.get(dirname), stack)
+        turtle.Stack.clear()
+
+
+    def test_prefetch(self):
+        dirname = fetch_tile()
+        latitude = numpy.linspace(38.01, 38.99, 100)
+        longitude = numpy.linspace(83.01, 83.99, 100)
+
+        # Check the prefetching of memory mapped tiles
+        stack = turtle.Stack(dirname, mmap=True)
+        stack.prefetch((37.5, 38.5), (82.5, 83.5), wait=True)
+        self.assertEqual(list(stack._tiles._tiles), [(38, 83)])
+        self.assertEqual(stack._tiles._pending, {})
+        ref = stack.elevation(latitude, longitude)
+
+        # Check that the batch footprint is prefetched
+        stack = turtle.Stack(dirname, mmap=True)
+        elevation = stack.elevation(numpy.concatenate(((45.5,), latitude)),
+            numpy.concatenate(((3.5,), longitude)))
+        self.assertTrue(numpy.isnan(elevation[0]))
+        self.assertTrue(numpy.array_equal(elevation[1:], ref))
+
+        # Check the prefetching of native tiles
+        stack = turtle.Stack(dirname, threadsafe=True)
+        stack.prefetch((38, 38.5), (83, 83.5), wait=True)
+        self.assertTrue(numpy.allclose(stack.elevation(latitude, longitude),
+                                       ref))
+        del stack
+
+        with self.assertRaises(ValueError) as context:
+            turtle.Stack(dirname).prefetch((38, 39), (83, 84))
+
+
+    def test_stack_error(self):
+        path = os.path.join(fetch_tile(), "N38E083.SRTMGL1.hgt")
+        latitude = numpy.linspace(38.1, 38.9, 5)
+        longitude = numpy.linspace(83.1, 83.9, 5)
+        origin = turtle.ecef_from_geodetic(latitude, longitude,
+                                           numpy.full(5, 1E+04))
+        target = turtle.ecef_from_geodetic(latitude, longitude,
+                                           numpy.full(5, -1E+03))
+
+        # Library errors raise, with or without the compiled ufuncs
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tile = os.path.join(tmpdir, os.path.basename(path))
+            for ufunc in (turtle._ufunc, None):
+                for threadsafe in (False, True):
+                    with open(path, "rb") as f, open(tile, "wb") as g:
+                        g.write(f.read())
+                    stack = turtle.Stack(tmpdir, threadsafe=threadsafe)
+                    os.remove(tile)
+                    with unittest.mock.patch.object(turtle, "_ufunc", ufunc):
+                        with self.assertRaises(turtle.LibraryError):
+                            stack.elevation(latitude, longitude)
+                        with self.assertRaises(turtle.LibraryError):
+                            stack.intersect(origin, target - origin, 2E+04)
+                        with self.assertRaises(turtle.LibraryError):
+                            stack.visible(origin, target)
+                    del stack
+
+
+    def test_intersect(self):
+        dirname = fetch_tile()
+        stack = turtle.Stack(dirname)
+
+        # Check vertical rays
+        latitude = numpy.linspace(38.1, 38.9, 5)
+        longitude = numpy.linspace(83.1, 83.9, 5)
+        origin = turtle.ecef_from_geodetic(latitude, longitude,
+                                           numpy.full(5, 1E+04))
+        ground = turtle.ecef_from_geodetic(latitude, longitude,
+                                           numpy.zeros(5))
+        direction = ground - origin
+        position, distance = stack.intersect(origin, direction, 2E+04)
+        self.assertEqual(position.shape, (5, 3))
+        self.assertEqual(distance.shape, (5,))
+        z = stack.elevation(latitude, longitude)
+        self.assertTrue(numpy.allclose(distance, 1E+04 - z, atol=1E-02))
+        altitude = turtle.ecef_to_geodetic(position)[2]
+        self.assertTrue(numpy.allclose(altitude, z, atol=1E-02))
+
+        p, d = stack.intersect(origin[0], direction[0], 2E+04)
+        self.assertEqual(p.shape, (3,))
+        self.assertTrue(numpy.allclose(d, distance[0]))
+
+        # Outside of the topography, the ground is the ellipsoid
+        r0 = turtle.ecef_from_geodetic(45.5, 3.5, 1E+03)
+        _, d = stack.intersect(r0, -r0, 2E+03)
+        self.assertTrue(abs(d - 1E+03) < 1E-02)
+
+        # Check inclined rays, and rays missing the ground
+        direction = turtle.ecef_from_horizontal(latitude, longitude,
+            numpy.full(5, 30.), numpy.full(5, -20.))
+        direction[-1] = turtle.ecef_from_horizontal(38.9, 83.9, 0, 20)
+        position, distance = stack.intersect(origin, direction, 1E+05,
+                                             step=5)
+        self.assertTrue(numpy.all(numpy.isnan(position[-1])))
+        self.assertTrue(numpy.isnan(distance[-1]))
+        latitude, longitude, altitude = turtle.ecef_to_geodetic(
+            position[:-1])
+        self.assertTrue(numpy.allclose(altitude, stack.elevation(latitude,
+            longitude), atol=1E-02))
+        _, d = stack.intersect(origin[:-1], direction[:-1], distance[:-1] -
+                               1)
+        self.assertTrue(numpy.all(numpy.isnan(d)))
+
+        # Null directions yield NaN
+        for ufunc in (turtle._ufunc, None):
+            with unittest.mock.patch.object(turtle, "_ufunc", ufunc):
+                p, d = stack.intersect(origin[:2], numpy.zeros((2, 3)),
+                                       1E+03)
+                self.assertTrue(numpy.all(numpy.isnan(p)))
+                self.assertTrue(numpy.all(numpy.isnan(d)))
+
+        # Check memory mapped and threadsafe stacks
+        ref = distance
+        _, distance = turtle.Stack(dirname, mmap=True).intersect(origin,
+            direction, 1E+05, step=5, workers=2)
+        self.assertTrue(numpy.allclose(distance, ref, atol=1E-02,
+                                       equal_nan=True))
+        stack = turtle.Stack(dirname, threadsafe=True)
+        out = (numpy.empty((5, 3)), numpy.empty(5))
+        result = stack.intersect(origin, direction, 1E+05, step=5,
+                                 workers=2, out=out)
+        self.assertIs(result[1], out[1])
+        self.assertTrue(numpy.array_equal(out[1], ref, equal_nan=True))
+        del stack
+
+        with self.assertRaises(ValueError) as context:
+            turtle.Stack(dirname).intersect(origin, direction, 1E+05,
+                                            workers=2)
+
+
+    def test_visible(self):
+        dirname = fetch_tile()
+        stack = turtle.Stack(dirname)
+
+        # Check the visibility between sources and antennas
+        latitude = numpy.linspace(38.2, 38.8, 4)
+        longitude = numpy.linspace(83.2, 83.8, 4)
+        z = stack.elevation(latitude, longitude)
+        antenna = turtle.ecef_from_geodetic(latitude, longitude, z + 3)
+        source = numpy.array((
+            turtle.ecef_from_geodetic(38.5, 83.5, 2E+04),
+            turtle.ecef_from_geodetic(38.5, 83.5,
+                                      stack.elevation(38.5, 83.5) - 10)))
+        visible = stack.visible(source[:, None], antenna[None])
+        self.assertEqual(visible.shape, (2, 4))
+        self.assertEqual(visible.dtype, bool)
+        self.assertTrue(numpy.all(visible[1] == False))
+
+        # Check against the ray intersections
+        direction = antenna - source[0]
+        length = numpy.linalg.norm(direction, axis=1)
+        _, distance = stack.intersect(numpy.tile(source[0], (4, 1)),
+                                      direction, length)
+        self.assertTrue(numpy.array_equal(visible[0], numpy.isnan(distance)
+                                          | (distance > length - 1E-02)))
+        self.assertEqual(stack.visible(source[0], antenna[0]), visible[0, 0])
+
+        # Distant antennas are hidden by the Earth curvature
+        self.assertFalse(stack.visible(antenna[0], antenna[-1]))
+        near = turtle.ecef_from_geodetic(38.21, 83.21,
+                                         stack.elevation(38.21, 83.21) + 3)
+        self.assertTrue(stack.visible(antenna[0], near))
+
+        # Check the symmetry for end points on the ground
+        z = stack.elevation(38.3, 83.3)
+        ground = turtle.ecef_from_geodetic(38.3, 83.3, z)
+        up = turtle.ecef_from_geodetic(38.3, 83.3, z + 1E+04)
+        for ufunc in (turtle._ufunc, None):
+            with unittest.mock.patch.object(turtle, "_ufunc", ufunc):
+                self.assertTrue(stack.visible(ground, up))
+                self.assertTrue(stack.visible(up, ground))
+
+        # Check memory mapped and threadsafe stacks
+        other = turtle.Stack(dirname, mmap=True).visible(source[:, None],
+            antenna[None], workers=2)
+        self.assertTrue(numpy.array_equal(other, visible))
+        stack = turtle.Stack(dirname, threadsafe=True)
+        out = numpy.empty((2, 4), bool)
+        self.assertIs(stack.visible(source[:, None], antenna[None],
+                                    workers=2, out=out), out)
+        self.assertTrue(numpy.array_equal(out, visible))
+        del stack
+
+
+    def test_regional(self):
+        dirname = fetch_tile()
+        stack = turtle.Stack(dirname)
+        region = turtle.RegionalGrid(stack, (38.2, 38.4), (83.2, 83.5),
+                                     0.01)
+        self.assertEqual(region.data.shape, (21, 31))
+        self.assertEqual(region.latitude, (38.2, 38.4))
+        self.assertEqual(region.longitude, (83.2, 83.5))
+        self.assertIs(region.path, None)
+
+        # Check the interpolation at the nodes, and between them
+        latitude = numpy.linspace(38.2, 38.4, 21)
+        longitude = numpy.full(21, 83.3)
+        self.assertTrue(numpy.allclose(region.elevation(latitude, longitude),
+            stack.elevation(latitude, longitude), atol=1E-02))
+        elevation = region.elevation(38.305, 83.305)
+        self.assertTrue(min(region.data[10:12, 10:12].ravel()) <= elevation
+                        <= max(region.data[10:12, 10:12].ravel()))
+        self.assertTrue(numpy.isnan(region.elevation(38.5, 83.3)))
+
+        path = os.path.join(dirname, "N38E083.SRTMGL1.hgt")
+        other = turtle.RegionalGrid(turtle.Map(path, mmap=True),
+                                    (38.2, 38.4), (83.2, 83.5), 0.01)
+        self.assertTrue(numpy.allclose(other.data, region.data))
+
+        # Check the saving and the memory mapping
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "region.grid")
+            region.save(path)
+            loaded = turtle.RegionalGrid(path)
+            self.assertEqual(loaded.path, path)
+            self.assertIsInstance(loaded.data, numpy.memmap)
+            latitude = numpy.linspace(38.21, 38.39, 10)
+            longitude = numpy.linspace(83.21, 83.49, 10)
+            self.assertTrue(numpy.array_equal(
+                loaded.elevation(latitude, longitude),
+                region.elevation(latitude, longitude)))
+            del loaded
+
+        with self.assertRaises(ValueError) as context:
+            turtle.RegionalGrid(stack, (38.2, 38.4))
+
+
+    def test_stats(self):
+        dirname = fetch_tile()
+        events = []
+        stack = turtle.Stack(dirname, stack_size=1, mmap=True,
+            on_load=lambda index, latency: events.append(("load", index)),
+            on_evict=lambda index: events.append(("evict", index)))
+        stats = stack.stats()
+        self.assertEqual(stats["loads"], 0)
+        self.assertEqual(stats["tiles"], 0)
+
+        stack.elevation(38.5, 83.5)
+        stack.elevation(numpy.full(10, 38.5), 83.5)
+        stack.elevation(45.5, 3.5)
+        stats = stack.stats(histogram=True)
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["loads"], 1)
+        self.assertEqual(stats["evictions"], 0)
+        self.assertEqual(stats["tiles"], 1)
+        self.assertEqual(stats["bytes"], os.path.getsize(
+            os.path.join(dirname, "N38E083.SRTMGL1.hgt")))
+        self.assertGreater(stats["load_time"], 0)
+        counts, edges = stats["latency"]
+        self.assertEqual(counts.size, edges.size + 1)
+        self.assertEqual(counts.sum(), 1)
+        self.assertEqual(events, [("load", (38, 83))])
+
+        # Check the eviction accounting
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "tiles.store")
+            grid_ = grid.Grid(numpy.zeros((3, 3), "<i2"), (3, 4),
+                                     (46, 45))
+            grid.save_store(path, {"N38E083": turtle.Map(
+                os.path.join(dirname, "N38E083.SRTMGL1.hgt"),
+                mmap=True)._grid(), "N45E003": grid_})
+            events.clear()
+            stack = turtle.Stack(path, stack_size=1, on_load=lambda *args:
+                events.append(("load", args[0])),
+                on_evict=lambda index: events.append(("evict", index)))
+            stack.elevation(38.5, 83.5)
+            self.assertEqual(stack.elevation(45.5, 3.5), 0)
+            stats = stack.stats()
+            self.assertEqual(stats["evictions"], 1)
+            self.assertEqual(stats["bytes"], 18)
+            self.assertEqual(events, [("load", (38, 83)), ("load", (45, 3)),
+                                      ("evict", (38, 83))])
+            del stack
+
+        with self.assertRaises(ValueError) as context:
+            turtle.Stack(dirname).stats()
+        with self.assertRaises(ValueError) as context:
+            turtle.Stack(dirname, on_load=lambda index, latency: None)
+        with self.assertRaises(ValueError) as context:
+            turtle.Stack(dirname, on_evict=lambda index: None)
+
+
+    def test_budget(self):
+        dirname = fetch_tile()
+        path = os.path.join(dirname, "N38E083.SRTMGL1.hgt")
+        size = os.path.getsize(path)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = os.path.join(tmpdir, "tiles.store")
+            small = grid.Grid(numpy.zeros((3, 3), "<i2"), (3, 4), (46, 45))
+            grid.save_store(store, {"N38E083": grid.load(path),
+                                    "N45E003": small})
+
+            # Check that the memory budget is enforced through eviction
+            stack = turtle.Stack(store, max_bytes=size)
+            self.assertEqual(stack.max_bytes, size)
+            stack.elevation(38.5, 83.5)
+            stack.elevation(45.5, 3.5)
+            stats = stack.stats()
+            self.assertEqual(stats["evictions"], 1)
+            self.assertEqual(stats["tiles"], 1)
+            self.assertEqual(stats["bytes"], 18)
+
+            # Check that pinned tiles are kept
+            stack.pin((38.2, 38.8), (83.2, 83.8))
+            self.assertEqual(stack.stats()["pinned"], 1)
+            stack.elevation(45.5, 3.5)
+            stack.elevation(38.5, 83.5)
+            stats = stack.stats()
+            self.assertEqual(stats["tiles"], 2)
+            self.assertEqual(stats["bytes"], size + 18)
+
+            stack.unpin((38, 39), (83, 84))
+            stats = stack.stats()
+            self.assertEqual(stats["pinned"], 0)
+            self.assertEqual(stats["tiles"], 1)
+            del stack
+
+            # Check that a batch over the budget loads each tile once
+            store = os.path.join(tmpdir, "batch.store")
+            grid.save_store(store, {f"N45E{i:03d}": grid.Grid(
+                numpy.zeros((3, 3), "<i2"), (i, i + 1), (46, 45))
+                for i in range(8)})
+            stack = turtle.Stack(store, max_bytes=3 * 18)
+            longitude = numpy.random.permutation(
+                numpy.repeat(numpy.arange(8) + 0.5, 10))
+            stack.elevation(numpy.full(longitude.size, 45.5), longitude)
+            stats = stack.stats()
+            self.assertEqual(stats["loads"], 8)
+            self.assertEqual(stats["evictions"], 5)
+            del stack
+
+        with self.assertRaises(ValueError) as context:
+            turtle.Stack(dirname, max_bytes=size)
+        with self.assertRaises(ValueError) as context:
+            turtle.Stack(dirname).pin((38, 39), (83, 84))
+
+
+    def test_store(self):
+        # Check the conversion of a tiles directory
+        dirname = fetch_tile()
+        latitude = numpy.linspace(38.01, 38.99, 100)
+        longitude = numpy.linspace(83.01, 83.99, 100)
+        ref = turtle.Stack(dirname, mmap=True).elevation(latitude, longitude)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "tiles.store")
+            turtle.convert(dirname, path)
+            stack = turtle.Stack(path)
+            self.assertTrue(stack.mmap)
+            self.assertTrue(numpy.array_equal(
+                stack.elevation(latitude, longitude), ref))
+            self.assertTrue(numpy.isnan(stack.elevation(45.5, 3.5)))
+
+            map_ = turtle.Map(path)
+            self.assertTrue(map_.mmap)
+            self.assertTrue(numpy.array_equal(
+                map_.elevation(longitude, latitude), ref))
+            del stack, map_
+
+            # Check the command line interface, with a projected map
+            source = os.path.join(os.path.dirname(__file__), "map.png")
+            turtle.main(["convert", source, path])
+            map_ = turtle.Map(path, name="map")
+            x = numpy.linspace(495000, 497000, 11)
+            y = numpy.linspace(5066000, 5068000, 11)
+            self.assertTrue(numpy.allclose(map_.elevation(x, y),
+                turtle.Map(source).elevation(x, y), atol=1E-01))
+            with self.assertRaises(KeyError) as context:
+                turtle.Map(path, name="N38E083")
+            del map_
+
+
+    def test_projection(self):
+        path = os.path.join(os.path.dirname(__file__), "map.png")
+        map_ = turtle.Map(path)
+        self.assertEqual(map_.projection, "UTM 31N")
+
+        # Check the projection roundtrip
+        x = numpy.linspace(495100, 496900, 10)
+        y = numpy.linspace(5066100, 5067900, 10)
+        latitude, longitude = map_.to_geodetic(x, y)
+        self.assertTrue(numpy.all(numpy.abs(latitude - 45.6) < 0.1))
+        self.assertTrue(numpy.all(numpy.abs(longitude - 2.9) < 0.1))
+        xp, yp = map_.from_geodetic(latitude, longitude)
+        self.assertTrue(numpy.allclose(xp, x))
+        self.assertTrue(numpy.allclose(yp, y))
+        self.assertEqual(map_.from_geodetic(float(latitude[0]),
+            float(longitude[0])), (xp[0], yp[0]))
+
+        buf = (numpy.empty(10), numpy.empty(10))
+        result = map_.from_geodetic(latitude, longitude, out=buf)
+        self.assertIs(result[0], buf[0])
+        self.assertTrue(numpy.array_equal(buf[1], yp))
+
+        # Check the fused elevation getter
+        ref = map_.elevation(xp, yp)
+        elevation = map_.elevation_geodetic(latitude, longitude)
+        self.assertTrue(numpy.allclose(elevation, ref))
+        self.assertEqual(map_.elevation_geodetic(float(latitude[0]),
+            float(longitude[0])), elevation[0])
+        self.assertTrue(numpy.isnan(map_.elevation_geodetic(45., 3.)))
+
+        # Check that the projection is kept by raw grids
+        with tempfile.TemporaryDirectory() as tmpdir:
+            grid_path = os.path.join(tmpdir, "map.grid")
+            map_.save(grid_path)
+            grid_map = turtle.Map(grid_path)
+            self.assertEqual(grid_map.projection, "UTM 31N")
+            self.assertTrue(numpy.allclose(grid_map.elevation_geodetic(
+                latitude, longitude), ref))
+            del grid_map
+
+        # Check a map with geodetic coordinates
+        path = os.path.join(fetch_tile(), "N38E083.SRTMGL1.hgt")
+        map_ = turtle.Map(path, mmap=True)
+        self.assertIs(map_.projection, None)
+        latitude = numpy.linspace(38.1, 38.9, 10)
+        longitude = numpy.linspace(83.1, 83.9, 10)
+        x, y = map_.from_geodetic(latitude, longitude)
+        self.assertTrue(numpy.array_equal(x, longitude))
+        self.assertTrue(numpy.array_equal(y, latitude))
+        self.assertEqual(map_.to_geodetic(83.5, 38.5), (38.5, 83.5))
+        self.assertTrue(numpy.array_equal(map_.elevation_geodetic(latitude,
+            longitude), map_.elevation(longitude, latitude)))
+
+
     def test_map(self):
         # Check the map loading
         path = os.path.join(os.path.dirname(__file__), "map.png")
@@ -150,6 +878,11 @@ class TurtleTest(unittest.TestCase):
         for i in range(n):
             self.assertTrue(1000)
 
+        # Check the elevation getter with an output buffer
+        buf = numpy.empty(n)
+        elevation = map_.elevation(n * (0,), n * (0,), out=buf)
+        self.assertIs(elevation, buf)
+
         # Check the manual deletion
         del map_
 
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the grand_libs.ufunc module
+"""
+
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+import numpy
+
+from grand_libs import gull, turtle, ufunc
+from grand_libs.tools import Meta
+
+
+class UfuncTest(unittest.TestCase):
+    """Unit tests for the ufunc sub-package"""
+
+    def test_install(self):
+        ufunc.install()
+        self.assertTrue(ufunc.LIBNAME.startswith("_ufunc"))
+        self.assertTrue(os.path.exists(ufunc.LIBPATH))
+        self.assertNotEqual(Meta("ufunc")["SRCHASH"], None)
+
+
+    def test_build(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # Check a build path with spaces
+            libdir = os.path.join(tmpdir, "lib dir")
+            os.makedirs(libdir)
+            path = os.path.join(libdir, ufunc.LIBNAME)
+            with unittest.mock.patch.object(ufunc, "LIBPATH", path):
+                ufunc.install()
+                self.assertTrue(os.path.exists(path))
+
+            # Check that compiler errors are reported
+            srcdir = os.path.join(tmpdir, "src dir")
+            os.makedirs(srcdir)
+            with open(os.path.join(srcdir, "ufunc.c"), "w") as f:
+                f.write("#error broken source\n")
+            path = os.path.join(libdir, "broken" + ufunc.LIBNAME)
+            with unittest.mock.patch.object(ufunc, "LIBPATH", path), \
+                 unittest.mock.patch.object(ufunc, "SRCDIR", srcdir):
+                with self.assertRaises(ufunc.BuildError) as context:
+                    ufunc.install()
+                self.assertIn("broken source", context.exception.output)
+
+                with self.assertWarns(RuntimeWarning):
+                    self.assertIsNone(ufunc.load.__wrapped__())
+
+
+    def test_load(self):
+        module = ufunc.load()
+        self.assertNotEqual(module, None)
+        self.assertIs(ufunc.load(), module)
+        self.assertIs(turtle._ufunc.load(), module)
+        self.assertIs(gull._ufunc.load(), module)
+        self.assertIs(turtle._ufunc.ecef_from_geodetic,
+                      module.ecef_from_geodetic)
+
+        self.assertEqual(module.ecef_from_geodetic.signature, "(),(),()->(3)")
+        self.assertEqual(module.ecef_to_geodetic.signature, "(3)->(),(),()")
+        with self.assertRaises(KeyError) as context:
+            module.bind("turtle_unknown", 0)
+
+
+    def test_turtle(self):
+        # Check the ufuncs against the scalar bindings
+        latitude = numpy.linspace(-60, 60, 12).reshape(3, 4)
+        longitude, altitude = 3., numpy.array([0., 1E+03, 2E+03, 3E+03])
+        ecef = turtle.ecef_from_geodetic(latitude, longitude, altitude)
+        self.assertEqual(ecef.shape, (3, 4, 3))
+        for i in range(3):
+            for j in range(4):
+                ref = turtle.ecef_from_geodetic(float(latitude[i, j]),
+                    longitude, float(altitude[j]))
+                self.assertTrue(numpy.array_equal(ecef[i, j], ref))
+
+        geodetic = turtle.ecef_to_geodetic(ecef)
+        for a, ref in zip(geodetic, (latitude, longitude, altitude)):
+            self.assertEqual(a.shape, (3, 4))
+            self.assertTrue(numpy.allclose(a, ref))
+
+        # Check non contiguous inputs and int casting
+        ecef = turtle.ecef_from_geodetic(latitude[:, ::2], 3, 0)
+        ref = turtle.ecef_from_geodetic(latitude[:, ::2].copy(), 3., 0.)
+        self.assertTrue(numpy.array_equal(ecef, ref))
+
+
+    def test_float32(self):
+        module = ufunc.load()
+        self.assertEqual(module.ecef_from_geodetic.types[0], "fff->d")
+        self.assertTrue(module.snapshot_field.types[0].endswith("fff->d"))
+
+        # Check that float32 columns of a table are processed in place
+        table = numpy.empty((100, 4), numpy.float32)
+        table[:, 0] = numpy.linspace(-60, 60, 100)
+        table[:, 1] = numpy.linspace(-180, 180, 100)
+        table[:, 2] = numpy.linspace(0, 1E+03, 100)
+        geodetic = [table[:, i] for i in range(3)]
+        ref = turtle.ecef_from_geodetic(*[a.astype(float) for a in geodetic])
+        ecef = turtle.ecef_from_geodetic(*geodetic)
+        self.assertEqual(ecef.dtype, numpy.float64)
+        self.assertTrue(numpy.array_equal(ecef, ref))
+
+        direction = turtle.ecef_to_horizontal(geodetic[0], geodetic[1],
+            ecef.astype(numpy.float32)[:, ::-1])
+        for a in direction:
+            self.assertEqual(a.dtype, numpy.float64)
+
+        snapshot = gull.Snapshot()
+        field = snapshot(*geodetic)
+        ref = snapshot(*[a.astype(float) for a in geodetic])
+        self.assertTrue(numpy.array_equal(field, ref))
+
+
+    def test_gull(self):
+        snapshot = gull.Snapshot()
+        latitude = numpy.linspace(-60, 60, 12).reshape(3, 4)
+        field = snapshot(latitude, 3.)
+        self.assertEqual(field.shape, (3, 4, 3))
+        for i in range(3):
+            for j in range(4):
+                ref = snapshot(float(latitude[i, j]), 3.)
+                self.assertTrue(numpy.array_equal(field[i, j], ref))
+
+        # Check that library errors are raised
+        altitude = 2 * snapshot.altitude[1]
+        with self.assertRaises(gull.LibraryError) as context:
+            snapshot(latitude, 3., (0, 0, 0, altitude))
+        self.assertEqual(context.exception.code, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()